@@ -0,0 +1,235 @@
+"""
+Exotel HR Chatbot — Answer Cache
+=================================
+Caches answers to first-turn (history-free) questions so repeats — the
+quick-action cards, "what leave types are available", the OB slab table —
+skip the Claude call entirely.
+
+Keys combine the normalized question text, the model, a prompt version
+(hash of the system rules and retrieval settings) and the temperature, so
+editing the rules invalidates every entry without any explicit flush.
+
+Knowledge-base edits are tracked per section instead: each answer is stored
+with the versions of the KB sections it was drawn from ("Leave Policy ›
+Sick Leave@3f2a..."), and is only served while all of them are current.
+Editing the Leave policy leaves cached Travel answers alone (kb_reload.py).
+
+Two tiers:
+  - an in-process LRU with TTL, bounded by entry count
+  - an optional SQLite file shared by every worker on the host
+"""
+
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+GREETING_RE = re.compile(r"^(?:hi|hello|hey|dear hr|hi there)\b[\s,!.]*")
+FILLER_RE = re.compile(r"\b(?:please|pls|kindly)\b")
+DIGIT_COMMA_RE = re.compile(r"(?<=\d),(?=\d)")
+PUNCT_RE = re.compile(r"[^\w\s%.&/]")
+SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Fold case, punctuation, greetings and spacing so near-repeats share a key.
+
+    "Hi, what leave types are available??" and "what leave types are
+    available" normalize to the same text; numbers keep their value
+    ("10,000" → "10000", "₹" → "rs").
+    """
+    q = unicodedata.normalize("NFKC", question).lower().replace("₹", " rs ")
+    q = DIGIT_COMMA_RE.sub("", q)
+    q = GREETING_RE.sub("", q.strip())
+    q = FILLER_RE.sub(" ", q)
+    q = PUNCT_RE.sub(" ", q)
+    q = SPACE_RE.sub(" ", q).strip(" .")
+    return q
+
+
+def prompt_version(*parts):
+    """Short hash identifying a prompt build (rules, KB, retrieval settings)."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+def make_key(question, model, version, temperature):
+    raw = "\n".join([normalize_question(question), model, version, repr(float(temperature))])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """Bounded LRU + TTL answer cache with an optional shared SQLite tier."""
+
+    def __init__(self, max_entries=512, ttl_seconds=24 * 3600, db_path=None, max_db_entries=5000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.max_db_entries = max_db_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidated = 0
+        self._entries = OrderedDict()  # key -> (expires_at, answer, tags)
+        self._lock = threading.Lock()
+        if db_path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    " key TEXT PRIMARY KEY, answer TEXT NOT NULL,"
+                    " expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+                conn.execute("CREATE TABLE IF NOT EXISTS answer_tags (key TEXT NOT NULL, tag TEXT NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS answer_tags_key ON answer_tags (key)")
+                conn.execute("CREATE INDEX IF NOT EXISTS answer_tags_tag ON answer_tags (tag)")
+
+    def _connect(self):
+        # One short-lived connection per operation: safe across Streamlit's
+        # session threads and across worker processes sharing the file.
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def get(self, key, current_tags=None, count_miss=True):
+        """Return the cached answer for key, or None (counted as a miss).
+
+        With current_tags (the set of current KB section versions), an answer
+        is only returned if every section it was drawn from is still current;
+        otherwise it is dropped. count_miss=False is for a lookup that will be
+        retried under another key, so one question counts one miss.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now and self._current(entry[2], current_tags):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                if entry[0] > now:
+                    self.invalidated += 1  # drawn from a KB section that has since changed
+                del self._entries[key]
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT answer, expires_at FROM answers WHERE key = ? AND expires_at > ?",
+                        (key, now),
+                    ).fetchone()
+                    tags = frozenset(tag for tag, in conn.execute("SELECT tag FROM answer_tags WHERE key = ?", (key,)))
+                    if row and not self._current(tags, current_tags):
+                        # Written by a worker (or an earlier run) with an older KB
+                        self._delete_keys(conn, [key])
+                        with self._lock:
+                            self.invalidated += 1
+                        row = None
+                    if row:
+                        conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            except sqlite3.Error:
+                row = None
+            if row:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._store(key, row[0], row[1], tags)
+                return row[0]
+
+        if count_miss:
+            with self._lock:
+                self.misses += 1
+        return None
+
+    def put(self, key, answer, tags=()):
+        """Cache answer under key; tags are the KB section versions it was drawn from."""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        tags = frozenset(tags)
+        with self._lock:
+            self._store(key, answer, expires_at, tags)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO answers (key, answer, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                        (key, answer, expires_at, now),
+                    )
+                    conn.execute("DELETE FROM answer_tags WHERE key = ?", (key,))
+                    conn.executemany("INSERT INTO answer_tags (key, tag) VALUES (?, ?)", [(key, t) for t in tags])
+                    conn.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+                    conn.execute(
+                        "DELETE FROM answers WHERE key IN (SELECT key FROM answers"
+                        " ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                        (self.max_db_entries,),
+                    )
+                    conn.execute("DELETE FROM answer_tags WHERE key NOT IN (SELECT key FROM answers)")
+            except sqlite3.Error:
+                pass  # the shared tier is best-effort; memory still has it
+
+    def invalidate(self, stale_tags):
+        """Drop every answer drawn from any of stale_tags; returns how many were dropped."""
+        stale_tags = set(stale_tags)
+        if not stale_tags:
+            return 0
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry[2] & stale_tags]
+            for key in keys:
+                del self._entries[key]
+        dropped = set(keys)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    placeholders = ",".join("?" * len(stale_tags))
+                    disk_keys = [key for key, in conn.execute(
+                        f"SELECT DISTINCT key FROM answer_tags WHERE tag IN ({placeholders})", list(stale_tags))]
+                    self._delete_keys(conn, disk_keys)
+                    dropped.update(disk_keys)
+            except sqlite3.Error:
+                pass  # stale disk entries are still rejected by get(current_tags)
+        with self._lock:
+            self.invalidated += len(dropped)
+        return len(dropped)
+
+    @staticmethod
+    def _current(tags, current_tags):
+        return current_tags is None or (bool(tags) and tags <= current_tags)
+
+    @staticmethod
+    def _delete_keys(conn, keys):
+        conn.executemany("DELETE FROM answers WHERE key = ?", [(k,) for k in keys])
+        conn.executemany("DELETE FROM answer_tags WHERE key = ?", [(k,) for k in keys])
+
+    def _store(self, key, answer, expires_at, tags=frozenset()):
+        self._entries[key] = (expires_at, answer, tags)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM answers")
+                conn.execute("DELETE FROM answer_tags")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidated": self.invalidated,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -9,8 +9,27 @@ Set ANTHROPIC_API_KEY in Streamlit Secrets.
 """
 
 import os
+import time
+import uuid
+import itertools
+
 import streamlit as st
 from anthropic import Anthropic
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+
+import answer_cache
+import coalesce
+import history
+import kb_reload
+import ledger
+import prompts
+import resilience
+import scheduler
+import tiers
+from calculator import answer as calculate_locally
+from retrieval import KB_PATH
+from router import ROUTE_MODEL
+from telemetry import CACHE_TELEMETRY
 
 # ---------------------------------------------------------------------------
 # Page config
@@ -23,259 +42,15 @@ st.set_page_config(
 )
 
 # ---------------------------------------------------------------------------
-# Premium CSS — clean, minimal, enterprise-grade
+# Premium CSS — clean, minimal, enterprise-grade (static/style.css, read once
+# per process and re-sent on each rerun)
 # ---------------------------------------------------------------------------
-st.markdown("""
-<style>
-    /* ── Fonts & Reset ───────────────────────── */
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&display=swap');
-
-    .stApp {
-        font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', sans-serif;
-        background: #F8F9FC;
-    }
-
-    /* ── Hide Streamlit chrome ───────────────── */
-    header[data-testid="stHeader"] { display: none !important; }
-    #MainMenu { visibility: hidden; }
-    footer { visibility: hidden; }
-    .block-container { padding-top: 0 !important; max-width: 900px; }
-    div[data-testid="stToolbar"] { display: none !important; }
-    div[data-testid="stDecoration"] { display: none !important; }
-
-    /* ── Top Header Bar ──────────────────────── */
-    .top-bar {
-        background: #FFFFFF;
-        border-bottom: 1px solid #E8EAF0;
-        padding: 16px 32px;
-        margin: -1rem -1rem 0 -1rem;
-        display: flex;
-        align-items: center;
-        justify-content: space-between;
-    }
-    .top-bar-left {
-        display: flex;
-        align-items: center;
-        gap: 14px;
-    }
-    .top-bar-logo {
-        width: 42px; height: 42px;
-        background: linear-gradient(135deg, #5B4FD6, #7C6FE8);
-        border-radius: 12px;
-        display: flex; align-items: center; justify-content: center;
-        color: white; font-size: 20px;
-        box-shadow: 0 2px 8px rgba(91,79,214,0.2);
-    }
-    .top-bar-text h1 {
-        font-size: 18px; font-weight: 700; color: #1A1D2B;
-        margin: 0; letter-spacing: -0.3px;
-    }
-    .top-bar-text p {
-        font-size: 12px; color: #8B8FA3; margin: 2px 0 0;
-        font-weight: 400;
-    }
-    .top-bar-badge {
-        background: #ECFDF5; color: #059669;
-        font-size: 11px; font-weight: 600;
-        padding: 4px 12px; border-radius: 20px;
-        letter-spacing: 0.3px;
-    }
-
-    /* ── Hero Section ────────────────────────── */
-    .hero {
-        text-align: center;
-        padding: 48px 24px 32px;
-    }
-    .hero-icon {
-        width: 80px; height: 80px;
-        background: linear-gradient(135deg, #EDE9FE, #C4B5FD);
-        border-radius: 24px;
-        display: flex; align-items: center; justify-content: center;
-        font-size: 40px;
-        margin: 0 auto 20px;
-        box-shadow: 0 4px 20px rgba(91,79,214,0.15);
-    }
-    .hero h2 {
-        font-size: 26px; font-weight: 800; color: #1A1D2B;
-        margin-bottom: 8px; letter-spacing: -0.5px;
-    }
-    .hero p {
-        font-size: 15px; color: #6B7084;
-        max-width: 500px; margin: 0 auto 8px;
-        line-height: 1.6;
-    }
-    .hero-sub {
-        font-size: 12px; color: #A0A3B5;
-        margin-top: 4px;
-    }
-
-    /* ── Category Cards ──────────────────────── */
-    .cat-section {
-        margin: 8px 0 32px;
-    }
-    .cat-section-title {
-        font-size: 11px; font-weight: 700; text-transform: uppercase;
-        letter-spacing: 1.2px; color: #8B8FA3;
-        margin-bottom: 14px; padding-left: 4px;
-    }
-    .cat-grid {
-        display: grid;
-        grid-template-columns: repeat(3, 1fr);
-        gap: 12px;
-    }
-    .cat-card {
-        background: #FFFFFF;
-        border: 1px solid #E8EAF0;
-        border-radius: 14px;
-        padding: 18px 16px;
-        cursor: pointer;
-        transition: all 0.25s ease;
-        text-align: center;
-    }
-    .cat-card:hover {
-        border-color: #5B4FD6;
-        box-shadow: 0 4px 16px rgba(91,79,214,0.12);
-        transform: translateY(-2px);
-    }
-    .cat-card .cat-icon {
-        font-size: 28px;
-        display: block;
-        margin-bottom: 10px;
-    }
-    .cat-card .cat-label {
-        font-size: 13px; font-weight: 600; color: #1A1D2B;
-        margin-bottom: 3px;
-    }
-    .cat-card .cat-desc {
-        font-size: 11px; color: #8B8FA3;
-        line-height: 1.4;
-    }
-
-    /* ── Stats Bar ───────────────────────────── */
-    .stats-bar {
-        display: flex;
-        justify-content: center;
-        gap: 32px;
-        padding: 16px 0 8px;
-        margin-bottom: 24px;
-    }
-    .stat-item {
-        text-align: center;
-    }
-    .stat-num {
-        font-size: 22px; font-weight: 800; color: #5B4FD6;
-    }
-    .stat-label {
-        font-size: 11px; color: #8B8FA3; font-weight: 500;
-        margin-top: 2px;
-    }
-
-    /* ── Chat Messages ───────────────────────── */
-    div[data-testid="stChatMessage"] {
-        font-family: 'Inter', sans-serif;
-        font-size: 14px;
-        line-height: 1.75;
-        border-radius: 14px;
-        border: 1px solid #E8EAF0;
-        margin-bottom: 4px;
-    }
-
-    /* ── Markdown Tables ─────────────────────── */
-    div[data-testid="stChatMessage"] table {
-        border-collapse: collapse;
-        margin: 12px 0;
-        font-size: 13px;
-        width: 100%;
-        border-radius: 10px;
-        overflow: hidden;
-        box-shadow: 0 1px 4px rgba(0,0,0,0.04);
-    }
-    div[data-testid="stChatMessage"] th,
-    div[data-testid="stChatMessage"] td {
-        border: 1px solid #E8EAF0;
-        padding: 10px 14px;
-        text-align: left;
-    }
-    div[data-testid="stChatMessage"] th {
-        background: linear-gradient(135deg, #EDE9FE, #E8E5FF);
-        font-weight: 600;
-        color: #5B4FD6;
-        font-size: 12px;
-        text-transform: uppercase;
-        letter-spacing: 0.3px;
-    }
-    div[data-testid="stChatMessage"] tr:nth-child(even) { background: #FAFAFF; }
-    div[data-testid="stChatMessage"] tr:hover { background: #F0EEFF; }
-
-    /* ── Chat Input Styling ──────────────────── */
-    div[data-testid="stChatInput"] {
-        border-top: 1px solid #E8EAF0;
-        padding-top: 8px;
-    }
-    div[data-testid="stChatInput"] textarea {
-        font-family: 'Inter', sans-serif !important;
-        font-size: 14px !important;
-        border-radius: 14px !important;
-        border: 2px solid #E8EAF0 !important;
-        background: #FFFFFF !important;
-    }
-    div[data-testid="stChatInput"] textarea:focus {
-        border-color: #5B4FD6 !important;
-        box-shadow: 0 0 0 3px rgba(91,79,214,0.1) !important;
-    }
-
-    /* ── Streamlit Buttons ───────────────────── */
-    .stButton > button {
-        font-family: 'Inter', sans-serif;
-        font-weight: 600;
-        border-radius: 12px;
-        padding: 10px 16px;
-        font-size: 13px;
-        border: 1.5px solid #E8EAF0;
-        background: #FFFFFF;
-        color: #1A1D2B;
-        transition: all 0.2s ease;
-    }
-    .stButton > button:hover {
-        border-color: #5B4FD6;
-        color: #5B4FD6;
-        background: #F5F3FF;
-        transform: translateY(-1px);
-        box-shadow: 0 2px 8px rgba(91,79,214,0.1);
-    }
-
-    /* ── Sidebar Styling ─────────────────────── */
-    section[data-testid="stSidebar"] {
-        background: #FFFFFF;
-        border-right: 1px solid #E8EAF0;
-    }
-    section[data-testid="stSidebar"] .stButton > button {
-        background: #5B4FD6;
-        color: white;
-        border: none;
-    }
-    section[data-testid="stSidebar"] .stButton > button:hover {
-        background: #4A3FC5;
-        color: white;
-    }
-
-    /* ── Divider ─────────────────────────────── */
-    .clean-divider {
-        height: 1px;
-        background: #E8EAF0;
-        margin: 24px 0;
-        border: none;
-    }
-
-    /* ── Responsive ──────────────────────────── */
-    @media (max-width: 640px) {
-        .cat-grid { grid-template-columns: repeat(2, 1fr); }
-        .top-bar { padding: 12px 16px; }
-        .hero { padding: 32px 16px 24px; }
-        .stats-bar { gap: 20px; }
-    }
-</style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def load_css():
+    with open(os.path.join(os.path.dirname(__file__), "static", "style.css"), "r", encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # ---------------------------------------------------------------------------
 # Header Bar
@@ -298,152 +73,310 @@ st.markdown("""
 # ---------------------------------------------------------------------------
 ANTHROPIC_API_KEY = st.secrets.get("ANTHROPIC_API_KEY", os.environ.get("ANTHROPIC_API_KEY", ""))
 MODEL_NAME = os.environ.get("MODEL_NAME", "claude-sonnet-4-5-20250929")
+TEMPERATURE = 0.2
+
+# Tiered models (tiers.py): with SMALL_MODEL set, lookups go to it and
+# calculations / multi-policy questions to MODEL_NAME, per TIER_ROUTES.
+SMALL_MODEL = os.environ.get("SMALL_MODEL", "")
+TIER_ROUTES = os.environ.get("TIER_ROUTES", tiers.DEFAULT_ROUTES)
+MAX_TOKENS = 2048
+
+# "full" sends the whole knowledge base every turn; "retrieval" sends only the
+# RETRIEVAL_TOP_K sections that best match the question (see retrieval.py).
+KB_FILE = os.environ.get("KB_FILE", KB_PATH)
+KB_MODE = os.environ.get("KB_MODE", "full")
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "8"))
+
+# Seconds between checks of the knowledge base file for edits (kb_reload.py);
+# 0 loads it once per process.
+KB_RELOAD_INTERVAL = float(os.environ.get("KB_RELOAD_INTERVAL", "5"))
+
+# First-turn answer cache. ANSWER_CACHE_DB points at a SQLite file to share
+# cached answers between all workers on the host; unset keeps it in memory.
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_DB = os.environ.get("ANSWER_CACHE_DB", "")
+
+# Conversation history budget: the last HISTORY_TURNS turns are sent verbatim,
+# older ones as a running summary (by HISTORY_SUMMARY_MODEL if set, otherwise
+# built locally), all within HISTORY_TOKEN_BUDGET and the model's context.
+HISTORY_TURNS = int(os.environ.get("HISTORY_TURNS", "4"))
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "8000"))
+HISTORY_SUMMARY_MODEL = os.environ.get("HISTORY_SUMMARY_MODEL", "")
+CONTEXT_LIMIT = int(os.environ.get("CONTEXT_LIMIT", "200000"))
+
+# Per-turn latency/token/cost ledger (JSONL, relative to the app directory;
+# empty disables it). ADMIN_PANEL=1 shows the rolling stats in the sidebar.
+LEDGER_PATH = os.environ.get("LEDGER_PATH", "logs/turns.jsonl")
+ADMIN_PANEL = os.environ.get("ADMIN_PANEL", "") not in ("", "0", "false")
+
+# Model call resilience (resilience.py): retries with backoff until
+# CALL_DEADLINE_S, a circuit breaker that fails fast after BREAKER_FAILURES
+# consecutive upstream errors, and (HEDGE_REQUESTS=1) a second request when
+# the first is slower than the recent p95 time to first token.
+CALL_DEADLINE_S = float(os.environ.get("CALL_DEADLINE_S", "60"))
+CALL_MAX_RETRIES = int(os.environ.get("CALL_MAX_RETRIES", "3"))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.environ.get("BREAKER_RESET_S", "30"))
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "") not in ("", "0", "false")
+
+# Admission control (scheduler.py): model calls wait in a fair per-session
+# queue until they fit the org's TPM_LIMIT / RPM_LIMIT (0 = unlimited),
+# shared with every worker and validation run on the host via SCHEDULER_DB;
+# a turn gives up after QUEUE_TIMEOUT_S in line.
+TPM_LIMIT = int(os.environ.get("TPM_LIMIT", "0"))
+RPM_LIMIT = int(os.environ.get("RPM_LIMIT", "0"))
+SCHEDULER_DB = os.environ.get("SCHEDULER_DB", "")
+QUEUE_TIMEOUT_S = float(os.environ.get("QUEUE_TIMEOUT_S", "120"))
 
 if not ANTHROPIC_API_KEY:
     st.error("ANTHROPIC_API_KEY not set. Add it in Streamlit Secrets (Settings → Secrets).")
     st.stop()
 
-client = Anthropic(api_key=ANTHROPIC_API_KEY)
+
+@st.cache_resource
+def get_client():
+    # One client (and connection pool) per process, not per rerun
+    return Anthropic(api_key=ANTHROPIC_API_KEY)
+
+client = get_client()
+
+
+@st.cache_resource
+def get_caller():
+    # One breaker, retry budget and latency window per process
+    return resilience.ResilientCaller(
+        deadline_s=CALL_DEADLINE_S,
+        max_retries=CALL_MAX_RETRIES,
+        hedge=HEDGE_REQUESTS,
+        breaker=resilience.CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_S),
+    )
+
+
+@st.cache_resource
+def get_scheduler():
+    # One queue for every session of this process
+    return scheduler.Scheduler(tpm=TPM_LIMIT, rpm=RPM_LIMIT, db_path=SCHEDULER_DB or None,
+                               timeout_s=QUEUE_TIMEOUT_S)
+
+
+@st.cache_resource
+def get_flights():
+    # Open first-turn answers, shared by every session of this process
+    return coalesce.SingleFlight()
+
+
+@st.cache_resource
+def get_answer_cache():
+    return answer_cache.AnswerCache(
+        max_entries=ANSWER_CACHE_SIZE,
+        ttl_seconds=ANSWER_CACHE_TTL,
+        db_path=ANSWER_CACHE_DB or None,
+    )
+
+
+@st.cache_resource
+def get_ledger():
+    if not LEDGER_PATH:
+        return None
+    return ledger.TurnLedger(os.path.join(os.path.dirname(__file__), LEDGER_PATH))
+
+
+@st.cache_resource
+def get_tiers():
+    return tiers.load_tiers(SMALL_MODEL, MODEL_NAME, TIER_ROUTES)
 
 # ---------------------------------------------------------------------------
 # Load Knowledge Base & build system prompt
 # ---------------------------------------------------------------------------
-@st.cache_data
-def load_knowledge_base():
-    kb_path = os.path.join(os.path.dirname(__file__), "knowledge_base.md")
-    with open(kb_path, "r", encoding="utf-8") as f:
-        return f.read()
-
-kb_content = load_knowledge_base()
-
-SYSTEM_PROMPT = """You are **Exotel's HR Policy Assistant** — a friendly, accurate chatbot that helps Exotel employees understand company HR policies.
-
-## CORE RULES
-1. Answer ONLY using the KNOWLEDGE BASE section below. Never fabricate or assume policy details.
-2. If something is not covered, say: "This isn't covered in our current policies. Please reach out to the HR team at hr@exotel.com for guidance."
-3. Show step-by-step working for ANY calculations (variable pay, EMI, salary advance, etc.).
-4. When multiple policies are relevant, reference ALL of them.
-5. Be friendly, clear, and concise. Avoid legal jargon unless directly quoting policy.
-6. For sensitive topics (POSH, separation, disciplinary), be empathetic and factual.
-7. Never give legal advice — direct employees to HR or Legal for interpretations.
-8. Always answer in the context of Exotel's specific policies.
-9. If the employee hasn't provided enough info (band, level, tenure), ASK before answering.
-
-## HANDLING VAGUE / INCOMPLETE QUESTIONS
-- "leaves" without type → ask: annual, sick, casual, period, bereavement, marriage, sabbatical?
-- Eligibility without band → ask for their level/band (L1-L5, E1, E2, etc.)
-- "need money" → consider: salary advance (2x monthly fixed gross), CPLV (annual only), variable pay
-- "Can I do X on the side?" → route to Conflict of Interest in Code of Conduct
-- Weekend/after-hours colleague incidents → POSH extended workplace definition applies
-- "What happens if I resign/leave..." → Separation policy
-- "Can I claim..." → Travel & Reimbursement policy
-- BGV questions → ask for level (checks vary by level)
-- "sales manager" or any vague sales role → ASK for exact role title before calculating variable pay. Different roles have different OB/GP weightages and slab tables. Roles include: Account Director, Cluster Head Sales, Account Manager, Sales Engineer, Pre-Sales, etc. NEVER assume or guess the role — always confirm first.
-
-## CRITICAL CALCULATION RULES (MUST FOLLOW EXACTLY)
-
-### OB Attainment Slabs — STEPPED, NOT LINEAR
-The OB slabs work as BANDS. You pick the band the employee falls into:
-| Attainment Range | Payout % |
-|---|---|
-| >= 120% | 150% |
-| >= 100% and < 120% | 120% |
-| >= 85% and < 100% | 100% |
-| >= 70% and < 85% | 80% |
-| < 70% (but >= threshold) | 60% |
-| Below minimum threshold | 40% or as specified |
-
-EXAMPLE: 60% OB attainment → falls in "Less Than 70%" band → payout is 60%. NOT 40%.
-EXAMPLE: 85% OB attainment → falls in ">=85% and <100%" band → payout is 100%.
-NEVER interpolate between OB slabs. Pick the matching band.
-
-### GP Growth Slabs — LINEAR INTERPOLATION BETWEEN BENCHMARKS
-GP Growth uses linear interpolation between the defined benchmarks.
-EXAMPLE: If 50% benchmark pays 40% and 75% benchmark pays 80%, then 60% growth = 40% + ((60%-50%)/(75%-50%)) × (80%-40%) = 56%
-
-### GP Growth — IMPORTANT: Use YTD base, NOT sequential quarter
-- GP Growth Attainment = (Current GP - Start of FY Base GP) / (Target GP - Start of FY Base GP)
-- DO NOT use previous quarter's closing GP as the base. Always use the start-of-financial-year GP.
-- EXAMPLE: Base GP (start of FY) = 10, Current GP = 19, Target = 25
-  Attainment = (19-10)/(25-10) = 9/15 = 60% → interpolate in GP slab table → 50% payout
-  NOT (19-15)/(25) or any other formula.
-
-### Quarterly Variable = 80% of Annual Variable ÷ 4
-- 80% of annual variable is paid quarterly. 20% is held for annual true-up.
-- So quarterly variable = Annual Variable × 0.80 ÷ 4
-- EXAMPLE: Annual variable ₹1,20,000 → Quarterly = ₹1,20,000 × 0.80 ÷ 4 = ₹24,000
-  NOT ₹1,20,000 ÷ 4 = ₹30,000. That is WRONG.
-
-### Other Calculation Rules
-- Car lease + Device lease SHARE the 70% supplementary allowance cap
-- Salary advance max = 2 × monthly FIXED gross only (variable component excluded)
-- Leave carry forward max = 30 days; excess lapses in March
-- Notice period shortfall is recovered from F&F settlement
-- Device Lease EMI = 70% of supplementary allowance for the chosen tenure
-
-## COMMON SLANG / INFORMAL TERMS
-- "comp off" = Compensatory Off
-- "WFH" = Work From Home (not covered — say so)
-- "F&F" = Full and Final Settlement
-- "PF" / "EPF" = Provident Fund (not covered — say so)
-- "variable" = Variable Pay / Growth Incentive
-- "notice period" = Separation notice period
-- "POSH" = Prevention of Sexual Harassment
-- "LWP" = Leave Without Pay
-- "CPLV" = Compulsory Paid Leave Vacation
-- "BGV" = Background Verification
-- "OB" = Order Booking
-- "GP" = Gross Profit
-- "CTC" = Cost to Company
-- "EMI" = Equated Monthly Installment
-
-## REFERENCE ANSWERS (Follow these patterns exactly)
-
-Q: "I have exhausted all my leaves, what can I do?"
-A: You have a few options: (1) Apply for Leave Without Pay (LWP) — salary deducted for days taken, (2) Check if you're eligible for a salary advance — up to 2x your monthly fixed gross, (3) If you've been with Exotel 3+ years, you may qualify for sabbatical leave. Which option would you like to explore?
-
-Q: "My supplementary allowance is 10000, what's the max device lease EMI?"
-A: Your maximum device lease EMI would be ₹7,000 (70% of ₹10,000 supplementary allowance). Note: if you also have a car lease, both share this 70% cap.
-
-Q: "Can I take car lease and device lease together?"
-A: Yes, you can avail both simultaneously. However, the combined EMI for both cannot exceed 70% of your supplementary allowance.
-
-Q: "I am at L2, what's applicable for me?"
-A: At L2 band, you're eligible for: all leave types, salary advance, device lease, referral bonus, CPLV, travel reimbursement (per L2 limits), and all standard benefits. Car lease requires L3 and above, so that's not available at L2.
-
-Q: "I have 35 annual leaves, can I use them in April?"
-A: Only 30 days can carry forward to the next financial year. The remaining 5 will lapse in March. I'd recommend using those 5 days before March 31st.
-
-Q: "I'm the Head of HR, can I refer someone and claim referral bonus?"
-A: You can absolutely refer candidates. However, employees in the HR function are not eligible for the referral bonus payout, regardless of level.
-
-Q: "After office hours, improper advances by colleague on weekend vacation — can I report under POSH?"
-A: Yes, absolutely. The POSH policy defines workplace as extending to any place visited arising out of or during employment. The definition covers spaces "physical or otherwise," including off-site locations. File a complaint with the Internal Committee.
-
-Q: "Can home be considered workplace under POSH?"
-A: Yes. The policy defines workplace as "physical or otherwise," covering work-from-home setups.
-
-Q: "I was running a restaurant before joining, anything to keep in mind?"
-A: Yes — under the Conflict of Interest policy, you must disclose any outside business interests at joining. Non-disclosure can be grounds for termination.
-
-Q: "Can I avail CPLV now?"
-A: CPLV is an annual payout — not available on demand. If you need funds urgently, consider a salary advance instead (up to 2x monthly fixed gross).
-
-## TOPICS NOT COVERED IN CURRENT POLICIES
-When asked about these, clearly state they're not in current policies:
-Work from Home (WFH), ESOP/stock options, Provident Fund (PF/EPF), Gratuity details, Promotion criteria, Performance review process, Health insurance specifics, Gym/wellness benefits, Parking policy, Shift allowances, Overtime policy, Transfer policy, Deputation rules
-
----
-
-## KNOWLEDGE BASE
-
-""" + kb_content
+@st.cache_resource
+def get_kb():
+    # Rules + KB compiled once per process (prompt_artifact.py, the same
+    # artifact validate.py and server.py load), with the index, tables,
+    # calculator rules and router; rebuilt incrementally when the file is
+    # edited, dropping the cached answers the edit can change (all of them
+    # in full-KB mode, those drawn from the changed sections in retrieval).
+    return kb_reload.HotKB(KB_FILE, interval=KB_RELOAD_INTERVAL,
+                           on_reload=lambda diff, stale_tags: get_answer_cache().invalidate(stale_tags))
+
+# This run answers from one KB version, even if the file changes mid-turn
+KB = get_kb().current()
+
+# Cached answers are keyed by the rules and retrieval settings, and tagged
+# with the KB version (or, in retrieval mode, sections) they came from
+# (answer_cache.py)
+PROMPT_VERSION = answer_cache.prompt_version(prompts.SYSTEM_RULES, KB_MODE, RETRIEVAL_TOP_K)
+
+# ---------------------------------------------------------------------------
+# Claude call
+# ---------------------------------------------------------------------------
+def history_summarizer():
+    if HISTORY_SUMMARY_MODEL:
+        return history.model_summarizer(client, HISTORY_SUMMARY_MODEL)
+    return history.summarize_locally
+
+
+def apology(error, streamed=False):
+    """What to show for a call that raised error (None: unknown failure)."""
+    if isinstance(error, resilience.CircuitOpen):
+        return "The HR assistant is briefly unavailable because the AI service is having problems. Please try again in a minute."
+    if isinstance(error, (resilience.DeadlineExceeded, scheduler.QueueTimeout)) \
+            or (error is not None and resilience.failure_kind(error) == "rate_limited"):
+        return "The HR assistant is very busy right now and couldn't answer in time. Please try again shortly."
+    detail = f" (Error: {str(error)[:100]})" if error is not None else ""
+    if streamed:
+        return f"\n\n_⚠️ The answer was cut off. Please ask again for the rest.{detail}_"
+    return f"Sorry, something went wrong. Please try again.{detail}"
+
+
+def stream_reply(conversation, status, model=MODEL_NAME, on_queued=None, apologize=True):
+    """Stream the assistant's reply to the conversation so far, chunk by chunk.
+
+    A failure before the first token yields the usual apology; a failure
+    part-way through keeps what was already shown and appends a note. With
+    apologize=False (a coalesced call, whose text other sessions follow) a
+    failure yields nothing more, so followers see it as one (coalesce.py).
+    status["exception"] is the exception itself. status["complete"] is set once the whole answer has streamed, and
+    status["usage"] holds its token counts (cache reads/writes included),
+    status["stop_reason"] why it ended, status["retries"] / status["hedged"]
+    how the call was made (resilience.py), status["queued_s"] how long it
+    waited for admission (scheduler.py) and status["error"] the exception
+    class if the call failed. on_queued(position) is called while the call
+    waits in line.
+    """
+    streamed = False
+    ticket = None
+    try:
+        if KB_MODE == "retrieval":
+            # Query on the last two user turns so short follow-ups
+            # ("what about L4?") still find the right policy.
+            recent = [m["content"] for m in conversation if m["role"] == "user"][-2:]
+            query = KB.router.expand(" ".join(recent))
+            system = KB.prompt.retrieval_blocks(KB.retrieval_context(query, RETRIEVAL_TOP_K))
+        else:
+            # Rules, routing guide and policy corpus as separately cached segments (prompts.py)
+            system = KB.system_blocks
+
+        api_messages = history.build_messages(
+            conversation,
+            prompts.system_text(system),
+            MAX_TOKENS,
+            keep_turns=HISTORY_TURNS,
+            history_budget=HISTORY_TOKEN_BUDGET,
+            context_limit=CONTEXT_LIMIT,
+            summary_cache=st.session_state.history_summary,
+            summarize=history_summarizer(),
+        )
+
+        # Wait for room in the per-minute token budget, in turn with the
+        # other sessions, rather than sending it into a 429
+        ticket = get_scheduler().submit(st.session_state.session_id,
+                                        scheduler.request_tokens(prompts.system_text(system), api_messages))
+        for position in get_scheduler().queue(ticket):
+            if on_queued:
+                on_queued(position)
+        if ticket.waited_s >= 0.05:
+            status["queued_s"] = round(ticket.waited_s, 3)
+
+        # Retried and hedged up to the first token by the shared caller; the
+        # SDK's own retries are off so the two don't stack.
+        opened = get_caller().open(lambda timeout: client.with_options(max_retries=0).messages.stream(
+            model=model,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            system=system,
+            messages=api_messages,
+            timeout=timeout,
+        ))
+        status["retries"], status["hedged"] = opened.retries, opened.hedged
+        try:
+            if opened.first:
+                streamed = True
+                yield opened.first
+            for text in opened.texts:
+                streamed = True
+                yield text
+            message = opened.stream.get_final_message()
+        finally:
+            opened.close()
+        status["usage"] = CACHE_TELEMETRY.record(message.usage)
+        status["stop_reason"] = message.stop_reason
+        status["complete"] = True
+    except Exception as e:
+        status["error"], status["exception"] = type(e).__name__, e
+        if apologize:
+            yield apology(e, streamed)
+    finally:
+        if ticket is not None and ticket.waited_s is not None:
+            # Charge what the call really used (nothing if it failed)
+            get_scheduler().settle(ticket, status.get("usage"))
+
+
+def queue_notice():
+    """(placeholder, on_queued) showing the turn's place in line while it waits."""
+    notice = st.empty()
+
+    def on_queued(position):
+        notice.caption(f"⏳ Many colleagues are asking right now. You're #{position} in line; "
+                       "your answer will start automatically.")
+    return notice, on_queued
+
+
+def cache_answer(prompt, model, text):
+    """Cache a first-turn answer under the model that gave it (MODEL_NAME if
+    the small tier escalated)."""
+    key = answer_cache.make_key(prompt, model, PROMPT_VERSION, TEMPERATURE)
+    get_answer_cache().put(key, text, KB.dependencies(prompt, RETRIEVAL_TOP_K, KB_MODE))
+
+
+def model_reply(prompt, conversation, status, choice, turn, started, on_queued=None, apologize=True):
+    """Stream the answer like stream_reply(), through the model tiers (tiers.py).
+
+    A small-tier answer is buffered and checked before it is yielded, so one
+    that fails the checks is never shown: it is logged as discarded and the
+    question re-asked on MODEL_NAME. status and turn end up describing the
+    call that produced the answer.
+    """
+    if choice["tier"] == "small":
+        draft = {}
+        text = "".join(stream_reply(conversation, draft, choice["model"], on_queued, apologize))
+        escalated = tiers.escalation_reason(prompt, text, draft, KB.figures)
+        if escalated is None:
+            status.update(draft)
+            turn["tier"] = "small"
+            yield text
+            return
+        turn.update(model=MODEL_NAME, tier="large", escalated=escalated)
+        turn_ledger = get_ledger()
+        if turn_ledger:
+            turn_ledger.record(model=choice["model"], source="model", latency_s=time.perf_counter() - started,
+                               usage=draft.get("usage"), error=draft.get("error"),
+                               category=ledger.categorize(prompt), session=st.session_state.session_id,
+                               tier="small", discarded=escalated, retries=draft.get("retries"),
+                               hedged=draft.get("hedged"), queued_s=draft.get("queued_s"))
+    elif choice["tier"]:
+        turn["tier"] = choice["tier"]
+    yield from stream_reply(conversation, status, turn["model"], on_queued, apologize)
+
+
+def text_of(chunks, on_queued=None):
+    """The text of a followed flight; the leader's queue positions go to on_queued."""
+    for item in chunks:
+        if isinstance(item, str):
+            yield item
+        elif on_queued:
+            on_queued(item)
+
 
 # ---------------------------------------------------------------------------
 # Session state
 # ---------------------------------------------------------------------------
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "history_summary" not in st.session_state:
+    st.session_state.history_summary = {}
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:12]
 
 # ---------------------------------------------------------------------------
 # Welcome Screen (shown when no messages)
@@ -459,22 +392,12 @@ if not st.session_state.messages:
     </div>
     """, unsafe_allow_html=True)
 
-    # Quick action buttons
-
-    # Quick action buttons
-    quick_questions = [
-        ("📅", "Leave Policies", "Types, balance & carry-forward", "What leave types are available and how many days for each?"),
-        ("📱", "Device Lease", "EMI limits & eligibility", "How does the device lease work? What are the EMI limits?"),
-        ("✈️", "Travel & Claims", "Reimbursement rules", "What is the travel reimbursement policy for domestic and international?"),
-        ("💰", "Variable Pay", "OB slabs & GP calculation", "How is the quarterly variable pay calculated for sales roles?"),
-        ("🤝", "Referral Bonus", "Amounts by level", "What are the referral bonus amounts by level?"),
-        ("📋", "All Policies", "Complete coverage list", "List all 21 policies covered in the knowledge base"),
-    ]
-
+    # Quick action buttons (shared with loadtest.py)
     cols = st.columns(3)
-    for i, (icon, label, desc, question) in enumerate(quick_questions):
+    for i, (icon, label, desc, question) in enumerate(prompts.QUICK_QUESTIONS):
         with cols[i % 3]:
             if st.button(f"{icon}  {label}", key=f"quick_{i}", use_container_width=True, help=desc):
+                # Answered by the chat handler below on the rerun
                 st.session_state.messages.append({"role": "user", "content": question})
                 st.rerun()
 
@@ -491,39 +414,121 @@ for msg in st.session_state.messages:
 # ---------------------------------------------------------------------------
 # Chat input
 # ---------------------------------------------------------------------------
-if prompt := st.chat_input("Ask about any HR policy..."):
+prompt = st.chat_input("Ask about any HR policy...")
+if prompt:
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user", avatar="👤"):
         st.markdown(prompt)
+elif st.session_state.messages and st.session_state.messages[-1]["role"] == "user":
+    # A quick-action card queued this question; it is already displayed above
+    prompt = st.session_state.messages[-1]["content"]
 
+if prompt:
+    started = time.perf_counter()
+    turn = {"source": "calculator", "model": MODEL_NAME, "ttft_s": None}
     with st.chat_message("assistant", avatar="🤖"):
-        with st.spinner("Looking up policies..."):
+        # Self-contained calculations (variable pay, lease EMI, salary advance)
+        # are answered exactly from the KB slab tables, without a model call.
+        response_text = calculate_locally(prompt, KB.rules)
+
+        # Not-covered topics and first-turn questions missing a detail
+        # (role, leave type, band, ...) are answered by the local router.
+        if response_text is None:
+            routed = KB.router.route(prompt, st.session_state.messages[:-1])
+            if routed["route"] != ROUTE_MODEL:
+                response_text = routed["answer"]
+                turn["source"] = "router"
+
+        # Lookups may go to the small model, calculations to the large one
+        choice = tiers.choose(get_tiers(), prompt)
+        model = choice["model"] or MODEL_NAME
+
+        # History-free questions can be served from the answer cache
+        cache_key = None
+        if response_text is None and len(st.session_state.messages) == 1:
+            cache_key = answer_cache.make_key(prompt, model, PROMPT_VERSION, TEMPERATURE)
+            escalatable = model != MODEL_NAME
+            response_text = get_answer_cache().get(cache_key, KB.tags, count_miss=not escalatable)
+            if response_text is None and escalatable:
+                # An escalated small-tier answer is cached under MODEL_NAME
+                response_text = get_answer_cache().get(
+                    answer_cache.make_key(prompt, MODEL_NAME, PROMPT_VERSION, TEMPERATURE), KB.tags)
+            if response_text is not None:
+                turn["source"] = "cache"
+
+        shown = False
+
+        # An identical first-turn question already being answered for another
+        # session is streamed from that call rather than asked again (coalesce.py)
+        flight, leader = None, False
+        if cache_key and response_text is None:
+            flight, leader = get_flights().join(cache_key + KB.content_hash)
+        if flight and not leader:
+            chunks = text_of(flight.follow(cut_off=apology(None, streamed=True)))
             try:
-                api_messages = []
-                for msg in st.session_state.messages:
-                    role = msg["role"] if msg["role"] == "user" else "assistant"
-                    api_messages.append({"role": role, "content": msg["content"]})
-
-                response = client.messages.create(
-                    model=MODEL_NAME,
-                    max_tokens=2048,
-                    temperature=0.2,
-                    system=[
-                        {
-                            "type": "text",
-                            "text": SYSTEM_PROMPT,
-                            "cache_control": {"type": "ephemeral"},
-                        }
-                    ],
-                    messages=api_messages,
-                )
-                response_text = response.content[0].text
-            except Exception as e:
-                response_text = f"Sorry, something went wrong. Please try again. (Error: {str(e)[:100]})"
-
-        st.markdown(response_text)
+                with st.spinner("Looking up policies..."):
+                    first_chunk = next(chunks, "")
+            except coalesce.LeaderGone:
+                flight = None  # that session's call failed first; make our own
+            else:
+                turn.update(source="coalesced", model=model, ttft_s=time.perf_counter() - started)
+                response_text = st.write_stream(itertools.chain([first_chunk], chunks))
+                shown = True
+
+        try:
+            if response_text is None:
+                # Keep the spinner up only until the first token arrives, then
+                # stream the rest straight into the chat bubble.
+                status = {}
+                turn["model"] = model
+                notice, on_queued = queue_notice()
+                conversation = list(st.session_state.messages)
+                if leader:
+                    # The call belongs to the flight, not to this session: it
+                    # runs on its own thread to the end, caches the answer and
+                    # serves the followers even if this session stops or reruns.
+                    # It yields no apology: a failure before any text must
+                    # reach the followers as LeaderGone, so they call again.
+                    def finish(text):
+                        if status.get("complete"):
+                            cache_answer(prompt, turn["model"], text)
+                        return not status.get("error")
+                    flight.run(model_reply(prompt, conversation, status, choice, turn, started,
+                                           on_queued=flight.add, apologize=False),
+                               finish, prepare=add_script_run_ctx)
+                    chunks = text_of(flight.follow(cut_off=apology(None, streamed=True)), on_queued)
+                else:
+                    chunks = model_reply(prompt, conversation, status, choice, turn, started, on_queued)
+                with st.spinner("Looking up policies..."):
+                    try:
+                        first_chunk = next(chunks, "")
+                    except coalesce.LeaderGone:
+                        first_chunk = apology(status.get("exception") or flight.error)
+                notice.empty()
+                turn.update(source="model", ttft_s=time.perf_counter() - started)
+                response_text = st.write_stream(itertools.chain([first_chunk], chunks))
+                turn.update(usage=status.get("usage"), error=status.get("error"), retries=status.get("retries"),
+                            hedged=status.get("hedged"), queued_s=status.get("queued_s"))
+                shown = True
+                if cache_key and not leader and status.get("complete"):
+                    cache_answer(prompt, turn["model"], response_text)
+        finally:
+            if leader and not flight.running:
+                flight.close(complete=False)
+        if not shown:
+            st.markdown(response_text)
+
         st.session_state.messages.append({"role": "assistant", "content": response_text})
 
+    turn_ledger = get_ledger()
+    if turn_ledger:
+        turn_ledger.record(
+            latency_s=time.perf_counter() - started,
+            category=ledger.categorize(prompt),
+            session=st.session_state.session_id,
+            **turn,
+        )
+
 # ---------------------------------------------------------------------------
 # Sidebar
 # ---------------------------------------------------------------------------
@@ -532,9 +537,71 @@ with st.sidebar:
 
     if st.button("🔄 New Chat", use_container_width=True):
         st.session_state.messages = []
+        st.session_state.history_summary = {}
         st.rerun()
 
     st.markdown("---")
     st.markdown("**Exotel HR Policy Hub**")
     st.caption("21 policies covered")
     st.caption("For internal use only")
+
+    if ADMIN_PANEL:
+        with st.expander("📊 Admin — last 24h"):
+            turn_ledger = get_ledger()
+            stats = ledger.rolling_stats(turn_ledger.read_recent() if turn_ledger else [])
+
+            def secs(value):
+                return f"{value:.2f}s" if value is not None else "—"
+
+            col1, col2 = st.columns(2)
+            col1.metric("Latency p50", secs(stats["latency_p50"]))
+            col2.metric("Latency p95", secs(stats["latency_p95"]))
+            col1.metric("First token p50", secs(stats["ttft_p50"]))
+            col2.metric("First token p95", secs(stats["ttft_p95"]))
+            col1.metric("Prompt cache hit", f"{stats['cache_hit_rate']:.0%}")
+            col2.metric("Est. cost", f"${stats['cost_usd']:.2f}")
+            col1.metric("Answer cache hit", f"{get_answer_cache().stats()['hit_rate']:.0%}")
+            col2.metric("Errors", stats["errors"])
+            st.caption(
+                f"{stats['turns']} turns · {stats['model_calls']} model calls · "
+                f"{stats['cached_answers']} cached · {stats['local_answers']} calculated locally · "
+                f"{stats['routed_answers']} answered by the router · "
+                f"{stats['coalesced_answers']} shared an in-flight call · "
+                f"{stats['retried_turns']} retried, {stats['hedged_turns']} hedged, "
+                f"{stats['queued_turns']} queued"
+            )
+            if stats["tokens_per_hour"]:
+                st.markdown("**Tokens per hour**")
+                per_hour = stats["tokens_per_hour"]
+                st.bar_chart({
+                    "input": {hour: v["input"] for hour, v in per_hour.items()},
+                    "output": {hour: v["output"] for hour, v in per_hour.items()},
+                })
+            telemetry = CACHE_TELEMETRY.snapshot()
+            calls = get_caller().stats()
+            st.caption(
+                f"This worker: {telemetry['calls']} calls, "
+                f"{telemetry['calls_with_cache_read']} with a prompt-cache read, "
+                f"{calls['retried_calls']} retried, {calls['hedged_calls']} hedged "
+                f"({calls['hedge_wins']} won by the hedge), {calls['fast_failures']} failed fast, "
+                f"{get_flights().stats()['followers']} saved by coalescing · "
+                f"circuit {calls['breaker']}"
+            )
+            queue = get_scheduler().stats()
+            st.caption(
+                f"Queue: {queue['waiting']['interactive']} chats and {queue['waiting']['background']} "
+                f"background jobs waiting · {queue['queued']} of {queue['admitted']} calls waited "
+                f"(p95 {secs(queue['wait_p95_s'])}), {queue['timed_out']} gave up"
+                + "".join(f" · {left:,} {name}/min left" for name, left in queue["budget"].items())
+                + (" (host-wide)" if queue["host_wide"] else "")
+            )
+            kb_stats = get_kb().stats()
+            last = kb_stats["last_reload"]
+            st.caption(
+                f"Knowledge base v{kb_stats['kb_version']} ({kb_stats['content_hash'][:8]}), "
+                f"{kb_stats['reloads']} reloads"
+                + (f" · last: {len(last['changed'])} sections changed, "
+                   f"{last['invalidated_answers'] or 0} cached answers dropped, {last['elapsed_ms']:.0f} ms"
+                   if last and "error" not in last else "")
+                + (f" · last reload failed: {last['error']}" if last and "error" in last else "")
+            )
@@ -0,0 +1,476 @@
+"""
+Exotel HR Chatbot — Generated Calculation Cases
+================================================
+Generates calculation test cases with exact expected answers from the rules
+calculator.py reads out of knowledge_base.md, in the same shape as
+validate.py's TEST_CASES. The expected amounts are worked out here, not
+with calculator.py's slab functions, and --check first holds that
+arithmetic to boundary values pinned by hand from the KB, so a slab bug in
+the calculator fails the check instead of being copied into the answers.
+
+  - payout     quarterly variable payout for every Growth Incentive role:
+               OB attainment just below, at and just above every slab
+               boundary (and where the accelerator reaches its cap), GP/NRGP
+               at every benchmark and between benchmarks (also given as
+               start-of-FY base / current / target), collections across
+               each multiplier band
+  - lease      car/device lease EMI limits across supplementary allowance
+               values, alone and net of the other lease's EMI
+  - advance    salary advance limits from monthly or annual fixed pay
+               (also in LPA), with and without a variable component to
+               ignore
+
+Amounts are written in varied forms (₹1,20,000, 120000, INR 1,20,000,
+1.2L, 120k) and expected amounts accept rounding to the rupee; scoring
+compares numbers by value (scoring.py). Boundary cases forbid the amount
+the neighbouring slab would give, and advance cases the amount that wrongly
+includes variable pay.
+
+Every boundary and benchmark is visited in turn, so even a few hundred
+cases cover them all; amounts and the other inputs are drawn from a seeded
+RNG, so a seed always gives the same suite.
+
+Usage:
+    python calc_cases.py --n 2000 --out calc_cases.json   # write a suite
+    python calc_cases.py --n 10000 --check                # calculator.py must pass them all
+
+    python validate.py --api --calc 2000                  # ask the model
+    python validate.py --api --calc 2000 --batch          # ... at batch prices
+"""
+
+import sys
+import json
+import time
+import bisect
+import random
+import argparse
+from decimal import Decimal, ROUND_HALF_UP
+
+from calculator import HUNDRED, ZERO, fmt_inr, fmt_num, fmt_pct, load_rules
+from retrieval import KB_PATH
+
+STEP = Decimal("0.1")  # how far either side of a slab boundary to test
+COLLECTION_POINTS = [Decimal(x) for x in ("85", "89.9", "90", "92.5", "94.9", "95", "100", "100.1", "103", "105",
+                                          "110")]
+KIND_WEIGHTS = (("payout", 6), ("lease", 2), ("advance", 2))
+LPA_UNITS = (" LPA", " lpa", "LPA", " lakhs per annum", " lakh per annum")
+
+# Payout % at the slab boundaries, read off the Accounts Director tables in
+# knowledge_base.md by hand: (attainment, payout %). --check holds the
+# expected-value arithmetic below to them; update them with the KB.
+PINNED_ROLE = ("Accounts Director", "Accounts Director")
+PINNED = {
+    "ob": [("0", "0"), ("39.9", "0"), ("40", "30"), ("69.9", "60"), ("70", "80"), ("79.9", "80"), ("80", "100"),
+           ("90", "100"), ("90.1", "100.12"), ("173.3", "199.96"), ("173.4", "200")],
+    "gp": [("-5", "0"), ("0", "0"), ("65", "60"), ("95", "100"), ("112.5", "120"), ("200", "200"), ("250", "200")],
+    "collection": [("85", "90"), ("89.9", "90"), ("90", "90"), ("94.9", "94.9"), ("95", "100"), ("100", "100"),
+                   ("100.1", "100.1"), ("105", "105"), ("110", "105")],
+}
+
+# How a question names each role; calculator.detect_role() must map the
+# phrase back to the role (checked when generating).
+ROLE_PHRASES = [
+    "Accounts Director",
+    "Cluster Head Sales",
+    "Cluster Head CX",
+    "P&L Head",
+    "Customer Experience Manager",
+    "Solution Architect",
+    "Team Lead (Scaleups) and Cluster Head Sales",
+    "Team Lead (Scaleups) and Cluster Head CX in Mid Market",
+    "Account Director in Mid Market (Scaleups)",
+    "CX Director in Mid Market (Scaleups)",
+    "Account Director in SMB (Scaleups)",
+    "CX Director in SMB (Scaleups)",
+]
+
+
+def money(value, rng):
+    """value written as a person might: ₹1,20,000 / 120000 / INR 1,20,000 / 1.2L / 120k."""
+    forms = [fmt_inr(value), fmt_num(value), "INR " + fmt_inr(value)[1:]]
+    if value % 10000 == 0 and value >= 100000:
+        forms.append(f"{fmt_num(value / 100000)}L")
+    if value % 1000 == 0 and value < 1000000:
+        forms.append(f"{fmt_num(value / 1000)}k")
+    return rng.choice(forms)
+
+
+def rupees(value):
+    """Keyword alternatives for an amount: exact, or rounded to the rupee."""
+    exact = value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    whole = value.quantize(Decimal(1), rounding=ROUND_HALF_UP)
+    return [fmt_inr(exact)] if exact == whole else [fmt_inr(exact), fmt_inr(whole)]
+
+
+def percent(value):
+    """Keyword alternatives for a percentage: to 2 or 1 decimal places."""
+    exact = fmt_pct(value)
+    short = fmt_pct(Decimal(value).quantize(STEP, rounding=ROUND_HALF_UP))
+    return [exact] if exact == short else [exact, short]
+
+
+def role_phrases(rules):
+    """{(policy, role): phrase} for every role the calculator can answer for."""
+    from calculator import detect_role
+
+    phrases = {}
+    for phrase in ROLE_PHRASES:
+        key = detect_role(phrase.lower(), rules["roles"])
+        if key is not None:
+            phrases.setdefault(key, phrase)
+    return phrases
+
+
+# ---------------------------------------------------------------------------
+# Expected values
+# ---------------------------------------------------------------------------
+# Worked out from the parsed tables without calculator.py's ob_payout(),
+# linear_payout() or collection_multiplier(): the rows are turned into
+# explicit bands first, so a boundary the calculator gets wrong shows up.
+def bands(rows):
+    """[(low, low_inclusive, high, high_inclusive, row)] for threshold rows.
+
+    Each row's band starts where the one before it ends: "Less Than 50%"
+    after "Less Than 40%" is [40, 50), "Less Than or Equal 90%" after "Less
+    Than 80%" is [80, 90] and "Greater Than 90%" is (90, no limit).
+    """
+    result = []
+    low, low_inclusive = None, True
+    for row in rows:
+        op, bound = row[0], row[1]
+        if op == "gt":
+            result.append((bound, False, None, False, row))
+        else:
+            result.append((low, low_inclusive, bound, op == "le", row))
+            low, low_inclusive = bound, op == "lt"
+    return result
+
+
+def band_row(rows, value):
+    """The row whose band holds value, or None."""
+    for low, low_inclusive, high, high_inclusive, row in bands(rows):
+        above = low is None or value > low or (low_inclusive and value == low)
+        below = high is None or value < high or (high_inclusive and value == high)
+        if above and below:
+            return row
+    return None
+
+
+def expected_ob(slabs, attainment):
+    """OB payout %: the band's payout, or its accelerator up to the cap."""
+    row = band_row(slabs, attainment)
+    if row is None:
+        return ZERO
+    _, bound, payout, acc = row
+    if acc is None:
+        return payout
+    rate, cap = acc
+    return min(payout + rate * (attainment - bound), cap)
+
+
+def expected_linear(points, attainment):
+    """GP/NRGP payout %: weighted between the benchmarks either side."""
+    benchmarks = [a for a, _ in points]
+    if attainment <= benchmarks[0]:
+        return points[0][1]
+    if attainment >= benchmarks[-1]:
+        return points[-1][1]
+    i = bisect.bisect_left(benchmarks, attainment)
+    (a0, p0), (a1, p1) = points[i - 1], points[i]
+    if attainment == a1:
+        return p1
+    return (p0 * (a1 - attainment) + p1 * (attainment - a0)) / (a1 - a0)
+
+
+def expected_collection(slabs, collection):
+    """Collection multiplier %: the band's fixed %, or the collection % up to its cap."""
+    _, _, payout, cap, _ = band_row(slabs, collection)
+    if payout is not None:
+        return payout
+    return min(collection, cap) if cap is not None else collection
+
+
+def check_pinned(rules):
+    """Mismatches between the expected-value arithmetic and PINNED."""
+    role = rules["roles"].get(PINNED_ROLE)
+    if role is None:
+        return [f"{PINNED_ROLE[1]} tables not found; cannot check the pinned values"]
+    compute = {
+        "ob": lambda x: expected_ob(role["ob_slabs"], x),
+        "gp": lambda x: expected_linear(role["gp_slabs"], x),
+        "collection": lambda x: expected_collection(role["collection_slabs"], x),
+    }
+    mismatches = []
+    for kind, pins in PINNED.items():
+        for attainment, payout in pins:
+            got = compute[kind](Decimal(attainment))
+            if abs(got - Decimal(payout)) > Decimal("0.005"):
+                mismatches.append(f"{kind} at {attainment}%: expected {payout}%, worked out {fmt_pct(got)}")
+    return mismatches
+
+
+# ---------------------------------------------------------------------------
+# Coverage points
+# ---------------------------------------------------------------------------
+def ob_points(slabs):
+    """[(attainment, attainment just across the slab boundary or None)], sorted.
+
+    Each boundary gives the last attainment below it and the first above
+    it ("Less Than 70%": 69.9 and 70; "Less Than or Equal 90%": 90 and
+    90.1); an accelerator row adds the points either side of its cap.
+    """
+    points = {ZERO: None}
+    for op, bound, payout, acc in slabs:
+        first_above = bound if op == "lt" else bound + STEP
+        last_below = first_above - STEP
+        points[last_below] = first_above
+        points[first_above] = last_below
+        if acc:
+            rate, cap = acc
+            at_cap = (bound + (cap - payout) / rate).quantize(STEP)
+            points.setdefault(at_cap - STEP, None)
+            points.setdefault(at_cap + STEP, None)
+    return sorted((att, other) for att, other in points.items() if att >= 0)
+
+
+def linear_points(points, negative=False):
+    """Attainments at, between and above the GP/NRGP benchmarks.
+
+    negative adds one below zero (GP shrank since the start-of-FY base),
+    which questions can only give as base / current / target values.
+    """
+    values = {a for a, _ in points}
+    values |= {(a0 + a1) / 2 for (a0, _), (a1, _) in zip(points, points[1:])}
+    values.add(points[-1][0] + 10)
+    if negative:
+        values.add(Decimal("-5"))
+    return sorted(values)
+
+
+# ---------------------------------------------------------------------------
+# Cases
+# ---------------------------------------------------------------------------
+def payout_case(rules, key, phrase, focus, rng):
+    """focus: ("ob", (attainment, other side)), ("gp"/"nrgp", attainment) or ("collection", value)."""
+    role = rules["roles"][key]
+    annual = Decimal(rng.randrange(10, 401) * 5000)
+    inputs = {}
+    for kind, _, _ in role["weights"]:
+        if kind == "ob":
+            inputs["ob"] = rng.choice(ob_points(role["ob_slabs"]))
+        else:
+            inputs[kind] = rng.choice(linear_points(role["gp_slabs"], negative=kind == "gp"))
+    if role["has_collection"]:
+        inputs["collection"] = rng.choice(COLLECTION_POINTS)
+    if focus[0] in inputs:
+        inputs[focus[0]] = focus[1]
+    ob, ob_other = inputs.pop("ob", (None, None))
+
+    def amount_for(ob_attainment):
+        accrued = ZERO
+        for kind, _, weight in role["weights"]:
+            if kind == "ob":
+                payout = expected_ob(role["ob_slabs"], ob_attainment)
+            else:
+                payout = expected_linear(role["gp_slabs"], inputs[kind])
+            accrued += weight * payout / HUNDRED
+        final = accrued
+        if role["has_collection"]:
+            final = accrued * expected_collection(role["collection_slabs"], inputs["collection"]) / HUNDRED
+        payable = min(final, HUNDRED)
+        return quarterly * payable / HUNDRED, payable
+
+    quarterly = annual * role["quarterly_share"] / HUNDRED / 4
+    amount, payable = amount_for(ob)
+
+    parts = []
+    if ob is not None:
+        parts.append(f"my OB attainment is {fmt_pct(ob)}")
+    if "gp" in inputs:
+        gp = inputs["gp"]
+        if gp < 0 or rng.random() < 0.3:
+            base = Decimal(rng.randrange(10, 200))
+            parts.append(f"start-of-FY base GP {fmt_num(base)}, current GP {fmt_num(base + gp)}, "
+                         f"target GP {fmt_num(base + 100)}")
+        else:
+            parts.append(f"GP attainment {fmt_pct(gp)}")
+    if "nrgp" in inputs:
+        parts.append(f"NRGP attainment {fmt_pct(inputs['nrgp'])}")
+    if "collection" in inputs:
+        parts.append(f"collections {fmt_pct(inputs['collection'])}")
+    inputs_text = ", ".join(parts[:-1]) + (" and " if len(parts) > 1 else "") + parts[-1]
+    question = (f"I am a {phrase} with an annual variable of {money(annual, rng)}. This quarter {inputs_text}. "
+                f"What is my quarterly variable payout?")
+
+    expected_not = []
+    if ob_other is not None and focus[0] == "ob":
+        wrong, _ = amount_for(ob_other)
+        # Not if a correct answer's working would show the same figure
+        if abs(wrong - amount) >= 1 and wrong not in (ZERO, quarterly, annual):
+            expected_not.append(rupees(wrong))
+    return {
+        "kind": "payout",
+        "focus": f"{focus[0]}_boundary" if focus[0] == "ob" else f"{focus[0]}_point",
+        "question": question,
+        "expected_keywords": [rupees(amount), percent(payable)],
+        "expected_not": expected_not,
+        "expected_summary": (f"{fmt_inr(amount)} ({fmt_pct(payable)} of the {fmt_inr(quarterly)} quarterly variable, "
+                             f"{role['role']})"),
+    }
+
+
+def lease_case(rules, rng):
+    cap_pct = rules["lease_cap_pct"]
+    sa = Decimal(rng.randrange(6, 121) * 500)
+    cap = sa * cap_pct / HUNDRED
+    wanted, other = rng.choice([("device", "car"), ("car", "device")])
+    shape = rng.choice(["alone", "net", "net", "combined"])
+    question = f"My supplementary allowance is {money(sa, rng)}"
+    if shape == "net":
+        held = Decimal(rng.randrange(0, int(cap * 12 / 10) // 250 + 1) * 250)  # sometimes above the cap
+        expected = max(cap - held, ZERO)
+        question += f" and my {other} lease EMI is {money(held, rng)}. What is the maximum {wanted} lease EMI I can take?"
+        summary = f"{fmt_inr(expected)} ({fmt_pct(cap_pct)} cap {fmt_inr(cap)} less the {other} EMI {fmt_inr(held)})"
+    elif shape == "combined":
+        expected = cap
+        question += ". What is the maximum combined car and device lease EMI I can take?"
+        summary = f"{fmt_inr(cap)} ({fmt_pct(cap_pct)} of supplementary allowance, shared by both leases)"
+    else:
+        expected = cap
+        question += f". What is the maximum {wanted} lease EMI I can take?"
+        summary = f"{fmt_inr(cap)} ({fmt_pct(cap_pct)} of supplementary allowance)"
+    return {
+        "kind": "lease",
+        "focus": f"lease_{shape}",
+        "question": question,
+        "expected_keywords": [rupees(expected)],
+        "expected_not": [],
+        "expected_summary": summary,
+    }
+
+
+def advance_case(rules, rng):
+    months = rules["advance_months"]
+    draw = rng.random()
+    if draw < 0.4:
+        monthly = Decimal(rng.randrange(15, 400) * 1000)
+        question = f"My monthly fixed gross salary is {money(monthly, rng)}. What is the maximum salary advance I can take?"
+        expected_not = []
+        focus = "advance_monthly"
+    elif draw < 0.6:
+        annual = Decimal(rng.randrange(20, 600) * 10000)
+        monthly = annual / 12
+        unit = rng.choice(LPA_UNITS)
+        question = f"My fixed salary is {fmt_num(annual / 100000)}{unit}, how much salary advance can I get?"
+        expected_not = []
+        focus = "advance_lpa"
+    else:
+        annual = Decimal(rng.randrange(20, 600) * 10000)
+        variable = Decimal(rng.randrange(1, 100) * 10000)
+        monthly = annual / 12
+        question = (f"My fixed CTC is {money(annual, rng)} per annum and variable is {money(variable, rng)}. "
+                    f"What is the max salary advance I can take?")
+        expected_not = [rupees((annual + variable) / 12 * months)]
+        focus = "advance_annual"
+    limit = monthly * months
+    return {
+        "kind": "advance",
+        "focus": focus,
+        "question": question,
+        "expected_keywords": [rupees(limit)],
+        "expected_not": expected_not,
+        "expected_summary": f"{fmt_inr(limit)} ({fmt_num(months)} × monthly fixed gross {fmt_inr(monthly)})",
+    }
+
+
+def generate(rules=None, n=1000, seed=0):
+    """n cases in TEST_CASES form (ids 1..n), plus "kind" and "focus" for reporting."""
+    if rules is None:
+        rules = load_rules()
+    rng = random.Random(seed)
+    phrases = role_phrases(rules)
+    roles = sorted(phrases)
+
+    # Every (role, metric, point) is a focus; visiting them in turn covers
+    # every boundary and benchmark of every role within a few hundred cases.
+    foci = []
+    for key in roles:
+        role = rules["roles"][key]
+        for kind, _, _ in role["weights"]:
+            if kind == "ob":
+                foci += [(key, ("ob", point)) for point in ob_points(role["ob_slabs"])]
+            else:
+                foci += [(key, (kind, point)) for point in linear_points(role["gp_slabs"], negative=kind == "gp")]
+        if role["has_collection"]:
+            foci += [(key, ("collection", point)) for point in COLLECTION_POINTS]
+    rng.shuffle(foci)
+
+    kinds = [kind for kind, weight in KIND_WEIGHTS for _ in range(weight)]
+    cases = []
+    payouts = 0
+    for i in range(n):
+        kind = kinds[i % len(kinds)]
+        if kind == "lease" and rules["lease_cap_pct"] is not None:
+            case = lease_case(rules, rng)
+        elif kind == "advance" and rules["advance_months"] is not None:
+            case = advance_case(rules, rng)
+        else:
+            key, focus = foci[payouts % len(foci)]
+            payouts += 1
+            case = payout_case(rules, key, phrases[key], focus, rng)
+        cases.append({"id": i + 1, **case})
+    return cases
+
+
+# ---------------------------------------------------------------------------
+# Self-check
+# ---------------------------------------------------------------------------
+def check(cases, rules):
+    """Answer every case with calculator.py and score it; returns the failures."""
+    from calculator import answer
+    from scoring import score_answer
+
+    started = time.perf_counter()
+    answers = [(answer(tc["question"], rules) or "").lower() for tc in cases]
+    answered = time.perf_counter() - started
+
+    started = time.perf_counter()
+    graded = [(tc, score_answer(tc, text)) for tc, text in zip(cases, answers)]
+    scored = time.perf_counter() - started
+    failures = [(tc, result) for tc, result in graded if result[0] != "PASS"]
+    print(f"{len(cases)} cases: calculator answered in {answered:.2f}s, scored in {scored:.3f}s, "
+          f"{len(cases) - len(failures)} pass")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate calculation test cases from the policy rules")
+    parser.add_argument("--n", type=int, default=1000, help="Number of cases (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed; the same seed gives the same suite (default: 0)")
+    parser.add_argument("--kb", default=KB_PATH, help="Knowledge base to read the rules from")
+    parser.add_argument("--out", help="Write the cases to this JSON file")
+    parser.add_argument("--check", action="store_true",
+                        help="Answer every case with calculator.py and exit 1 unless all pass")
+    args = parser.parse_args()
+
+    rules = load_rules(args.kb)
+    cases = generate(rules, args.n, args.seed)
+    counts = {}
+    for tc in cases:
+        counts[tc["focus"]] = counts.get(tc["focus"], 0) + 1
+    print(f"Generated {len(cases)} cases: " + ", ".join(f"{name} {n}" for name, n in sorted(counts.items())))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(cases, f, indent=2, ensure_ascii=False)
+        print(f"Saved to: {args.out}")
+    if args.check:
+        mismatches = check_pinned(rules)
+        for line in mismatches:
+            print(f"  PINNED {line}")
+        if mismatches:
+            sys.exit(1)
+        failures = check(cases, rules)
+        for tc, (status, reason, _, _) in failures[:20]:
+            print(f"  [{tc['id']}] {status} {reason}\n      {tc['question']}\n      expected {tc['expected_summary']}")
+        sys.exit(1 if failures else 0)
@@ -0,0 +1,589 @@
+"""
+Exotel HR Chatbot — Local Calculation Engine
+=============================================
+Answers self-contained calculation questions exactly, with step-by-step
+working and no LLM call:
+
+  - Growth Incentive quarterly payout (OB stepped slabs, GP/NRGP linear
+    interpolation on a start-of-FY base, collection multiplier)
+  - Quarterly variable split (annual variable × quarterly share ÷ 4)
+  - Car / device lease EMI under the shared supplementary-allowance cap
+  - Salary advance limit (2 × monthly fixed gross)
+
+All slab tables (OB, GP/NRGP and the collection multiplier), weightages and
+limits are read from knowledge_base.md, so a policy edit changes the answers
+without touching this file. When a question
+is missing any input (role, base GP, collections, ...) answer() returns None
+and the question goes to the model as before.
+
+Usage:
+    python calculator.py "My supplementary allowance is 10000, max device lease EMI?"
+"""
+
+import re
+import sys
+from decimal import Decimal, ROUND_HALF_UP
+
+from retrieval import KB_PATH, kb_hash, split_sections
+
+ZERO = Decimal(0)
+HUNDRED = Decimal(100)
+
+
+# ---------------------------------------------------------------------------
+# Number parsing & formatting
+# ---------------------------------------------------------------------------
+AMOUNT_RE = r"(?:₹|rs\.?|inr)?\s*(\d[\d,]*(?:\.\d+)?)(?:\s*(k|lpa|l|lakhs?|lacs?|cr|crores?)\b)?(?:\s*(?:rs|inr|rupees)\b\.?)?"
+PCT_RE = r"(\d+(?:\.\d+)?)\s*%"
+
+UNIT_MULTIPLIERS = {
+    "k": 1000, "l": 100000, "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000, "lpa": 100000,
+    "cr": 10000000, "crore": 10000000, "crores": 10000000,
+}
+
+
+def parse_amount(number, unit=None):
+    """'1.2' + 'l' → 120000; '1,20,000' → 120000."""
+    value = Decimal(number.replace(",", ""))
+    if unit:
+        value *= UNIT_MULTIPLIERS[unit.lower()]
+    return value
+
+
+def fmt_num(value, places=2):
+    """Round to places and drop trailing zeros: 55.50 → '55.5', 60.00 → '60'."""
+    q = Decimal(value).quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+    text = f"{q:f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return text
+
+
+def fmt_pct(value):
+    return f"{fmt_num(value)}%"
+
+
+def fmt_inr(value):
+    """Indian digit grouping: 120000 → '₹1,20,000'; paise kept only if non-zero."""
+    q = Decimal(value).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    sign = "-" if q < 0 else ""
+    whole, _, paise = f"{abs(q):f}".partition(".")
+    if len(whole) > 3:
+        head, tail = whole[:-3], whole[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        if head:
+            groups.insert(0, head)
+        whole = ",".join(groups + [tail])
+    text = f"₹{sign}{whole}"
+    if paise and paise != "00":
+        text += f".{paise}"
+    return text
+
+
+# ---------------------------------------------------------------------------
+# Rules extracted from the knowledge base
+# ---------------------------------------------------------------------------
+def iter_tables(text):
+    """Yield (header, rows) for each markdown table in text, cells stripped."""
+    block = []
+    for line in text.splitlines() + [""]:
+        if line.lstrip().startswith("|"):
+            block.append([c.strip() for c in line.strip().strip("|").split("|")])
+            continue
+        if len(block) >= 2:
+            yield block[0], [r for r in block[2:] if r and not set("".join(r)) <= set("-: ")]
+        block = []
+
+
+def parse_ob_slabs(rows):
+    """Stepped OB slabs: [(op, bound, payout, accelerator)], in table order.
+
+    op is "lt", "le" or "gt". accelerator is (rate, cap) for the
+    "100% + 120% of Incremental above 90% - max cap at 200%" row.
+    """
+    slabs = []
+    for label, payout in (r[:2] for r in rows):
+        m = re.match(r"(less than or equal|less than|greater than|more than)\s*(?:to\s*)?(\d+(?:\.\d+)?)%", label, re.I)
+        if not m:
+            continue
+        op = {"less than or equal": "le", "less than": "lt"}.get(m.group(1).lower(), "gt")
+        bound = Decimal(m.group(2))
+        acc = re.match(r"(\d+)%\s*\+\s*(\d+)% of incremental.*?cap at (\d+)%", payout, re.I)
+        if acc:
+            slabs.append((op, bound, Decimal(acc.group(1)), (Decimal(acc.group(2)) / HUNDRED, Decimal(acc.group(3)))))
+        else:
+            pm = re.match(r"(\d+(?:\.\d+)?)%", payout)
+            slabs.append((op, bound, Decimal(pm.group(1)) if pm else ZERO, None))
+    return slabs
+
+
+def parse_collection_slabs(rows):
+    """Collection multiplier rows: [(op, bound, payout, cap, label)], in table order.
+
+    payout is the fixed multiplier ("90% of accrued incentive"), or None
+    for "Payout at linear rate of collection achievement", which pays the
+    collection % itself, up to cap if the row gives one. The first row
+    whose condition holds applies, so "Less Than 95%" below a "Less Than
+    90%" row means 90% to less than 95%.
+
+    A row it cannot read gives [], so collection questions go to the model
+    rather than being answered from a partial table.
+    """
+    slabs = []
+    for label, payout in (r[:2] for r in rows):
+        m = re.search(r"(less than or equal|less than|greater than|more than)\s*(?:to\s*)?(\d+(?:\.\d+)?)%", label, re.I)
+        linear = re.search(r"\blinear\b", payout, re.I)
+        fixed = re.match(r"(\d+(?:\.\d+)?)%", payout)
+        if not m or not (linear or fixed):
+            return []
+        op = {"less than or equal": "le", "less than": "lt"}.get(m.group(1).lower(), "gt")
+        cap = re.search(r"cap (?:at|of) (\d+(?:\.\d+)?)%", payout, re.I)
+        slabs.append((op, Decimal(m.group(2)), None if linear else Decimal(fixed.group(1)),
+                      Decimal(cap.group(1)) if cap else None, label))
+    return slabs
+
+
+def parse_linear_slabs(rows):
+    """GP/NRGP benchmarks: [(attainment, payout)] sorted by attainment."""
+    points = []
+    for att, payout in (r[:2] for r in rows):
+        am = re.match(r"(\d+(?:\.\d+)?)%", att)
+        if not am:
+            continue
+        pm = re.match(r"(\d+(?:\.\d+)?)%", payout)
+        points.append((Decimal(am.group(1)), Decimal(pm.group(1)) if pm else ZERO))
+    return sorted(points)
+
+
+def metric_kind(name):
+    name = name.lower()
+    if "order booking" in name:
+        return "ob"
+    if "nrgp" in name:
+        return "nrgp"
+    if name.startswith("gross profit growth") or name == "gp growth":
+        return "gp"
+    return None  # funnel creation, prepaid deposits, segment GP splits
+
+
+def load_rules(kb_path=KB_PATH, kb_text=None):
+    """Extract every rule the engine uses from the knowledge base.
+
+    Cached per KB version, so calling it on every turn is free.
+    """
+    if kb_text is None:
+        with open(kb_path, "r", encoding="utf-8") as f:
+            kb_text = f.read()
+    digest = kb_hash(kb_text)
+    if digest in _RULES:
+        return _RULES[digest]
+
+    sections = split_sections(kb_text)
+    policies = {}
+    for sec in sections:
+        if sec["level"] == 1:
+            current = {"title": sec["title"], "start": sec["start"], "end": sec["end"], "sections": []}
+            policies[sec["title"]] = current
+        elif policies:
+            current["end"] = sec["end"]
+            current["sections"].append(sec)
+
+    roles = {}
+    for title, pol in policies.items():
+        if not title.startswith("Growth Incentive Policy - "):
+            continue
+        policy_name = title.split(" - ", 1)[1]
+        text = kb_text[pol["start"]:pol["end"]]
+        share = re.search(r"Quarterly Growth Incentive Plan.{0,200}?(\d+)% of (?:the )?annual variable", text, re.I | re.S)
+        ob_slabs, gp_slabs, collection_slabs, weight_tables, has_collection = None, None, None, [], False
+        for sec in pol["sections"]:
+            for header, rows in iter_tables(kb_text[sec["start"]:sec["end"]]):
+                first = header[0].lower()
+                if "performance metric" in " ".join(header).lower():
+                    role = sec["title"] if sec["level"] == 3 else policy_name
+                    weights = [(r[-2], Decimal(r[-1].rstrip("%").strip())) for r in rows if r[-1].strip().endswith("%")]
+                    weight_tables.append((role, weights))
+                elif first.startswith("booking attainment") and ob_slabs is None:
+                    ob_slabs = parse_ob_slabs(rows)
+                elif first.startswith("gp growth") and gp_slabs is None:
+                    gp_slabs = parse_linear_slabs(rows)
+                elif first.startswith("collection attainment"):
+                    has_collection = True
+                    if collection_slabs is None:
+                        collection_slabs = parse_collection_slabs(rows)
+        for role, weights in weight_tables:
+            kinds = [metric_kind(name) for name, _ in weights]
+            if None in kinds or ("ob" in kinds and not ob_slabs) or not gp_slabs \
+                    or (has_collection and not collection_slabs):
+                continue
+            roles[(policy_name, role)] = {
+                "policy": policy_name,
+                "role": role,
+                "weights": [(k, name, w) for k, (name, w) in zip(kinds, weights)],
+                "ob_slabs": ob_slabs,
+                "gp_slabs": gp_slabs,
+                "quarterly_share": Decimal(share.group(1)) if share else Decimal(80),
+                "has_collection": has_collection,
+                "collection_slabs": collection_slabs,
+            }
+
+    lease_cap = re.search(r"up to \*\*(\d+)% of their monthly Supplementary Allowance", kb_text)
+    advance = re.search(r"Maximum amount:\*\*\s*\w+\s*\((\d+)\)\s*months", kb_text)
+    repayment = re.search(r"Repayment period:\s*Maximum (\d+) months", kb_text)
+    shares = [r["quarterly_share"] for r in roles.values()]
+    rules = {
+        "roles": roles,
+        "quarterly_share": max(set(shares), key=shares.count) if shares else Decimal(80),
+        "lease_cap_pct": Decimal(lease_cap.group(1)) if lease_cap else None,
+        "advance_months": Decimal(advance.group(1)) if advance else None,
+        "advance_repayment_months": int(repayment.group(1)) if repayment else None,
+    }
+    _RULES[digest] = rules
+    return rules
+
+
+_RULES = {}
+
+
+# ---------------------------------------------------------------------------
+# Slab evaluation
+# ---------------------------------------------------------------------------
+def ob_payout(slabs, attainment):
+    """Return (payout %, explanation) for a stepped OB slab table."""
+    for op, bound, payout, acc in slabs:
+        if op == "lt" and attainment < bound:
+            return payout, f"{fmt_pct(attainment)} falls in the \"Less Than {fmt_pct(bound)}\" slab → {fmt_pct(payout)} payout"
+        if op == "le" and attainment <= bound:
+            return payout, f"{fmt_pct(attainment)} falls in the \"Less Than or Equal {fmt_pct(bound)}\" slab → {fmt_pct(payout)} payout"
+        if op == "gt" and attainment > bound:
+            if acc is None:
+                return payout, f"{fmt_pct(attainment)} falls in the \"Greater Than {fmt_pct(bound)}\" slab → {fmt_pct(payout)} payout"
+            rate, cap = acc
+            raw = payout + rate * (attainment - bound)
+            value = min(raw, cap)
+            note = f" (capped at {fmt_pct(cap)})" if raw > cap else ""
+            return value, (f"{fmt_pct(attainment)} is above {fmt_pct(bound)} → {fmt_pct(payout)} + "
+                           f"{fmt_pct(rate * HUNDRED)} × ({fmt_pct(attainment)} − {fmt_pct(bound)}) = {fmt_pct(value)}{note}")
+    return ZERO, f"{fmt_pct(attainment)} is below every slab → NIL"
+
+
+def linear_payout(points, attainment):
+    """Return (payout %, explanation) interpolating between GP/NRGP benchmarks."""
+    if attainment <= points[0][0]:
+        return points[0][1], f"{fmt_pct(attainment)} is at or below the lowest benchmark → {fmt_pct(points[0][1])} payout"
+    for (a0, p0), (a1, p1) in zip(points, points[1:]):
+        if attainment == a1:
+            return p1, f"{fmt_pct(attainment)} is a benchmark → {fmt_pct(p1)} payout"
+        if a0 < attainment < a1:
+            value = p0 + (attainment - a0) / (a1 - a0) * (p1 - p0)
+            return value, (f"{fmt_pct(p0)} + (({fmt_pct(attainment)} − {fmt_pct(a0)}) ÷ ({fmt_pct(a1)} − {fmt_pct(a0)})) "
+                           f"× ({fmt_pct(p1)} − {fmt_pct(p0)}) = {fmt_pct(value)}")
+    return points[-1][1], f"{fmt_pct(attainment)} is above the top benchmark → capped at {fmt_pct(points[-1][1])}"
+
+
+def collection_multiplier(slabs, collection):
+    """Return (multiplier % of accrued incentive, explanation) for a collection
+    multiplier table, or (None, None) if no row covers collection."""
+    for op, bound, payout, cap, label in slabs:
+        if (op == "lt" and collection < bound) or (op == "le" and collection <= bound) \
+                or (op == "gt" and collection > bound):
+            if payout is not None:
+                return payout, f"\"{label}\" → {fmt_pct(payout)} of accrued incentive"
+            if cap is not None and collection > cap:
+                return cap, f"\"{label}\" → paid at the collection rate, capped at {fmt_pct(cap)}"
+            return collection, f"\"{label}\" → paid at the collection rate"
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# Question parsing
+# ---------------------------------------------------------------------------
+ROLE_RULES = [
+    # (pattern, needs scaleup/team-lead context, segment, (policy, role))
+    (r"\bp\s*&\s*l (?:head|owner)", None, None, ("Cluster Heads & P&L Owners", "P&L Head")),
+    (r"\bcluster head (?:cx|customer experience)", "tl", "mid market", ("Team Leads (Scaleups)", "Cluster Head CX (Mid Market)")),
+    (r"\bcluster head (?:cx|customer experience)", None, None, ("Cluster Heads & P&L Owners", "Cluster Head CX (Customer Experience)")),
+    (r"\bcluster head(?: sales)?\b", "tl", None, ("Team Leads (Scaleups)", "Cluster Head Sales")),
+    (r"\bcluster head(?: sales)?\b", None, None, ("Cluster Heads & P&L Owners", "Cluster Head Sales")),
+    (r"\b(?:customer experience|cx) directors?\b", None, "mid market", ("Scaleups", "Customer Experience Directors - Mid Market")),
+    (r"\b(?:customer experience|cx) directors?\b", None, "smb", ("Scaleups", "Customer Experience Directors - SMB")),
+    (r"\baccounts? directors?\b", None, "mid market", ("Scaleups", "Account Directors - Mid Market")),
+    (r"\baccounts? directors?\b", None, "smb", ("Scaleups", "Account Directors - SMB")),
+    (r"\baccounts? directors?\b", None, None, ("Accounts Director", "Accounts Director")),
+    (r"\b(?:customer experience|cx) managers?\b", None, None, ("Customer Experience Managers", "Customer Experience Managers")),
+    (r"\bsolution architects?\b", None, None, ("Solution Architects & Product Marketing Managers", "Solution Architects (SA)")),
+]
+
+
+def detect_role(q, roles):
+    """Map the role named in q to a (policy, role) key, or None if vague.
+
+    Segment words (mid market / SMB) and Team Lead / Scaleup context pick the
+    right policy; a role that exists in several policies without enough
+    context to choose is treated as vague.
+    """
+    tl = bool(re.search(r"\bteam leads?\b|\bscale-?\s?ups?\b", q))
+    segment = "mid market" if re.search(r"\bmid[- ]?market\b", q) else ("smb" if re.search(r"\bsmb\b", q) else None)
+    for pattern, context, seg, key in ROLE_RULES:
+        if not re.search(pattern, q):
+            continue
+        if context == "tl" and not tl:
+            continue
+        if seg is not None and seg != segment:
+            continue
+        if seg is None and segment and key[0] == "Accounts Director":
+            continue
+        if context is None and tl and key[0] in ("Cluster Heads & P&L Owners", "Accounts Director"):
+            return None
+        return key if key in roles else None
+    return None
+
+
+def find_amount(pattern, q):
+    m = re.search(pattern + r"\s*" + AMOUNT_RE, q)
+    return parse_amount(m.group(1), m.group(2)) if m else None
+
+
+def find_pct(pattern, q):
+    m = re.search(pattern + r"\s*" + PCT_RE, q)
+    return Decimal(m.group(1)) if m else None
+
+
+LINK = r"(?:\s*(?:is|was|of|at|are|=|:|-))?"
+SAME_SENTENCE = r"(?:[^.?]|\.\d)*?"  # up to the end of the sentence; "14.1 lakh" is not an end
+
+# An annual fixed pay below this was surely misread ("6 lakh" without its
+# unit); the model asks instead of the calculator quoting a ₹1 advance
+MIN_ANNUAL_FIXED = Decimal(10000)
+
+
+def parse_inputs(question):
+    """Pull every number the engine understands out of a question."""
+    q = question.lower().replace("–", "-")
+    inputs = {}
+    inputs["annual_variable"] = find_amount(r"annual variable(?: pay| ctc| component| amount)?" + LINK, q) \
+        or find_amount(r"variable(?: pay| ctc)?" + LINK + r"(?= *(?:₹|rs\.?|inr)?\s*\d[\d,.]*\s*(?:k|l|lakhs?|lacs?)?\s*(?:per annum|p\.?a\.?|annually|a year|yearly))", q)
+
+    ob = r"\b(?:ob|order bookings?)\b(?: attainment| achievement| achieved)?" + LINK
+    inputs["ob"] = find_pct(ob, q)
+    if inputs["ob"] is None:
+        m = re.search(ob + r"\s*" + AMOUNT_RE + r"\s*(?:against|out of|of|/|vs\.?)\s*(?:a )?(?:target )?(?:of )?" + AMOUNT_RE, q)
+        if m:
+            inputs["ob"] = parse_amount(m.group(1), m.group(2)) / parse_amount(m.group(3), m.group(4)) * HUNDRED
+            q = q[:m.start()] + " " + q[m.end():]  # keep "against 25" away from the GP target
+
+    inputs["gp"] = find_pct(r"\b(?:gp|gross profit)(?: growth)? (?:attainment|achievement)" + LINK, q)
+    if inputs["gp"] is None and re.search(r"\b(?:gp|gross profit)\b", q):
+        base = find_amount(r"(?:start(?:ing)?[- ]of[- ](?:the )?(?:fy|financial year|year)|fy[- ]start|base|opening)(?: base)?(?: gp| gross profit)?" + LINK, q)
+        current = find_amount(r"(?:current|ytd|closing)(?: gp| gross profit)?" + LINK, q)
+        target = find_amount(r"(?:target|targeted)(?: gp| gross profit)?" + LINK, q)
+        if None not in (base, current, target) and target != base:
+            inputs["gp_values"] = (base, current, target)
+            inputs["gp"] = (current - base) / (target - base) * HUNDRED
+
+    inputs["nrgp"] = find_pct(r"\bnrgp(?: attainment| achievement)?" + LINK, q)
+    inputs["collection"] = find_pct(r"\bcollections?(?: attainment| achievement| efficiency)?" + LINK, q)
+    inputs["supplementary"] = find_amount(r"supplementary allowance" + LINK, q)
+    inputs["car_emi"] = find_amount(r"car(?: lease)? emi" + LINK, q)
+    inputs["device_emi"] = find_amount(r"(?:device|phone|mobile|laptop)(?: lease)? emi" + LINK, q)
+
+    annual_fixed = find_amount(r"fixed (?:ctc|gross|salary|pay)(?: salary| pay)?" + LINK + r"(?=" + SAME_SENTENCE + r"(?:per annum|p\.?\s?a\b|annual|yearly|a year|lpa))", q) \
+        or find_amount(r"(?:annual|yearly) fixed (?:ctc|gross|salary|pay)" + LINK, q)
+    monthly_fixed = find_amount(r"monthly fixed (?:gross|salary|pay)(?: salary| pay)?" + LINK, q) \
+        or find_amount(r"fixed (?:gross|salary|pay)(?: salary| pay)?" + LINK + r"(?=" + SAME_SENTENCE + r"(?:per month|monthly|a month|/month|\bpm\b))", q)
+    if annual_fixed is not None and annual_fixed < MIN_ANNUAL_FIXED:
+        annual_fixed = None
+    if monthly_fixed is None and annual_fixed is not None:
+        inputs["annual_fixed"] = annual_fixed
+        monthly_fixed = annual_fixed / 12
+    inputs["monthly_fixed"] = monthly_fixed
+    return inputs
+
+
+# ---------------------------------------------------------------------------
+# Answers
+# ---------------------------------------------------------------------------
+FOOTER = "\n\n_Calculated directly from the {source}. Final figures are subject to HR/Finance validation._"
+
+
+def answer_variable_payout(q, inputs, rules):
+    key = detect_role(q, rules["roles"])
+    if key is None or inputs["annual_variable"] is None:
+        return None
+    role = rules["roles"][key]
+    if role["has_collection"] and inputs["collection"] is None:
+        return None
+    if any(inputs.get(kind) is None for kind, _, _ in role["weights"]):
+        return None
+    if role["has_collection"]:
+        multiplier, multiplier_how = collection_multiplier(role["collection_slabs"], inputs["collection"])
+        if multiplier is None:
+            return None
+
+    annual = inputs["annual_variable"]
+    share = role["quarterly_share"]
+    quarterly = annual * share / HUNDRED / 4
+    quarter = re.search(r"\bq([1-4])\b", q)
+    label = f"Q{quarter.group(1)} " if quarter else "Quarterly "
+
+    lines = [f"**{label}variable payout — {role['role']}**", "", "**Inputs used**"]
+    lines.append(f"- Annual variable: {fmt_inr(annual)}")
+    for kind, name, weight in role["weights"]:
+        if kind == "gp" and "gp_values" in inputs:
+            base, current, target = inputs["gp_values"]
+            lines.append(f"- {name}: start-of-FY base {fmt_num(base)}, current {fmt_num(current)}, target {fmt_num(target)}")
+        else:
+            lines.append(f"- {name} attainment: {fmt_pct(inputs[kind])}")
+    if role["has_collection"]:
+        lines.append(f"- Collections: {fmt_pct(inputs['collection'])}")
+
+    step = 1
+    lines += ["", f"**Step {step} — Quarterly variable**",
+              f"{fmt_inr(annual)} × {fmt_pct(share)} ÷ 4 = **{fmt_inr(quarterly)}**"]
+
+    weighted_terms = []
+    accrued = ZERO
+    for kind, name, weight in role["weights"]:
+        step += 1
+        attainment = inputs[kind]
+        if kind == "ob":
+            payout, how = ob_payout(role["ob_slabs"], attainment)
+            lines += ["", f"**Step {step} — {name} (stepped slab, no interpolation)**", how]
+        else:
+            payout, how = linear_payout(role["gp_slabs"], attainment)
+            lines += ["", f"**Step {step} — {name} (linear interpolation)**"]
+            if kind == "gp" and "gp_values" in inputs:
+                base, current, target = inputs["gp_values"]
+                lines.append(f"Attainment = ({fmt_num(current)} − {fmt_num(base)}) ÷ ({fmt_num(target)} − {fmt_num(base)}) "
+                             f"= {fmt_pct(attainment)} (measured from the start-of-FY base)")
+            lines.append(how)
+        accrued += weight * payout / HUNDRED
+        weighted_terms.append((weight, payout))
+
+    step += 1
+    lines += ["", f"**Step {step} — Weighted payout**",
+              " + ".join(f"{fmt_pct(w)} × {fmt_pct(p)}" for w, p in weighted_terms)
+              + (" = " + " + ".join(fmt_pct(w * p / HUNDRED) for w, p in weighted_terms) if len(weighted_terms) > 1 else "")
+              + f" = **{fmt_pct(accrued)}**"]
+
+    final = accrued
+    if role["has_collection"]:
+        step += 1
+        final = accrued * multiplier / HUNDRED
+        lines += ["", f"**Step {step} — Collection multiplier**",
+                  f"Collections {fmt_pct(inputs['collection'])}: {multiplier_how}",
+                  f"{fmt_pct(accrued)} × {fmt_pct(multiplier)} = **{fmt_pct(final)}**"]
+
+    step += 1
+    payable_pct = min(final, HUNDRED)
+    amount = quarterly * payable_pct / HUNDRED
+    lines += ["", f"**Step {step} — Payout**",
+              f"{fmt_inr(quarterly)} × {fmt_pct(payable_pct)} = **{fmt_inr(amount)}**"]
+    if final > HUNDRED:
+        carried = quarterly * (final - HUNDRED) / HUNDRED
+        lines.append(f"Quarterly payout is capped at 100% of the quarterly variable; the excess "
+                     f"{fmt_inr(carried)} ({fmt_pct(final - HUNDRED)}) is carried forward to the annual true-up "
+                     f"and lapses if you exit before March 31.")
+
+    lines.append(f"\nYour {label if quarter else 'quarterly '}variable payout is **{fmt_inr(amount)}** ({fmt_pct(payable_pct)} of {fmt_inr(quarterly)}).")
+    return "\n".join(lines) + FOOTER.format(source=f"Growth Incentive Policy – {role['policy']} slab tables")
+
+
+def answer_quarterly_split(q, inputs, rules):
+    if inputs["annual_variable"] is None or not re.search(r"\bquarter(?:ly)?\b", q):
+        return None
+    if re.search(r"\b(?:ob|gp|nrgp|order booking|gross profit|collections?|attainment|achieved|payout)\b", q):
+        return None  # a payout question with missing inputs — let the model ask for them
+    annual = inputs["annual_variable"]
+    share = rules["quarterly_share"]
+    paid_quarterly = annual * share / HUNDRED
+    quarterly = paid_quarterly / 4
+    return "\n".join([
+        f"Your quarterly variable is **{fmt_inr(quarterly)}** (at 100% attainment).",
+        "",
+        "**Working**",
+        f"- {fmt_pct(share)} of annual variable is paid quarterly: {fmt_inr(annual)} × {fmt_num(share / HUNDRED)} = {fmt_inr(paid_quarterly)}",
+        f"- Split equally over 4 quarters: {fmt_inr(paid_quarterly)} ÷ 4 = **{fmt_inr(quarterly)}**",
+        f"- The remaining {fmt_pct(HUNDRED - share)} ({fmt_inr(annual - paid_quarterly)}) is held for the annual true-up.",
+        "",
+        f"Note: it is **not** {fmt_inr(annual)} ÷ 4 = {fmt_inr(annual / 4)}. Actual payouts depend on your "
+        "role's OB/GP slabs and collections — share those if you'd like the payout worked out.",
+    ]) + FOOTER.format(source="Growth Incentive Policy plan structure")
+
+
+def answer_lease_emi(q, inputs, rules):
+    cap_pct = rules["lease_cap_pct"]
+    sa = inputs["supplementary"]
+    if cap_pct is None or sa is None or not re.search(r"\blease\b|\bemi\b", q):
+        return None
+    cap = sa * cap_pct / HUNDRED
+    car, device = inputs["car_emi"], inputs["device_emi"]
+    asks_car = bool(re.search(r"\bcar\b|\bvehicle\b", q)) and car is None
+    asks_device = bool(re.search(r"\bdevice|\bphone|\bmobile|\blaptop|\bgadget", q)) and device is None
+
+    lines = [f"**Working**", f"- {fmt_pct(cap_pct)} × {fmt_inr(sa)} supplementary allowance = **{fmt_inr(cap)}** per month"]
+    if asks_device and car is not None:
+        remaining = max(cap - car, ZERO)
+        lines.append(f"- Less your car lease EMI: {fmt_inr(cap)} − {fmt_inr(car)} = **{fmt_inr(remaining)}**")
+        head = f"Your maximum device lease EMI would be **{fmt_inr(remaining)}** per month."
+    elif asks_car and device is not None:
+        remaining = max(cap - device, ZERO)
+        lines.append(f"- Less your device lease EMI: {fmt_inr(cap)} − {fmt_inr(device)} = **{fmt_inr(remaining)}**")
+        head = f"Your maximum car lease EMI would be **{fmt_inr(remaining)}** per month."
+    elif asks_device and not asks_car:
+        head = f"Your maximum device lease EMI would be **{fmt_inr(cap)}** per month ({fmt_pct(cap_pct)} of {fmt_inr(sa)} supplementary allowance)."
+    elif asks_car and not asks_device:
+        head = f"Your maximum car lease EMI would be **{fmt_inr(cap)}** per month ({fmt_pct(cap_pct)} of {fmt_inr(sa)} supplementary allowance)."
+    else:
+        head = f"Your combined car + device lease EMI can be at most **{fmt_inr(cap)}** per month ({fmt_pct(cap_pct)} of {fmt_inr(sa)} supplementary allowance)."
+
+    notes = [f"Note: car lease and device lease **share** this {fmt_pct(cap_pct)} cap — the combined EMI of both cannot exceed {fmt_inr(cap)}."]
+    if asks_car:
+        notes.append("Car lease is available to full-time employees at Job Band L3 and above.")
+    return "\n".join([head, ""] + lines + [""] + notes) + FOOTER.format(source="Car Lease and Device Lease policies")
+
+
+def answer_salary_advance(q, inputs, rules):
+    months = rules["advance_months"]
+    monthly = inputs["monthly_fixed"]
+    if months is None or monthly is None or "advance" not in q:
+        return None
+    limit = monthly * months
+    lines = [f"Your maximum salary advance is **{fmt_inr(limit)}** ({fmt_num(months)} × monthly fixed gross).", "", "**Working**"]
+    if "annual_fixed" in inputs:
+        lines.append(f"- Monthly fixed gross = {fmt_inr(inputs['annual_fixed'])} ÷ 12 = {fmt_inr(monthly)}")
+    lines.append(f"- Maximum advance = {fmt_num(months)} × {fmt_inr(monthly)} = **{fmt_inr(limit)}**")
+    if re.search(r"\bvariable\b", q):
+        lines.append("- Variable pay is **excluded** — only fixed gross salary counts.")
+    repay = rules["advance_repayment_months"]
+    if repay:
+        lines += ["", f"It is interest-free and recovered in equal monthly installments over at most {repay} months "
+                      f"(at least {fmt_inr(limit / repay)} per month for the full amount)."]
+    return "\n".join(lines) + FOOTER.format(source="Salary Advance Policy")
+
+
+ANSWERERS = [answer_variable_payout, answer_lease_emi, answer_salary_advance, answer_quarterly_split]
+
+
+def answer(question, rules=None):
+    """Return a fully worked markdown answer, or None if any input is missing."""
+    if rules is None:
+        rules = load_rules()
+    q = question.lower()
+    inputs = parse_inputs(question)
+    for answerer in ANSWERERS:
+        text = answerer(q, inputs, rules)
+        if text:
+            return text
+    return None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    result = answer(" ".join(sys.argv[1:]))
+    print(result if result else "Not answerable locally — missing inputs; the question would go to the model.")
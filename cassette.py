@@ -0,0 +1,78 @@
+"""
+Exotel HR Chatbot — Answer Cassettes
+=====================================
+Recorded model answers keyed by request fingerprint, so validate.py can
+rescore after a change to TEST_CASES or the scoring rules without paying
+for new calls.
+
+A fingerprint is (model, prompt hash, exact question). The prompt hash
+covers the full system prompt, so editing the rules or the knowledge base
+makes old recordings stop matching instead of silently replaying stale
+answers. Cassettes are gzipped JSON: a few KB for a full validation run.
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+
+import prompts
+from answer_cache import prompt_version
+
+CASSETTE_VERSION = 1
+
+
+def prompt_hash(system):
+    """Hash of a system prompt (list of blocks) for fingerprinting."""
+    return prompt_version(prompts.system_text(system))
+
+
+def fingerprint(model, prompt_hash, question):
+    raw = "\0".join([model, prompt_hash, question])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class MissingRecording(LookupError):
+    """No recording matches this request's fingerprint."""
+
+
+class Cassette:
+    """In-memory set of recordings, loaded from and saved to a .json.gz file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"{path}: unsupported cassette version {data.get('version')}")
+            self.entries = data["entries"]
+
+    def get(self, model, prompt_hash, question):
+        """The recording for this request; raises MissingRecording if none."""
+        entry = self.entries.get(fingerprint(model, prompt_hash, question))
+        if entry is None:
+            raise MissingRecording(f"no recording for this question with model {model}, prompt {prompt_hash}")
+        return entry
+
+    def put(self, model, prompt_hash, question, answer, usage=None, **extra):
+        self.entries[fingerprint(model, prompt_hash, question)] = {
+            "model": model,
+            "prompt_hash": prompt_hash,
+            "question": question,
+            "answer": answer,
+            "usage": usage,
+            "recorded_at": round(time.time()),
+            **extra,
+        }
+
+    def save(self):
+        """Write atomically, so an interrupted run never leaves a truncated cassette."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"version": CASSETTE_VERSION, "entries": self.entries}, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
@@ -0,0 +1,223 @@
+"""
+Exotel HR Chatbot — Request Coalescing
+=======================================
+When HR announces something ("the new Car Lease policy is effective Nov 6"),
+hundreds of people click the same quick-action card or ask the same thing
+within a minute. Before the first answer lands in the answer cache, each of
+those would start its own ~70k-token call.
+
+SingleFlight.join(key) makes the first request for a key the leader: it calls
+the model as usual and publishes every chunk to its Flight. Identical
+requests that arrive while the flight is open follow it instead: they get
+the chunks already streamed, then the rest as they arrive, and are never
+billed. The key is the answer-cache key (normalized question, model, prompt
+version, temperature) plus the KB content hash, and only first-turn
+questions are coalesced, so a follower gets exactly the answer a call of
+its own would have produced.
+
+The call itself belongs to the flight, not to the request that started it:
+the leader hands its chunks to run() (a thread, for app.py) or arun() (a
+task, for server.py) and then follows the flight like everyone else. A
+leader whose client disconnects, or whose Streamlit session stops or
+reruns, no longer cuts its followers off; the call runs to the end and
+fills the answer cache. A call that fails before any text raises
+LeaderGone in the followers (they make their own call), one that fails
+part-way ends their answer with the same cut-off note.
+
+Besides text, a flight carries the leader's queue positions (ints, while
+the call waits for admission); follow() passes them through and text is
+everything that is a str.
+
+Flights are per process; across workers, the shared answer cache
+(ANSWER_CACHE_DB) serves repeats once the first answer is complete.
+"""
+
+import asyncio
+import threading
+
+
+class LeaderGone(Exception):
+    """The call being followed stopped before producing any text."""
+
+
+class Flight:
+    """One in-flight answer, streamed to every request that joined it.
+
+    Sync followers (Streamlit sessions) and async ones (server.py requests)
+    can both follow it; the leader adds chunks from its own thread or task.
+    """
+
+    def __init__(self, key, on_close=None):
+        self.key = key
+        self.chunks = []
+        self.has_text = False
+        self.closed = False
+        self.complete = False
+        self.followers = 0
+        self.running = False  # the call is run by the flight (run/arun)
+        self.error = None     # what it raised, if it raised
+        self._task = None
+        self._on_close = on_close
+        self._cond = threading.Condition()
+        self._wakers = set()  # (event loop, asyncio.Event) of async followers
+
+    # -- leader ------------------------------------------------------------
+    def add(self, item):
+        """Publish a text chunk (or a queue position)."""
+        with self._cond:
+            self.chunks.append(item)
+            self.has_text = self.has_text or isinstance(item, str)
+            self._notify()
+
+    def text(self):
+        with self._cond:
+            return "".join(c for c in self.chunks if isinstance(c, str))
+
+    def run(self, chunks, finish, prepare=None):
+        """Publish a sync iterable of chunks from a thread of the flight's own.
+
+        finish(text) is called once they end and returns whether the answer
+        is complete (caching it is its job); the flight is then closed.
+        prepare(thread), if given, runs before the thread starts (app.py
+        attaches Streamlit's script context to it).
+        """
+        def pump():
+            complete = False
+            try:
+                for item in chunks:
+                    self.add(item)
+                complete = finish(self.text())
+            except Exception as e:
+                self.error = e
+            finally:
+                self.close(complete=complete)
+
+        self.running = True
+        thread = threading.Thread(target=pump, name="flight-leader", daemon=True)
+        if prepare:
+            prepare(thread)
+        thread.start()
+
+    def arun(self, chunks, finish):
+        """Async run(): publish an async iterable of chunks from a task of the flight's own."""
+        async def pump():
+            complete = False
+            try:
+                async for item in chunks:
+                    self.add(item)
+                complete = finish(self.text())
+            except Exception as e:
+                self.error = e
+            finally:
+                self.close(complete=complete)
+
+        self.running = True
+        self._task = asyncio.ensure_future(pump())  # held here: the loop keeps only a weak reference
+
+    def close(self, complete=True):
+        """End the flight; complete=False if the leader stopped part-way. Idempotent."""
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.complete = complete
+            self._notify()
+        if self._on_close:
+            self._on_close(self)
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, event in self._wakers:
+            loop.call_soon_threadsafe(event.set)
+
+    # -- followers ---------------------------------------------------------
+    def _after(self, seen):
+        return self.chunks[seen:], self.closed, self.complete
+
+    def _ending(self, complete, cut_off):
+        if not self.has_text:
+            raise LeaderGone("The request being followed stopped before answering")
+        if not complete and cut_off:
+            yield cut_off
+
+    def follow(self, cut_off=None):
+        """Yield the answer from its first chunk, waiting for the rest.
+
+        cut_off, if given, is yielded last when the call stopped part-way.
+        Raises LeaderGone if it stopped before any text.
+        """
+        seen = 0
+        while True:
+            with self._cond:
+                while len(self.chunks) == seen and not self.closed:
+                    self._cond.wait()
+                new, closed, complete = self._after(seen)
+            yield from new
+            seen += len(new)
+            if closed:
+                yield from self._ending(complete, cut_off)
+                return
+
+    async def afollow(self, cut_off=None):
+        """Async follow(), for server.py."""
+        waker = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            self._wakers.add(waker)
+        try:
+            seen = 0
+            while True:
+                with self._cond:
+                    waker[1].clear()
+                    new, closed, complete = self._after(seen)
+                if not new and not closed:
+                    await waker[1].wait()
+                    continue
+                for text in new:
+                    yield text
+                seen += len(new)
+                if closed:
+                    for text in self._ending(complete, cut_off):
+                        yield text
+                    return
+        finally:
+            with self._cond:
+                self._wakers.discard(waker)
+
+
+class SingleFlight:
+    """The open flights of this process, by key. Thread-safe."""
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """(flight, is_leader): lead a new flight for key, or follow the open one.
+
+        The leader must run()/arun() its call on the flight, or close() it
+        however its request ends.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.followers += 1
+                return flight, False
+            flight = self._flights[key] = Flight(key, on_close=self._closed)
+            self.leaders += 1
+            return flight, True
+
+    def _closed(self, flight):
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "followers": self.followers,  # model calls saved
+            }
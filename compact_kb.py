@@ -0,0 +1,285 @@
+"""
+Exotel HR Chatbot — Knowledge Base Compaction
+==============================================
+Writes a smaller knowledge base with the same facts, so every full-KB call
+sends fewer tokens.
+
+  - Sections repeated across policies ("Administration of the Policy",
+    "Policy Changes", the Growth Incentive definitions shared by the role
+    variants, ...) are hoisted once into a "# Shared Provisions" section;
+    each original site keeps its heading and a one-line reference.
+  - Near-duplicates (same heading, ≥90% identical wording) are hoisted too
+    when the differences are a few word substitutions without numbers; the
+    reference spells the substitutions out. Anything whose differences
+    involve numbers, and anything containing a table, stays verbatim, so
+    slab tables and amounts are never rewritten.
+  - Paragraphs repeated verbatim elsewhere are hoisted the same way.
+  - Horizontal rules, trailing spaces, table padding and runs of blank
+    lines are collapsed.
+
+    python compact_kb.py                      # → knowledge_base.compact.md + report
+    python validate.py --api --kb knowledge_base.compact.md
+
+The report lists tokens saved per policy and every hoisted block, and
+checks that the calculator parses identical slab tables from both files.
+"""
+
+import os
+import re
+import sys
+import json
+import difflib
+import argparse
+from collections import defaultdict
+
+from calculator import load_rules
+from history import estimate_tokens
+from retrieval import KB_PATH
+
+SHARED_HEADING = "# Shared Provisions"
+SHARED_INTRO = ("Standard provisions that apply wherever a policy below cites them by ID, "
+                "for example \"Standard provision [S1]\".")
+MIN_SECTION_CHARS = 120
+MIN_PARAGRAPH_CHARS = 100
+NEAR_DUP_RATIO = 0.9
+MAX_EDITS = 3
+
+HEADING_RE = re.compile(r"^(#{1,3}) +(.+?)\s*$", re.M)
+NUMBERING_RE = re.compile(r"^(?:\d+\.|[IVX]+\.)\s+")
+RULE_RE = re.compile(r"^\s*(?:-{3,}|\*{3,}|_{3,})\s*$", re.M)
+TABLE_SEP_CELL_RE = re.compile(r"^\s*:?-+:?\s*$")
+
+
+def split_sections(kb_text):
+    """[{level, title, heading, body}] for #/##/### headings; level 0 is the preamble."""
+    sections = []
+    matches = list(HEADING_RE.finditer(kb_text))
+    first = matches[0].start() if matches else len(kb_text)
+    sections.append({"level": 0, "title": "", "heading": "", "body": kb_text[:first]})
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(kb_text)
+        sections.append({
+            "level": len(m.group(1)),
+            "title": m.group(2).strip(),
+            "heading": m.group(0).strip(),
+            "body": kb_text[m.end():end],
+        })
+    return sections
+
+
+def _norm(text):
+    return " ".join(text.split())
+
+
+def _has_table(text):
+    return any(line.lstrip().startswith("|") for line in text.splitlines())
+
+
+def _title_key(title):
+    return NUMBERING_RE.sub("", title.replace("*", "")).strip().lower()
+
+
+def substitutions(canonical, variant):
+    """Word substitutions turning canonical into variant, or None if unsafe.
+
+    Unsafe: too many edits, an edit touching a number, or an old phrase that
+    is not unique in the canonical text.
+    """
+    a, b = canonical.split(), variant.split()
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    if matcher.ratio() < NEAR_DUP_RATIO:
+        return None
+    edits = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if (i1 == i2 or j1 == j2) and i1 > 0:
+            i1, j1 = i1 - 1, j1 - 1  # anchor inserts/deletes on the previous word
+        old, new = " ".join(a[i1:i2]), " ".join(b[j1:j2])
+        if any(ch.isdigit() for ch in old + new) or not old:
+            return None
+        if len(re.findall(r"(?<!\S)" + re.escape(old) + r"(?!\S)", " ".join(a))) != 1:
+            return None
+        edits.append((old, new))
+    if len(edits) > MAX_EDITS:
+        return None
+    return edits
+
+
+def _reference(sid, edits=()):
+    ref = f"*Standard provision [{sid}] (see Shared Provisions)"
+    if edits:
+        ref += ", reading " + "; ".join(f"\"{old}\" as \"{new}\"" if new else f"without \"{old}\""
+                                        for old, new in edits)
+    return ref + ".*\n\n"
+
+
+def hoist_sections(sections):
+    """Replace repeated section bodies with references; returns shared entries."""
+    groups = defaultdict(list)
+    for idx, sec in enumerate(sections):
+        body = sec["body"].strip()
+        if sec["level"] >= 2 and len(body) >= MIN_SECTION_CHARS and not _has_table(body):
+            groups[_title_key(sec["title"])].append(idx)
+
+    shared = []
+    for key, members in groups.items():
+        if len(members) < 2:
+            continue
+        bodies = [_norm(sections[i]["body"]) for i in members]
+        canonical = max(set(bodies), key=lambda b: (bodies.count(b), -bodies.index(b)))
+        sites = []
+        for idx, body in zip(members, bodies):
+            if body == canonical:
+                sites.append((idx, ()))
+            else:
+                edits = substitutions(canonical, body)
+                if edits is not None:
+                    sites.append((idx, edits))
+        if len(sites) < 2:
+            continue
+        sid = f"S{len(shared) + 1}"
+        source = next(i for i, e in sites if not e)
+        shared.append({
+            "id": sid,
+            "title": NUMBERING_RE.sub("", sections[source]["title"]),
+            "text": sections[source]["body"].strip(),
+            "kind": "section",
+            "sites": [sections[i]["title"] for i, _ in sites],
+            "near_duplicates": sum(1 for _, e in sites if e),
+        })
+        for idx, edits in sites:
+            sections[idx]["body"] = "\n\n" + _reference(sid, edits)
+            sections[idx]["hoisted"] = True
+    return shared
+
+
+def hoist_paragraphs(sections, first_id):
+    """Hoist paragraphs repeated verbatim in sections that were not hoisted."""
+    counts = defaultdict(int)
+    for sec in sections:
+        if sec.get("hoisted") or sec["level"] == 0:
+            continue
+        for para in re.split(r"\n\s*\n", sec["body"]):
+            para = para.strip()
+            if len(para) >= MIN_PARAGRAPH_CHARS and not _has_table(para) and not para.startswith("#"):
+                counts[_norm(para)] += 1
+
+    ids = {}
+    shared = []
+    for sec in sections:
+        if sec.get("hoisted") or sec["level"] == 0:
+            continue
+        paras = re.split(r"(\n\s*\n)", sec["body"])
+        for i, para in enumerate(paras):
+            key = _norm(para)
+            if counts.get(key, 0) < 2:
+                continue
+            if key not in ids:
+                ids[key] = f"S{first_id + len(shared)}"
+                shared.append({"id": ids[key], "title": sec["title"], "text": para.strip(),
+                               "kind": "paragraph", "sites": [], "near_duplicates": 0})
+            entry = next(e for e in shared if e["id"] == ids[key])
+            entry["sites"].append(sec["title"])
+            paras[i] = _reference(ids[key]).rstrip("\n")
+        sec["body"] = "".join(paras)
+    return shared
+
+
+def _strip_table_padding(line):
+    if not line.lstrip().startswith("|"):
+        return line
+    cells = line.strip().strip("|").split("|")
+    if all(TABLE_SEP_CELL_RE.match(c) for c in cells):
+        return "|" + "|".join("-" for _ in cells) + "|"
+    return "| " + " | ".join(c.strip() for c in cells) + " |"
+
+
+def collapse_whitespace(text):
+    """Drop horizontal rules and table padding; collapse trailing spaces and blank runs."""
+    text = RULE_RE.sub("", text)
+    text = "\n".join(_strip_table_padding(line.rstrip()) for line in text.splitlines())
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip() + "\n"
+
+
+def compact(kb_text):
+    """(compact KB text, shared entries)."""
+    sections = split_sections(kb_text)
+    shared = hoist_sections(sections)
+    shared += hoist_paragraphs(sections, len(shared) + 1)
+
+    parts = []
+    shared_written = False
+    for i, sec in enumerate(sections):
+        # Shared provisions go before the first policy, after the KB title/preamble
+        if shared and not shared_written and sec["level"] == 1 and i > 1:
+            parts.append(f"{SHARED_HEADING}\n\n{SHARED_INTRO}\n\n")
+            for entry in shared:
+                parts.append(f"### [{entry['id']}] {entry['title']}\n\n{entry['text']}\n\n")
+            shared_written = True
+        parts.append(f"{sec['heading']}\n{sec['body']}" if sec["heading"] else sec["body"])
+    return collapse_whitespace("".join(parts)), shared
+
+
+def tokens_by_policy(kb_text):
+    """{top-level heading: estimated tokens}, in KB order."""
+    totals = {}
+    current = "(preamble)"
+    for sec in split_sections(kb_text):
+        if sec["level"] == 1:
+            current = sec["title"]
+        totals[current] = totals.get(current, 0) + estimate_tokens(sec["heading"] + sec["body"])
+    return totals
+
+
+def build_report(kb_text, compact_text, shared):
+    before, after = tokens_by_policy(kb_text), tokens_by_policy(compact_text)
+    policies = [
+        {"section": title, "tokens_before": n, "tokens_after": after.get(title, 0),
+         "saved": n - after.get(title, 0)}
+        for title, n in before.items()
+    ]
+    rules_before, rules_after = load_rules(kb_text=kb_text), load_rules(kb_text=compact_text)
+    return {
+        "tokens_before": estimate_tokens(kb_text),
+        "tokens_after": estimate_tokens(compact_text),
+        "shared_provisions_tokens": after.get(SHARED_HEADING[2:], 0),
+        "calculator_rules_unchanged": rules_before["roles"] == rules_after["roles"],
+        "sections": policies,
+        "hoisted": [{k: e[k] for k in ("id", "title", "kind", "sites", "near_duplicates")} for e in shared],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a compacted copy of the knowledge base")
+    parser.add_argument("--kb", default=KB_PATH, help="Source knowledge base (default: knowledge_base.md)")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(KB_PATH), "knowledge_base.compact.md"),
+                        help="Compact KB to write (default: knowledge_base.compact.md)")
+    parser.add_argument("--report", help="JSON report path (default: <out>.report.json)")
+    args = parser.parse_args()
+
+    with open(args.kb, "r", encoding="utf-8") as f:
+        kb_text = f.read()
+    compact_text, shared = compact(kb_text)
+    report = build_report(kb_text, compact_text, shared)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        f.write(compact_text)
+    report_path = args.report or os.path.splitext(args.out)[0] + ".report.json"
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    saved = report["tokens_before"] - report["tokens_after"]
+    print(f"\n  {args.kb} → {args.out}")
+    print(f"  {report['tokens_before']:,} → {report['tokens_after']:,} tokens "
+          f"({saved:,} saved, {100 * saved / report['tokens_before']:.1f}%)")
+    print(f"  {len(shared)} shared provisions ({report['shared_provisions_tokens']:,} tokens), "
+          f"{sum(len(e['sites']) for e in shared)} references\n")
+    for row in sorted(report["sections"], key=lambda r: -r["saved"]):
+        if row["saved"] > 0:
+            print(f"  {row['saved']:>6,}  {row['section'][:70]}")
+    print(f"\n  Calculator rules unchanged: {'yes' if report['calculator_rules_unchanged'] else 'NO'}")
+    print(f"  Report saved to: {report_path}\n")
+    if not report["calculator_rules_unchanged"]:
+        sys.exit(1)
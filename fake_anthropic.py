@@ -0,0 +1,544 @@
+"""
+Exotel HR Chatbot — Offline Anthropic Stand-in
+===============================================
+A local fake of the Messages API for load, latency and retry testing
+without a network or an API key. Point any client at it:
+
+    python fake_anthropic.py --port 8765 --ttft lognormal:0.8,0.4 --error-rate 0.05
+
+    export ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=test
+    python validate.py --api            # or: streamlit run app.py
+    python validate.py --api --batch    # Message Batches mode
+
+What it simulates:
+  - POST /v1/messages, streamed (SSE, same event sequence as the real API)
+    or not
+  - latency: time to first token and per-chunk delay drawn from
+    configurable distributions ("fixed:0.5", "uniform:0.2,1.5",
+    "normal:0.8,0.2", "lognormal:0.8,0.4" (median, sigma), "exp:0.5")
+  - usage with prompt caching: every cache_control breakpoint is a prefix
+    that is written on first sight (cache_creation_input_tokens) and read
+    on repeats within the TTL (cache_read_input_tokens), like the real cache
+  - injected 429/529 errors with retry-after, at a configurable rate
+  - canned answers: the first matching regex wins; by default every
+    validate.py question gets an answer containing its expected keywords,
+    and any other question calculator.py can work out gets its worked
+    answer, so the validator passes offline (--calc suites included)
+
+  - the Message Batches endpoints (create, retrieve, list results as JSONL,
+    cancel): each request of a batch finishes at a time drawn from
+    --batch-time, with the same answers, usage and injected errors (as
+    "errored" results) as a direct call; results are available once the
+    whole batch has ended. Batches over the API's limits (256 MB or
+    100,000 requests) are rejected like the real API does
+
+GET /stats returns request/error counters; POST /stats/reset clears them
+and the simulated prompt cache.
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import calculator
+from history import estimate_tokens
+
+CACHE_TTL_S = 300
+CACHE_MIN_TOKENS = 1024  # prefixes shorter than this are never cached
+DEFAULT_ANSWER = "This is a simulated answer from the offline test server."
+ERROR_TYPES = {429: "rate_limit_error", 529: "overloaded_error"}
+CHUNK_RE = re.compile(r"\S+\s*|\s+")
+BATCH_ROUTE = re.compile(r"^/v1/messages/batches/([\w-]+)(/results|/cancel)?$")
+BATCH_EXPIRY = timedelta(hours=24)
+BATCH_MAX_REQUESTS = 100_000
+BATCH_MAX_BYTES = 256 * 1024 * 1024
+
+
+def parse_distribution(spec):
+    """Sampler rng -> seconds for a latency spec such as "lognormal:0.8,0.4"."""
+    spec = str(spec).strip()
+    if ":" not in spec:
+        value = float(spec)
+        return lambda rng: value
+    kind, _, args = spec.partition(":")
+    params = [float(x) for x in args.split(",")]
+    samplers = {
+        "fixed": lambda rng: params[0],
+        "uniform": lambda rng: rng.uniform(params[0], params[1]),
+        "normal": lambda rng: max(0.0, rng.gauss(params[0], params[1])),
+        "lognormal": lambda rng: rng.lognormvariate(math.log(params[0]), params[1]) if params[0] > 0 else 0.0,
+        "exp": lambda rng: rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0,
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution {kind!r} (use {', '.join(samplers)})")
+    return samplers[kind]
+
+
+def canned_from_test_cases():
+    """One canned answer per validate.py question, containing its expected keywords."""
+    from validate import TEST_CASES
+
+    canned = []
+    for tc in TEST_CASES:
+        keywords = ", ".join(tc["expected_keywords"])
+        canned.append((
+            re.compile(re.escape(tc["question"][:60]), re.I),
+            f"Simulated answer. Key points: {keywords}.",
+        ))
+    return canned
+
+
+def load_canned(path):
+    """[(compiled regex, answer)] from a JSON list of {"pattern", "answer"}."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [(re.compile(item["pattern"], re.I), item["answer"]) for item in json.load(f)]
+
+
+def _content_blocks(content):
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return content
+
+
+def _block_text(block):
+    if block.get("type") == "text":
+        return block.get("text", "")
+    return json.dumps(block, sort_keys=True)
+
+
+def _iso(ts):
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _error_body(error_type, message):
+    return {"type": "error", "error": {"type": error_type, "message": message}}
+
+
+class FakeAnthropicServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the fake's configuration and state."""
+
+    daemon_threads = True
+    # The default listen backlog of 5 drops connections under load tests;
+    # the SYN retransmits then show up as errors and a false latency tail
+    request_queue_size = 1024
+
+    def __init__(self, address, ttft="fixed:0.05", chunk_delay="fixed:0.005", error_rate=0.0,
+                 error_statuses=(429, 529), retry_after=1.0, canned=None, default_answer=DEFAULT_ANSWER,
+                 batch_time="uniform:1,3", seed=None):
+        super().__init__(address, _Handler)
+        self.ttft = parse_distribution(ttft)
+        self.batch_time = parse_distribution(batch_time)
+        self.chunk_delay = parse_distribution(chunk_delay)
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.retry_after = retry_after
+        self.canned = canned if canned is not None else canned_from_test_cases()
+        self.default_answer = default_answer
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.batches = {}  # batch id -> {"created", "canceled", "requests": [(done_at, result)]}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.prompt_cache = {}  # prefix hash -> expires_at
+            self.counters = {"requests": 0, "streamed": 0, "errors_injected": 0,
+                             "cache_reads": 0, "cache_writes": 0, "batches": 0, "batch_requests": 0}
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def sample(self, distribution):
+        with self._lock:
+            return distribution(self._rng)
+
+    def should_fail(self):
+        """Status code to inject for this request, or None."""
+        with self._lock:
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.counters["errors_injected"] += 1
+                return self._rng.choice(self.error_statuses)
+        return None
+
+    def answer_for(self, question):
+        for pattern, answer in self.canned:
+            if pattern.search(question):
+                return answer
+        return calculator.answer(question) or self.default_answer
+
+    def usage_for(self, body):
+        """Synthetic usage for a request, simulating the prompt cache.
+
+        The prompt is system blocks then message blocks, in order. The
+        longest previously-seen breakpoint prefix is read from the cache;
+        later breakpoints are written; the rest is uncached input.
+        """
+        blocks = list(_content_blocks(body.get("system") or []))
+        for message in body.get("messages", []):
+            blocks.extend(_content_blocks(message["content"]))
+
+        h = hashlib.sha256(body.get("model", "").encode("utf-8"))
+        tokens = 0
+        breakpoints = []  # (prefix hash, tokens up to and including the block)
+        for block in blocks:
+            text = _block_text(block)
+            h.update(text.encode("utf-8"))
+            tokens += estimate_tokens(text)
+            if block.get("cache_control") and tokens >= CACHE_MIN_TOKENS:
+                breakpoints.append((h.hexdigest(), tokens))
+        total = tokens + 3 * len(body.get("messages", []))  # role/turn overhead
+
+        now = time.time()
+        read = written = 0
+        with self._lock:
+            for key, upto in breakpoints:
+                if self.prompt_cache.get(key, 0) > now:
+                    read = upto
+            for key, upto in breakpoints:
+                if upto > read:
+                    written = upto - read
+                self.prompt_cache[key] = now + CACHE_TTL_S
+            if read:
+                self.counters["cache_reads"] += 1
+            if written:
+                self.counters["cache_writes"] += 1
+        return {
+            "input_tokens": total - read - written,
+            "cache_creation_input_tokens": written,
+            "cache_read_input_tokens": read,
+        }
+
+    def reply_for(self, body):
+        """(chunks, stop_reason, usage) of the answer to a Messages request body.
+
+        Raises ValueError/KeyError/IndexError/TypeError for a malformed body.
+        """
+        question = _block_text(_content_blocks(body["messages"][-1]["content"])[-1])
+        max_tokens = int(body["max_tokens"])
+        chunks = CHUNK_RE.findall(self.answer_for(question))
+        stop_reason = "end_turn"
+        if estimate_tokens("".join(chunks)) > max_tokens:
+            while chunks and estimate_tokens("".join(chunks)) > max_tokens:
+                chunks.pop()
+            stop_reason = "max_tokens"
+        usage = self.usage_for(body)
+        usage["output_tokens"] = estimate_tokens("".join(chunks))
+        return chunks, stop_reason, usage
+
+    # -- Message Batches -------------------------------------------------
+    def create_batch(self, requests):
+        """Answer every request now; each becomes visible at its own done_at."""
+        created = time.time()
+        entries = []
+        for req in requests:
+            status = self.should_fail()
+            if status:
+                result = {"type": "errored", "error": _error_body(
+                    ERROR_TYPES.get(status, "api_error"), "Injected error from the offline test server")}
+            else:
+                try:
+                    chunks, stop_reason, usage = self.reply_for(req["params"])
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    result = {"type": "errored",
+                              "error": _error_body("invalid_request_error", f"Malformed request: {e}")}
+                else:
+                    result = {"type": "succeeded", "message": {
+                        "id": f"msg_fake_{uuid.uuid4().hex[:20]}",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": req["params"].get("model", ""),
+                        "content": [{"type": "text", "text": "".join(chunks)}],
+                        "stop_reason": stop_reason,
+                        "stop_sequence": None,
+                        "usage": usage,
+                    }}
+            done_at = created + self.sample(self.batch_time)
+            entries.append((done_at, {"custom_id": req["custom_id"], "result": result}))
+        batch_id = f"msgbatch_fake_{uuid.uuid4().hex[:20]}"
+        with self._lock:
+            self.batches[batch_id] = {"created": created, "canceled": None, "requests": entries}
+            self.counters["batches"] += 1
+            self.counters["batch_requests"] += len(entries)
+        return batch_id
+
+    def cancel_batch(self, batch_id):
+        with self._lock:
+            batch = self.batches[batch_id]
+            if batch["canceled"] is None:
+                batch["canceled"] = time.time()
+
+    def _batch_state(self, batch):
+        """(ended_at or None, [(result type or "processing", entry)]) as of now."""
+        now = time.time()
+        canceled = batch["canceled"]
+        states = []
+        for done_at, entry in batch["requests"]:
+            if done_at <= now and (canceled is None or done_at <= canceled):
+                states.append((entry["result"]["type"], entry))
+            elif canceled is not None:
+                states.append(("canceled", {"custom_id": entry["custom_id"], "result": {"type": "canceled"}}))
+            else:
+                states.append(("processing", entry))
+        if any(state == "processing" for state, _ in states):
+            return None, states
+        last = max((done_at for done_at, _ in batch["requests"]), default=batch["created"])
+        return (min(last, canceled) if canceled is not None else last), states
+
+    def batch_object(self, batch_id, base_url):
+        """The MessageBatch JSON for a batch, as the API returns it."""
+        with self._lock:
+            batch = self.batches[batch_id]
+            ended_at, states = self._batch_state(batch)
+        counts = {name: sum(1 for state, _ in states if state == name)
+                  for name in ("processing", "succeeded", "errored", "canceled", "expired")}
+        if ended_at is not None:
+            status = "ended"
+        elif batch["canceled"] is not None:
+            status = "canceling"
+        else:
+            status = "in_progress"
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": status,
+            "request_counts": counts,
+            "created_at": _iso(batch["created"]),
+            "ended_at": _iso(ended_at),
+            "expires_at": _iso(batch["created"] + BATCH_EXPIRY.total_seconds()),
+            "archived_at": None,
+            "cancel_initiated_at": _iso(batch["canceled"]),
+            "results_url": f"{base_url}/v1/messages/batches/{batch_id}/results" if ended_at is not None else None,
+        }
+
+    def batch_results(self, batch_id):
+        """Result lines of an ended batch, or None while it is still processing."""
+        with self._lock:
+            ended_at, states = self._batch_state(self.batches[batch_id])
+        if ended_at is None:
+            return None
+        return [entry for _, entry in states]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeAnthropicServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.send_header("request-id", f"req_fake_{uuid.uuid4().hex[:16]}")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, error_type, message, headers=None):
+        self._send_json(status, _error_body(error_type, message), headers)
+
+    def _base_url(self):
+        host = self.headers.get("host") or "%s:%s" % self.server.server_address[:2]
+        return f"http://{host}"
+
+    def _batch_route(self, path):
+        """(batch id, action) for a batch URL, (None, None) for any other path.
+
+        action is "", "/results" or "/cancel"; None once an unknown batch
+        has been answered with a 404.
+        """
+        match = BATCH_ROUTE.match(path)
+        if not match:
+            return None, None
+        batch_id, action = match.group(1), match.group(2) or ""
+        if batch_id not in self.server.batches:
+            self._send_error(404, "not_found_error", f"No batch {batch_id}")
+            return batch_id, None
+        return batch_id, action
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/stats":
+            with self.server._lock:
+                return self._send_json(200, dict(self.server.counters))
+        batch_id, action = self._batch_route(path)
+        if batch_id is None:
+            return self._send_error(404, "not_found_error", f"No route for GET {self.path}")
+        if action == "":
+            return self._send_json(200, self.server.batch_object(batch_id, self._base_url()))
+        if action == "/results":
+            lines = self.server.batch_results(batch_id)
+            if lines is None:
+                return self._send_error(400, "invalid_request_error", f"Batch {batch_id} is still processing")
+            data = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+            self.send_response(200)
+            self.send_header("content-type", "application/binary")
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if action is not None:
+            self._send_error(404, "not_found_error", f"No route for GET {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get("content-length") or 0)
+        path = self.path.split("?", 1)[0]
+        if path == "/v1/messages/batches" and length > BATCH_MAX_BYTES:
+            while length > 0:  # drain it, so the client reads the error rather than a reset
+                chunk = self.rfile.read(min(length, 1 << 20))
+                if not chunk:
+                    break
+                length -= len(chunk)
+            return self._send_error(413, "request_too_large",
+                                    f"Batch exceeds the maximum size of {BATCH_MAX_BYTES // (1024 * 1024)} MB")
+        raw = self.rfile.read(length) if length else b""
+        if path == "/stats/reset":
+            self.server.reset()
+            return self._send_json(200, {"ok": True})
+        if path == "/v1/messages/batches":
+            try:
+                requests = json.loads(raw)["requests"]
+                if not requests or any("custom_id" not in r or "params" not in r for r in requests):
+                    raise ValueError("every request needs a custom_id and params")
+                if len(requests) > BATCH_MAX_REQUESTS:
+                    raise ValueError(f"at most {BATCH_MAX_REQUESTS:,} requests per batch")
+            except (ValueError, KeyError, TypeError) as e:
+                return self._send_error(400, "invalid_request_error", f"Malformed batch: {e}")
+            batch_id = self.server.create_batch(requests)
+            return self._send_json(200, self.server.batch_object(batch_id, self._base_url()))
+        batch_id, action = self._batch_route(path)
+        if batch_id is not None:
+            if action == "/cancel":
+                self.server.cancel_batch(batch_id)
+                return self._send_json(200, self.server.batch_object(batch_id, self._base_url()))
+            if action is not None:
+                self._send_error(404, "not_found_error", f"No route for POST {self.path}")
+            return
+        if path != "/v1/messages":
+            return self._send_error(404, "not_found_error", f"No route for POST {self.path}")
+        try:
+            body = json.loads(raw)
+            _block_text(_content_blocks(body["messages"][-1]["content"])[-1])
+            int(body["max_tokens"])
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            return self._send_error(400, "invalid_request_error", f"Malformed request: {e}")
+
+        self.server.count("requests")
+        status = self.server.should_fail()
+        if status:
+            time.sleep(self.server.sample(self.server.ttft) / 4)
+            return self._send_error(status, ERROR_TYPES.get(status, "api_error"),
+                                    "Injected error from the offline test server",
+                                    {"retry-after": str(self.server.retry_after)})
+
+        chunks, stop_reason, usage = self.server.reply_for(body)
+        message = {
+            "id": f"msg_fake_{uuid.uuid4().hex[:20]}",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model", ""),
+            "content": [],
+            "stop_reason": None,
+            "stop_sequence": None,
+            "usage": {**usage, "output_tokens": 1},
+        }
+
+        if not body.get("stream"):
+            time.sleep(self.server.sample(self.server.ttft)
+                       + sum(self.server.sample(self.server.chunk_delay) for _ in chunks[1:]))
+            message.update(content=[{"type": "text", "text": "".join(chunks)}], stop_reason=stop_reason, usage=usage)
+            return self._send_json(200, message)
+
+        self.server.count("streamed")
+        self.send_response(200)
+        self.send_header("content-type", "text/event-stream")
+        self.send_header("cache-control", "no-cache")
+        self.send_header("connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(name, data):
+            self.wfile.write(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            event("message_start", {"type": "message_start", "message": message})
+            event("content_block_start", {"type": "content_block_start", "index": 0,
+                                          "content_block": {"type": "text", "text": ""}})
+            time.sleep(self.server.sample(self.server.ttft))
+            for i, chunk in enumerate(chunks):
+                if i:
+                    time.sleep(self.server.sample(self.server.chunk_delay))
+                event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                              "delta": {"type": "text_delta", "text": chunk}})
+            event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            event("message_delta", {"type": "message_delta",
+                                    "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                                    "usage": {"output_tokens": usage["output_tokens"]}})
+            event("message_stop", {"type": "message_stop"})
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away mid-stream
+
+
+def start_server(host="127.0.0.1", port=0, **config):
+    """Start a fake server on a background thread; returns (server, base_url)."""
+    server = FakeAnthropicServer((host, port), **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", default="fixed:0.05",
+                        help='Time-to-first-token distribution, e.g. "lognormal:0.8,0.4" (default: fixed:0.05)')
+    parser.add_argument("--chunk-delay", default="fixed:0.005",
+                        help="Delay between streamed chunks (default: fixed:0.005)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with an injected error (default: 0)")
+    parser.add_argument("--error-statuses", default="429,529",
+                        help="Status codes to inject (default: 429,529)")
+    parser.add_argument("--retry-after", type=float, default=1.0,
+                        help="retry-after seconds sent with injected errors (default: 1)")
+    parser.add_argument("--canned", help='JSON list of {"pattern", "answer"}; default: answers for validate.py')
+    parser.add_argument("--batch-time", default="uniform:1,3",
+                        help="Time for each request of a message batch to finish (default: uniform:1,3)")
+    parser.add_argument("--seed", type=int, help="Seed for latency and error sampling")
+    args = parser.parse_args()
+
+    try:
+        server = FakeAnthropicServer(
+            (args.host, args.port),
+            ttft=args.ttft,
+            chunk_delay=args.chunk_delay,
+            error_rate=args.error_rate,
+            error_statuses=[int(s) for s in args.error_statuses.split(",")],
+            retry_after=args.retry_after,
+            canned=load_canned(args.canned) if args.canned else None,
+            batch_time=args.batch_time,
+            seed=args.seed,
+        )
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    print(f"Fake Anthropic API on http://{args.host}:{args.port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
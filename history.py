@@ -0,0 +1,135 @@
+"""
+Exotel HR Chatbot — Conversation History Budget
+================================================
+Builds the `messages` list for each Claude call under a token budget, so a
+long session stops resending every earlier answer in full.
+
+  - The last N turns are kept verbatim.
+  - Older turns are folded into a compact running summary that is cached in
+    the session and only extended as more turns fall out of the window.
+  - Markdown tables (calculation working, slab tables) are dropped from all
+    but the latest assistant turn.
+  - A pre-flight estimate shrinks the verbatim window until system prompt +
+    history + max_tokens fits the context limit.
+"""
+
+import re
+import math
+
+CHARS_PER_TOKEN = 3.5  # conservative for English + ₹/table markup
+SUMMARY_MAX_LINES = 12
+SUMMARY_HEADER = "Summary of our earlier conversation (for context only):"
+
+TABLE_RE = re.compile(r"(?:^[ \t]*\|.*\|[ \t]*\n?){2,}", re.M)
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s")
+MARKUP_RE = re.compile(r"[*_#>`]+")
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def strip_tables(text):
+    """Replace markdown tables with a short placeholder."""
+    return TABLE_RE.sub("[table omitted]\n", text)
+
+
+def _first_sentence(text, limit):
+    text = MARKUP_RE.sub("", strip_tables(text))
+    text = " ".join(text.split())
+    sentence = SENTENCE_RE.split(text, 1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 1].rstrip() + "…"
+
+
+def summarize_locally(previous, messages):
+    """Extend a running summary with one line per dropped user/assistant pair."""
+    lines = previous.splitlines() if previous else []
+    question = None
+    for msg in messages:
+        if msg["role"] == "user":
+            question = _first_sentence(msg["content"], 160)
+        elif question is not None:
+            lines.append(f"- Asked: {question} → Answered: {_first_sentence(msg['content'], 220)}")
+            question = None
+    return "\n".join(lines[-SUMMARY_MAX_LINES:])
+
+
+def model_summarizer(client, model):
+    """Summarizer that asks a small model to fold dropped turns into the summary.
+
+    Falls back to the local summary if the call fails.
+    """
+    def summarize(previous, messages):
+        transcript = "\n\n".join(f"{m['role'].upper()}: {strip_tables(m['content'])}" for m in messages)
+        prompt = (
+            "Update this running summary of an HR policy chat with the new turns below. "
+            "Keep the employee's stated facts (band/level, role, amounts, dates) and the "
+            "policy conclusions. At most 8 short bullet points, no preamble.\n\n"
+            f"CURRENT SUMMARY:\n{previous or '(none)'}\n\nNEW TURNS:\n{transcript}"
+        )
+        try:
+            resp = client.messages.create(
+                model=model,
+                max_tokens=300,
+                temperature=0,
+                messages=[{"role": "user", "content": prompt}],
+            )
+            return resp.content[0].text.strip()
+        except Exception:
+            return summarize_locally(previous, messages)
+    return summarize
+
+
+def _summary_upto(messages, count, cache, summarize):
+    """Summary of messages[:count], reusing and extending the cached one."""
+    if count == 0:
+        return ""
+    if cache.get("count") == count:
+        return cache["text"]
+    text = summarize(cache.get("text", ""), messages[cache.get("count", 0):count])
+    cache["count"], cache["text"] = count, text
+    return text
+
+
+def build_messages(history, system_text, max_tokens, keep_turns=4, history_budget=8000,
+                   context_limit=200000, summary_cache=None, summarize=summarize_locally):
+    """Return the API messages for history under the token budgets.
+
+    history is the session's list of {"role", "content"} dicts ending with the
+    pending user question. summary_cache is a dict kept across reruns (e.g. in
+    st.session_state) so dropped turns are summarized once.
+
+    Raises ValueError if even the bare question does not fit context_limit.
+    """
+    if summary_cache is None:
+        summary_cache = {}
+    api = [{"role": "user" if m["role"] == "user" else "assistant", "content": m["content"]} for m in history]
+    user_idx = [i for i, m in enumerate(api) if m["role"] == "user"]
+    fixed = estimate_tokens(system_text) + max_tokens
+    if summary_cache.get("count", 0) > user_idx[-1]:
+        summary_cache.clear()  # a new conversation started in this session
+    summarized = summary_cache.get("count", 0)
+
+    for keep in range(min(keep_turns, len(user_idx)), 0, -1):
+        # Turns that were summarized once stay summarized, so the summary is
+        # only ever extended, never rebuilt.
+        cut = max(user_idx[-keep], summarized)
+        summary = _summary_upto(api, cut, summary_cache, summarize)
+        kept = [dict(m) for m in api[cut:]]
+        last_reply = max((i for i, m in enumerate(kept) if m["role"] == "assistant"), default=None)
+        for i, m in enumerate(kept):
+            if m["role"] == "assistant" and i != last_reply:
+                m["content"] = strip_tables(m["content"])
+        if summary:
+            kept[0]["content"] = f"{SUMMARY_HEADER}\n{summary}\n\n---\n\n{kept[0]['content']}"
+        used = sum(estimate_tokens(m["content"]) for m in kept)
+        if keep == 1 or (used <= history_budget and fixed + used <= context_limit):
+            if fixed + used <= context_limit:
+                return kept
+            break
+
+    # Last resort: the pending question on its own
+    question = dict(api[-1])
+    if fixed + estimate_tokens(question["content"]) > context_limit:
+        raise ValueError("This question is too long to answer. Please shorten it and try again.")
+    return [question]
@@ -0,0 +1,272 @@
+"""
+Exotel HR Chatbot — Knowledge Base Hot Reload
+==============================================
+Picks up edits to knowledge_base.md without a restart, and without throwing
+away everything built from the old version.
+
+HotKB.current() returns the KBSnapshot in use: the compiled prompt, the
+retrieval index, the table store, the calculator rules, the router and the
+section versions, all built from one KB text. At most every `interval`
+seconds it checks the file's mtime; when the file has changed (and has
+stopped changing for SETTLE_S seconds, so a half-written save is never
+loaded) it builds a new snapshot and swaps it in with one assignment.
+Turns already running finish on the snapshot they started with; the next
+turn of every session sees the new one.
+
+The new snapshot is built from the #/##/### heading diff against the old:
+
+  - retrieval index   only changed sections are re-tokenized
+  - table store       only tables under changed headings are re-extracted
+  - answer cache      in KB_MODE=retrieval, only answers drawn from changed
+                      sections (or the parent or siblings of an added one)
+                      are dropped; full-KB answers are all dropped
+  - prompt, calculator rules, router: rebuilt whole (a few ms each)
+
+A failed reload (unreadable file, parse error) keeps the old snapshot and
+is reported in HotKB.last_reload.
+
+Usage:
+    # Show the heading-level diff between two KB versions
+    python kb_reload.py old_knowledge_base.md knowledge_base.md
+"""
+
+import os
+import re
+import sys
+import time
+import hashlib
+import argparse
+import threading
+
+import tiers
+from calculator import load_rules
+from kb_tables import load_tables, with_band_rows
+from prompt_artifact import load_artifact
+from retrieval import KB_PATH, load_index, section_terms, split_sections
+from router import load_router
+
+POLL_INTERVAL_S = 5.0
+SETTLE_S = 1.0
+
+# Tag key of the whole-KB version that full-mode answers depend on
+KB_TAG_KEY = "knowledge base"
+
+# The " #2", " #3", ... section_versions() appends to repeated heading paths
+DUPLICATE_SUFFIX_RE = re.compile(r" #\d+$")
+
+
+# ---------------------------------------------------------------------------
+# Section versions & diff
+# ---------------------------------------------------------------------------
+def section_versions(kb_text):
+    """[(key, digest)] for every #/##/### section, in KB order.
+
+    The key is the heading path ("Exotel Leave Policy › Sick Leave"), with
+    " #2", " #3", ... appended to repeated paths; the digest covers the
+    section's text, heading line included.
+    """
+    versions = []
+    seen = {}
+    for sec in split_sections(kb_text):
+        key = " › ".join(sec["path"])
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            key = f"{key} #{seen[key]}"
+        text = kb_text[sec["start"]:sec["end"]]
+        versions.append((key, hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]))
+    return versions
+
+
+def diff_sections(old_versions, new_versions):
+    """{added, removed, changed}: section keys, in KB order."""
+    old, new = dict(old_versions), dict(new_versions)
+    return {
+        "added": [k for k, _ in new_versions if k not in old],
+        "removed": [k for k, _ in old_versions if k not in new],
+        "changed": [k for k, d in new_versions if k in old and old[k] != d],
+    }
+
+
+def tag(key, digest):
+    """Answer-cache tag for one section version."""
+    return f"{key}@{digest}"
+
+
+def _parent(key):
+    """Heading path of the section above key ("" for a top-level one)."""
+    return DUPLICATE_SUFFIX_RE.sub("", key).rpartition(" › ")[0]
+
+
+def stale_tags(old_versions, new_versions, diff):
+    """Answer-cache tags an edit makes stale.
+
+    Every old section version that changed or went away, plus, for each
+    added section, the versions of its parent and its siblings: an answer
+    drawn from those may say the KB has nothing on what it now covers.
+    """
+    new = set(new_versions)
+    stale = {tag(k, d) for k, d in old_versions if (k, d) not in new}
+    added = {_parent(k) for k in diff["added"]}
+    stale |= {tag(k, d) for k, d in old_versions
+              if DUPLICATE_SUFFIX_RE.sub("", k) in added or _parent(k) in added}
+    return frozenset(stale)
+
+
+# ---------------------------------------------------------------------------
+# Snapshot
+# ---------------------------------------------------------------------------
+class KBSnapshot:
+    """Everything built from one version of the knowledge base; never mutated."""
+
+    def __init__(self, kb_path, number=1, previous=None, term_cache=None):
+        self.number = number
+        self.prompt = load_artifact(kb_path=kb_path)
+        self.kb_text = self.prompt.kb_text
+        self.content_hash = self.prompt.content_hash
+        self.system_blocks = self.prompt.system_blocks()
+        self.versions = section_versions(self.kb_text)
+        # Full-KB answers depend on the whole text: one tag for all of it
+        self.kb_tag = tag(KB_TAG_KEY, self.content_hash[:12])
+        self.tags = frozenset(tag(k, d) for k, d in self.versions) | {self.kb_tag}
+        self.index = load_index(kb_path, self.kb_text, term_cache=term_cache)
+        self.tables = load_tables(kb_path, self.kb_text, previous_text=previous.kb_text if previous else None)
+        self.rules = load_rules(kb_text=self.kb_text)
+        self.router = load_router(kb_text=self.kb_text)
+        self.figures = tiers.kb_figures(self.kb_text)
+        self.loaded_at = time.time()
+
+    def retrieval_context(self, query, top_k=8):
+        """The KB excerpts retrieval mode sends for query (already expanded):
+        the top_k sections, plus the table rows for a band query names."""
+        return with_band_rows(self.index.context_for(query, top_k), self.tables, query)
+
+    def dependencies(self, question, top_k=8, kb_mode="full"):
+        """Answer-cache tags for the sections an answer to question draws on.
+
+        In retrieval mode these are the top_k sections retrieval ranks for
+        the (slang-expanded) question, exactly what the model was sent. A
+        full-KB answer may draw on any section, so it gets the whole-KB tag
+        and is dropped by any edit.
+        """
+        if kb_mode != "retrieval":
+            return frozenset({self.kb_tag})
+        hits = self.index.search(self.router.expand(question), top_k)
+        return frozenset(tag(*self.versions[sec["id"]]) for _, sec in hits)
+
+
+# ---------------------------------------------------------------------------
+# Watcher
+# ---------------------------------------------------------------------------
+class HotKB:
+    """The current KBSnapshot for kb_path, reloaded when the file changes.
+
+    interval=0 disables polling (current() always returns the first
+    snapshot). on_reload(diff, stale_tags), if given, is called after every
+    swap; app.py and server.py use it to invalidate the answer cache.
+    """
+
+    def __init__(self, kb_path=KB_PATH, interval=POLL_INTERVAL_S, on_reload=None):
+        self.kb_path = kb_path
+        self.interval = interval
+        self.on_reload = on_reload
+        self.reloads = 0
+        self.last_reload = None
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._stat = self._file_stat()
+        self._term_cache = {}
+        self._snapshot = KBSnapshot(kb_path, term_cache=self._term_cache)
+        if interval:
+            # Warm the per-section term cache so the first edit is incremental too
+            for sec in split_sections(self._snapshot.kb_text):
+                key = (tuple(sec["path"]), self._snapshot.kb_text[sec["start"]:sec["end"]])
+                self._term_cache.setdefault(key, section_terms(self._snapshot.kb_text, sec))
+
+    def _file_stat(self):
+        try:
+            st = os.stat(self.kb_path)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def current(self):
+        """The snapshot to answer with; checks the file at most every interval seconds."""
+        if self.interval and time.monotonic() - self._checked_at >= self.interval:
+            self.check()
+        return self._snapshot
+
+    def check(self):
+        """Reload now if the file changed; returns True if a new snapshot was swapped in."""
+        self._checked_at = time.monotonic()
+        stat = self._file_stat()
+        if stat is None or stat == self._stat or time.time() - stat[0] < SETTLE_S:
+            return False
+        # One thread rebuilds; the others keep answering from the old snapshot
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            return self._reload(stat)
+        finally:
+            self._lock.release()
+
+    def _reload(self, stat):
+        started = time.perf_counter()
+        old = self._snapshot
+        try:
+            new = KBSnapshot(self.kb_path, number=old.number + 1, previous=old, term_cache=self._term_cache)
+        except Exception as e:
+            self.last_reload = {"at": time.time(), "error": f"{type(e).__name__}: {str(e)[:200]}"}
+            return False
+        self._stat = stat
+        if new.content_hash == old.content_hash:
+            return False
+
+        diff = diff_sections(old.versions, new.versions)
+        stale = stale_tags(old.versions, new.versions, diff) | {old.kb_tag}
+        self._snapshot = new  # the swap: one reference assignment
+        self.reloads += 1
+        invalidated = self.on_reload(diff, stale) if self.on_reload else None
+        self.last_reload = {
+            "at": time.time(),
+            "number": new.number,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            "added": len(diff["added"]),
+            "removed": len(diff["removed"]),
+            "changed": diff["changed"][:20],
+            "invalidated_answers": invalidated,
+        }
+        return True
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            "kb_version": snapshot.number,
+            "content_hash": snapshot.content_hash[:16],
+            "loaded_at": round(snapshot.loaded_at, 3),
+            "reloads": self.reloads,
+            "last_reload": self.last_reload,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the heading-level diff between two KB versions")
+    parser.add_argument("old", help="Earlier knowledge base markdown")
+    parser.add_argument("new", nargs="?", default=KB_PATH, help="Current knowledge base (default: knowledge_base.md)")
+    args = parser.parse_args()
+
+    texts = []
+    for path in (args.old, args.new):
+        if not os.path.exists(path):
+            print(f"ERROR: Knowledge base not found: {path}")
+            sys.exit(1)
+        with open(path, "r", encoding="utf-8") as f:
+            texts.append(f.read())
+    old_versions, new_versions = section_versions(texts[0]), section_versions(texts[1])
+    diff = diff_sections(old_versions, new_versions)
+    print(f"\n  {len(old_versions)} → {len(new_versions)} sections")
+    for kind, mark in (("changed", "~"), ("added", "+"), ("removed", "-")):
+        for key in diff[kind]:
+            print(f"  {mark} {key}")
+    if not any(diff.values()):
+        print("  No section changed")
+    print()
@@ -0,0 +1,506 @@
+"""
+Exotel HR Chatbot — Knowledge Base Tables
+==========================================
+Extracts every markdown table in knowledge_base.md (slab tables, per diem
+and hotel limits, BGV checks, leave entitlements, ...) into typed records,
+so lookup questions can be answered or narrowed down without re-reading
+the prose.
+
+Each table keeps its policy, section and heading path; each cell is typed:
+
+  - percent    "80%", "90% - 95%"                  → 80 (max 95)
+  - currency   "INR 7,500", "₹1,500 per day", "$75",
+               "1.2L", "1.5-4 lakh"                 → 7500 INR, 1500 INR/day, ...
+  - number     "12 months", "7 days", "7,940"      → 12 months, 7 days, 7940
+  - text       anything else
+
+Rows that name job bands ("L5 and above", "L1-L4", "E1+", "ALL LEVELS")
+also get band ranges, so "credit check for L4" can be checked against
+"For L5 and above positions ONLY".
+
+The store is a SQLite file in .kb_index/, rebuilt once per KB version;
+opening it takes a few milliseconds and every lookup is an indexed query.
+
+Usage:
+    python kb_tables.py --build
+    python kb_tables.py --query "travel limit for L4"
+    python kb_tables.py --stats
+"""
+
+import os
+import re
+import sys
+import json
+import shutil
+import sqlite3
+import argparse
+from collections import Counter, defaultdict
+
+from calculator import UNIT_MULTIPLIERS, iter_tables
+from prompts import ROUTING_HEADING
+from retrieval import INDEX_DIRNAME, KB_PATH, kb_hash, split_sections, tokenize
+
+STORE_VERSION = 2
+STORE_FILENAME = "tables.sqlite"
+ROUTING_TITLE = ROUTING_HEADING.lstrip("# ")
+
+# A column is typed when at least this share of its non-empty cells agree
+COLUMN_TYPE_SHARE = 0.6
+
+# Lookup scoring: a term matching the table's policy/section/header counts
+# for more than one matching a cell, and a row whose band range covers the
+# asked band is pushed to the top.
+TABLE_TERM_WEIGHT = 2
+BAND_MATCH_BONUS = 3
+
+
+# ---------------------------------------------------------------------------
+# Cell typing
+# ---------------------------------------------------------------------------
+NUM = r"(\d[\d,]*(?:\.\d+)?)"
+UNIT = r"(k|l|lakhs?|lacs?|cr|crores?)"
+CURRENCY_RE = re.compile(r"(₹|rs\.?|inr|usd|\$)\s*" + NUM + r"(?:\s*" + UNIT + r"\b)?", re.I)
+BARE_UNIT_RE = re.compile(r"(?<![\w.])" + NUM + r"(?:\s*[-–]\s*" + NUM + r")?\s*" + UNIT + r"\b(?!\s*%)", re.I)
+PCT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+PCT_RANGE_RE = re.compile(r"^(\d+(?:\.\d+)?)\s*%\s*(?:-|–|to)\s*(\d+(?:\.\d+)?)\s*%$", re.I)
+COUNT_RE = re.compile(r"^" + NUM + r"\s*(days?|weeks?|months?|years?|hours?|nights?)?\b", re.I)
+PER_RE = re.compile(r"\bper (day|night|month|year|km)\b", re.I)
+MARKUP_RE = re.compile(r"\*\*|__|`")
+
+
+def _amount(number, unit=None):
+    value = float(number.replace(",", ""))
+    return value * UNIT_MULTIPLIERS[unit.lower()] if unit else value
+
+
+def parse_value(raw):
+    """Type one cell: {kind, value, value_max, unit}."""
+    text = MARKUP_RE.sub("", raw).strip()
+    typed = {"kind": "text", "value": None, "value_max": None, "unit": None}
+    if not text:
+        return dict(typed, kind="empty")
+
+    amounts = [(m.group(1), _amount(m.group(2), m.group(3))) for m in CURRENCY_RE.finditer(text)]
+    if amounts:
+        symbol = amounts[0][0].lower()
+        unit = "USD" if symbol in ("$", "usd") else "INR"
+    else:
+        m = BARE_UNIT_RE.search(text)
+        if m:
+            amounts = [(None, _amount(m.group(1), m.group(3)))]
+            if m.group(2):
+                amounts.append((None, _amount(m.group(2), m.group(3))))
+            unit = "INR"
+    if amounts:
+        per = PER_RE.search(text)
+        return dict(typed, kind="currency", value=amounts[0][1],
+                    value_max=amounts[-1][1] if len(amounts) > 1 else None,
+                    unit=f"{unit}/{per.group(1).lower()}" if per else unit)
+
+    m = PCT_RANGE_RE.match(text)
+    if m:
+        return dict(typed, kind="percent", value=float(m.group(1)), value_max=float(m.group(2)), unit="%")
+    m = PCT_RE.match(text)
+    if m:
+        return dict(typed, kind="percent", value=float(m.group(1)), unit="%")
+
+    m = COUNT_RE.match(text)
+    if m and (m.group(2) or m.end() == len(text)):
+        unit = m.group(2).lower().rstrip("s") if m.group(2) else None
+        return dict(typed, kind="number", value=_amount(m.group(1)), unit=unit)
+    return typed
+
+
+def column_types(rows, width):
+    """Majority kind per column ("text" when no kind has COLUMN_TYPE_SHARE)."""
+    types = []
+    for col in range(width):
+        kinds = Counter(parse_value(r[col])["kind"] for r in rows if col < len(r))
+        kinds.pop("empty", None)
+        total = sum(kinds.values())
+        kind, count = kinds.most_common(1)[0] if kinds else ("text", 0)
+        types.append(kind if total and count / total >= COLUMN_TYPE_SHARE else "text")
+    return types
+
+
+# ---------------------------------------------------------------------------
+# Job bands
+# ---------------------------------------------------------------------------
+BAND_RE = re.compile(r"\b([LE])\s?(\d{1,2})\b", re.I)
+BAND_SPAN_RE = re.compile(
+    r"\b([LE])(\d{1,2})\s*(?:-|–|to)\s*[LE]?(\d{1,2})(\+)?"   # L1-L4, L1-L8+
+    r"|\b([LE])(\d{1,2})(?:\s*\+|\s+and\s+above)"            # E1+, L5 and above
+    r"|\b(?:below|under)\s+([LE])(\d{1,2})\b",               # below L5
+    re.I,
+)
+ALL_LEVELS_RE = re.compile(r"\ball (?:levels|bands|employees)\b", re.I)
+TOP_BAND = 99
+
+
+def band_ranges(text):
+    """[(prefix, lo, hi)] named in text; prefix "*" for "ALL LEVELS"."""
+    text = MARKUP_RE.sub("", text)
+    ranges = []
+    for m in BAND_SPAN_RE.finditer(text):
+        if m.group(1):
+            ranges.append((m.group(1).upper(), int(m.group(2)), TOP_BAND if m.group(4) else int(m.group(3))))
+        elif m.group(5):
+            ranges.append((m.group(5).upper(), int(m.group(6)), TOP_BAND))
+        else:
+            ranges.append((m.group(7).upper(), 0, int(m.group(8)) - 1))
+    if not ranges and ALL_LEVELS_RE.search(text):
+        ranges.append(("*", 0, TOP_BAND))
+    return ranges
+
+
+def question_band(question):
+    """("L", 4) for "travel limit for L4", else None."""
+    m = BAND_RE.search(question)
+    return (m.group(1).upper(), int(m.group(2))) if m else None
+
+
+# ---------------------------------------------------------------------------
+# Extraction & build
+# ---------------------------------------------------------------------------
+def extract_tables(kb_text, sections=None, first_id=0):
+    """Every table in the KB (or in the given sections) as a typed record, in KB order."""
+    tables = []
+    for sec in split_sections(kb_text) if sections is None else sections:
+        body = kb_text[sec["start"]:sec["end"]]
+        for header, rows in iter_tables(body):
+            width = len(header)
+            rows = [r + [""] * (width - len(r)) if len(r) < width else r[:width] for r in rows]
+            tables.append({
+                "id": first_id + len(tables),
+                "policy": sec["path"][0],
+                "section": sec["title"],
+                "path": sec["path"],
+                "start": sec["start"],
+                "header": header,
+                "column_types": column_types(rows, width),
+                "rows": [[dict(parse_value(cell), raw=cell) for cell in row] for row in rows],
+                "bands": [band_ranges(" ".join(row)) for row in rows],
+            })
+    return tables
+
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE tables (
+    id INTEGER PRIMARY KEY, policy TEXT NOT NULL, section TEXT NOT NULL, path TEXT NOT NULL,
+    start INTEGER NOT NULL, header TEXT NOT NULL, column_types TEXT NOT NULL, row_count INTEGER NOT NULL);
+CREATE TABLE cells (
+    table_id INTEGER NOT NULL, row INTEGER NOT NULL, col INTEGER NOT NULL, raw TEXT NOT NULL,
+    kind TEXT NOT NULL, value REAL, value_max REAL, unit TEXT);
+CREATE TABLE bands (table_id INTEGER NOT NULL, row INTEGER NOT NULL, prefix TEXT NOT NULL,
+    lo INTEGER NOT NULL, hi INTEGER NOT NULL);
+CREATE TABLE terms (term TEXT NOT NULL, table_id INTEGER NOT NULL, row INTEGER NOT NULL);
+CREATE INDEX cells_row ON cells (table_id, row);
+CREATE INDEX cells_value ON cells (kind, value);
+CREATE INDEX bands_row ON bands (table_id, row);
+CREATE INDEX terms_term ON terms (term);
+CREATE INDEX tables_policy ON tables (policy);
+"""
+
+
+def build_store(kb_text, path):
+    """Extract kb_text's tables into a fresh SQLite file at path."""
+    tables = extract_tables(kb_text)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                         [("version", str(STORE_VERSION)), ("kb_hash", kb_hash(kb_text))])
+        for t in tables:
+            _insert_table(conn, t)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return tables
+
+
+def _insert_table(conn, t):
+    conn.execute("INSERT INTO tables VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (
+        t["id"], t["policy"], t["section"], json.dumps(t["path"], ensure_ascii=False), t["start"],
+        json.dumps(t["header"], ensure_ascii=False), json.dumps(t["column_types"]), len(t["rows"])))
+    # Row -1 carries the table-level terms (policy, section path, header)
+    table_terms = set(tokenize(" ".join(t["path"] + t["header"])))
+    conn.executemany("INSERT INTO terms VALUES (?, ?, -1)", [(term, t["id"]) for term in table_terms])
+    for r, row in enumerate(t["rows"]):
+        conn.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [
+            (t["id"], r, c, cell["raw"], cell["kind"], cell["value"], cell["value_max"], cell["unit"])
+            for c, cell in enumerate(row)])
+        conn.executemany("INSERT INTO bands VALUES (?, ?, ?, ?, ?)",
+                         [(t["id"], r, *band) for band in t["bands"][r]])
+        row_terms = set(tokenize(" ".join(cell["raw"] for cell in row))) - table_terms
+        conn.executemany("INSERT INTO terms VALUES (?, ?, ?)", [(term, t["id"], r) for term in row_terms])
+
+
+def _sections_by_path(kb_text):
+    grouped = defaultdict(list)
+    for sec in split_sections(kb_text):
+        grouped[json.dumps(sec["path"], ensure_ascii=False)].append(sec)
+    return grouped
+
+
+def update_store(old_text, kb_text, path):
+    """Bring a store built from old_text up to date with kb_text.
+
+    Only tables under headings whose text changed are dropped and
+    re-extracted; the rest keep their rows and just get their new offsets.
+    The update is made on a copy that then replaces the file, so open
+    TableStores keep reading the old version. Returns the number of tables
+    re-extracted.
+    """
+    old, new = _sections_by_path(old_text), _sections_by_path(kb_text)
+
+    def texts(text, secs):
+        return [text[s["start"]:s["end"]] for s in secs]
+
+    changed = {p for p in set(old) | set(new)
+               if texts(old_text, old.get(p, [])) != texts(kb_text, new.get(p, []))}
+
+    tmp = f"{path}.tmp"
+    shutil.copyfile(path, tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        stale = [(table_id,) for table_id, table_path in conn.execute("SELECT id, path FROM tables")
+                 if table_path in changed]
+        for table in ("cells", "bands", "terms"):
+            conn.executemany(f"DELETE FROM {table} WHERE table_id = ?", stale)
+        conn.executemany("DELETE FROM tables WHERE id = ?", stale)
+
+        # Unchanged headings: same sections in the same order, only moved
+        moves = []
+        for table_id, table_path, start in conn.execute("SELECT id, path, start FROM tables"):
+            starts = [s["start"] for s in old[table_path]]
+            moves.append((new[table_path][starts.index(start)]["start"], table_id))
+        conn.executemany("UPDATE tables SET start = ? WHERE id = ?", moves)
+
+        next_id = (conn.execute("SELECT MAX(id) FROM tables").fetchone()[0] or 0) + 1
+        sections = sorted((s for p in changed for s in new.get(p, [])), key=lambda s: s["start"])
+        tables = extract_tables(kb_text, sections, first_id=next_id)
+        for t in tables:
+            _insert_table(conn, t)
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'kb_hash'", (kb_hash(kb_text),))
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return len(tables)
+
+
+# ---------------------------------------------------------------------------
+# Store & lookup
+# ---------------------------------------------------------------------------
+class TableStore:
+    """Read-only view of the tables SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        # Read-only and never written after build, so one connection can
+        # serve Streamlit's session threads and the server's event loop.
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+    def tables(self, policy=None):
+        """[{id, policy, section, path, start, header, column_types, row_count}], in KB order."""
+        sql = "SELECT id, policy, section, path, start, header, column_types, row_count FROM tables"
+        args = ()
+        if policy:
+            sql += " WHERE policy = ?"
+            args = (policy,)
+        return [
+            {"id": i, "policy": p, "section": s, "path": json.loads(pa), "start": st, "header": json.loads(h),
+             "column_types": json.loads(ct), "row_count": n}
+            for i, p, s, pa, st, h, ct, n in self.conn.execute(sql + " ORDER BY start, id", args)
+        ]
+
+    def row(self, table_id, row):
+        """[{raw, kind, value, value_max, unit}] for one row, in column order."""
+        return [
+            {"raw": raw, "kind": kind, "value": value, "value_max": value_max, "unit": unit}
+            for raw, kind, value, value_max, unit in self.conn.execute(
+                "SELECT raw, kind, value, value_max, unit FROM cells WHERE table_id = ? AND row = ? ORDER BY col",
+                (table_id, row))
+        ]
+
+    def band_applies(self, table_id, row, band):
+        """True/False if the row names job bands and band is/isn't covered; None otherwise."""
+        ranges = self.conn.execute("SELECT prefix, lo, hi FROM bands WHERE table_id = ? AND row = ?",
+                                   (table_id, row)).fetchall()
+        if not ranges:
+            return None
+        prefix, level = band
+        return any(p in ("*", prefix) and lo <= level <= hi for p, lo, hi in ranges)
+
+    def lookup(self, question, limit=5, include_guide=False):
+        """Table rows most relevant to question, best first.
+
+        Each match: {policy, section, path, header, cells, band_applies, score}.
+        A row scores TABLE_TERM_WEIGHT per question term found in its table's
+        policy/section/header, 1 per term found in its own cells, and
+        BAND_MATCH_BONUS if it covers the band the question names. Rows of
+        tables that match on neither need at least two cell terms.
+        """
+        terms = sorted(set(tokenize(question)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        table_hits, row_hits = Counter(), Counter()
+        for table_id, row, _ in self.conn.execute(
+                f"SELECT DISTINCT table_id, row, term FROM terms WHERE term IN ({placeholders})", terms):
+            if row < 0:
+                table_hits[table_id] += 1
+            else:
+                row_hits[(table_id, row)] += 1
+
+        meta = {t["id"]: t for t in self.tables()}
+        candidates = defaultdict(int)
+        for table_id, hits in table_hits.items():
+            for r in range(meta[table_id]["row_count"]):
+                candidates[(table_id, r)] += TABLE_TERM_WEIGHT * hits
+        for key, hits in row_hits.items():
+            if key in candidates or hits >= 2:
+                candidates[key] += hits
+
+        band = question_band(question)
+        matches = []
+        for (table_id, r), score in candidates.items():
+            t = meta[table_id]
+            if t["policy"] == ROUTING_TITLE and not include_guide:
+                continue
+            applies = self.band_applies(table_id, r, band) if band else None
+            if applies:
+                score += BAND_MATCH_BONUS
+            matches.append({
+                "table_id": table_id, "row": r, "policy": t["policy"], "section": t["section"],
+                "path": t["path"], "start": t["start"], "header": t["header"], "band_applies": applies,
+                "score": score,
+            })
+        matches.sort(key=lambda m: (-m["score"], m["start"], m["table_id"], m["row"]))
+        for m in matches[:limit]:
+            m["cells"] = self.row(m["table_id"], m["row"])
+        return matches[:limit]
+
+    def context_for(self, question, limit=8):
+        """Matching rows as compact markdown tables grouped by section, or "".
+
+        Rows that do not cover the band the question names are left out.
+        """
+        groups = defaultdict(list)
+        matches = [m for m in self.lookup(question, limit) if m["band_applies"] is not False]
+        for m in sorted(matches, key=lambda m: (m["start"], m["table_id"], m["row"])):
+            groups[m["table_id"]].append(m)
+        parts = []
+        for rows in groups.values():
+            first = rows[0]
+            lines = [f"*From: {' › '.join(first['path'])}*", "",
+                     "| " + " | ".join(first["header"]) + " |", "|" + "-|" * len(first["header"])]
+            lines += ["| " + " | ".join(c["raw"] for c in m["cells"]) + " |" for m in rows]
+            parts.append("\n".join(lines))
+        return "\n\n".join(parts)
+
+
+def with_band_rows(context, tables, question, limit=8):
+    """Retrieval context plus the table rows for the band question names.
+
+    A band lookup ("travel limit for L4") can rank the section holding the
+    band's row below top_k; its rows are appended so the figure is always
+    in the prompt. Questions that name no band get context unchanged.
+    """
+    if question_band(question) is None:
+        return context
+    rows = tables.context_for(question, limit)
+    if not rows:
+        return context
+    return f"{context}\n\n---\n\nTable rows for the band in the question:\n\n{rows}"
+
+
+_LOADED = {}
+
+
+def load_tables(kb_path=KB_PATH, kb_text=None, previous_text=None):
+    """The table store for the KB at kb_path, rebuilt first if stale.
+
+    Loaded stores are kept per process, so repeated calls are free. If the
+    file on disk was built from previous_text, only the changed headings'
+    tables are rebuilt (update_store).
+    """
+    if kb_text is None:
+        with open(kb_path, "r", encoding="utf-8") as f:
+            kb_text = f.read()
+    digest = kb_hash(kb_text)
+    path = os.path.join(os.path.dirname(os.path.abspath(kb_path)), INDEX_DIRNAME, STORE_FILENAME)
+    cache_key = (path, digest)
+    if cache_key in _LOADED:
+        return _LOADED[cache_key]
+
+    meta = {}
+    if os.path.exists(path):
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            conn.close()
+        except sqlite3.Error:
+            meta = {}
+    if meta.get("version") != str(STORE_VERSION):
+        build_store(kb_text, path)
+    elif meta.get("kb_hash") != digest:
+        if previous_text is not None and meta.get("kb_hash") == kb_hash(previous_text):
+            update_store(previous_text, kb_text, path)
+        else:
+            build_store(kb_text, path)
+
+    store = TableStore(path)
+    _LOADED[cache_key] = store
+    return store
+
+
+def format_cell(cell):
+    if cell["kind"] in ("empty", "text"):
+        return cell["raw"]
+    value = f"{cell['value']:g}" + (f"–{cell['value_max']:g}" if cell["value_max"] is not None else "")
+    if cell["unit"] == "%":
+        return f"{value}%"
+    return f"{value} {cell['unit']}" if cell["unit"] else value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract, store and query the KB's tables")
+    parser.add_argument("--kb", default=KB_PATH, help="Path to the knowledge base markdown")
+    parser.add_argument("--build", action="store_true", help="Rebuild the table store from scratch")
+    parser.add_argument("--query", help="Show the table rows matching a question")
+    parser.add_argument("--limit", type=int, default=5, help="Rows to return for --query")
+    parser.add_argument("--stats", action="store_true", help="Tables, rows and column types per policy")
+    args = parser.parse_args()
+
+    if not (args.build or args.query or args.stats):
+        parser.print_help()
+        sys.exit(1)
+
+    with open(args.kb, "r", encoding="utf-8") as f:
+        text = f.read()
+    if args.build:
+        store_path = os.path.join(os.path.dirname(os.path.abspath(args.kb)), INDEX_DIRNAME, STORE_FILENAME)
+        built = build_store(text, store_path)
+        print(f"Extracted {len(built)} tables, {sum(len(t['rows']) for t in built)} rows → {store_path}")
+    store = load_tables(args.kb, text)
+    if args.stats:
+        by_policy = defaultdict(list)
+        for t in store.tables():
+            by_policy[t["policy"]].append(t)
+        for policy, tables in by_policy.items():
+            kinds = Counter(k for t in tables for k in t["column_types"])
+            print(f"  {len(tables):>3} tables {sum(t['row_count'] for t in tables):>4} rows  {policy[:50]:<50} "
+                  + ", ".join(f"{k} {n}" for k, n in kinds.most_common()))
+    if args.query:
+        band = question_band(args.query)
+        for m in store.lookup(args.query, args.limit):
+            note = "" if m["band_applies"] is None else f"  [{band[0]}{band[1]}: {'applies' if m['band_applies'] else 'does not apply'}]"
+            print(f"  {m['score']:>3}  {' › '.join(m['path'])}{note}")
+            print("       " + " | ".join(f"{h}: {format_cell(c)}" for h, c in zip(m["header"], m["cells"])))
@@ -0,0 +1,176 @@
+"""
+Exotel HR Chatbot — Per-Turn Performance & Cost Ledger
+=======================================================
+Appends one JSON line per answered turn: wall-clock latency, time to first
+token, input/output/cache tokens, estimated cost, model, error class and
+question category. rolling_stats() turns the recent tail of the ledger into
+the p50/p95 latency, token spend per hour and cache hit rate shown in the
+admin panel.
+
+Every worker appends to the same file; each record is a single write() of
+one line, so concurrent appends do not interleave.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+
+from telemetry import USAGE_FIELDS, cache_hit_rate, usage_fields
+
+# USD per million tokens: (input, output). Cache writes bill at 1.25× input
+# and cache reads at 0.1× input. First matching model-name prefix wins.
+PRICING = [
+    ("claude-opus-4-5", (5.00, 25.00)),
+    ("claude-opus-4", (15.00, 75.00)),
+    ("claude-3-opus", (15.00, 75.00)),
+    ("claude-sonnet-4", (3.00, 15.00)),
+    ("claude-3-7-sonnet", (3.00, 15.00)),
+    ("claude-3-5-sonnet", (3.00, 15.00)),
+    ("claude-haiku-4", (1.00, 5.00)),
+    ("claude-3-5-haiku", (0.80, 4.00)),
+    ("claude-3-haiku", (0.25, 1.25)),
+]
+DEFAULT_PRICING = (3.00, 15.00)
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.10
+BATCH_DISCOUNT = 0.50  # Message Batches bill every token at half price
+
+CATEGORIES = [
+    ("variable_pay", r"variable|incentive|\bob\b|\bgp\b|nrgp|order booking|gross profit|payout|iplv|cplv|slab|bonus"),
+    ("lease", r"lease|\bemi\b|supplementary allowance|automint"),
+    ("salary_advance", r"advance|loan|borrow|need money"),
+    ("leave", r"leave|sabbatical|lwp|comp ?off|holiday|vacation|carry forward"),
+    ("travel", r"travel|reimburse|claim|flight|hotel|per diem|dinner|entertainment"),
+    ("referral", r"referr?al|refer\b"),
+    ("bgv", r"\bbgv\b|background|verification"),
+    ("posh", r"posh|harass|improper|inappropriate"),
+    ("separation", r"resign|notice|f&f|full and final|separation|exit|relieving|terminat"),
+    ("conduct", r"conflict|conduct|moonlight|side|influencer|disclos"),
+    ("ijp_pip", r"\bijp\b|internal job|\bpip\b|performance improvement"),
+]
+
+
+def estimate_cost(model, usage):
+    """Estimated USD cost of one call from its token usage."""
+    price_in, price_out = next((p for prefix, p in PRICING if model.startswith(prefix)), DEFAULT_PRICING)
+    u = usage_fields(usage)
+    cost = (
+        u["input_tokens"] * price_in
+        + u["cache_creation_input_tokens"] * price_in * CACHE_WRITE_MULTIPLIER
+        + u["cache_read_input_tokens"] * price_in * CACHE_READ_MULTIPLIER
+        + u["output_tokens"] * price_out
+    )
+    return round(cost / 1_000_000, 6)
+
+
+def categorize(question):
+    """Coarse policy category for a question, for per-category reporting."""
+    q = question.lower()
+    for name, pattern in CATEGORIES:
+        if re.search(pattern, q):
+            return name
+    return "other"
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+class TurnLedger:
+    """Append-only JSONL ledger of answered turns."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, *, model, source, latency_s, ttft_s=None, usage=None, error=None,
+               category=None, session=None, **extra):
+        """Write one turn. source is "model", "cache", "calculator", "router" or "coalesced"."""
+        fields = usage_fields(usage)
+        entry = {
+            "ts": round(time.time(), 3),
+            "session": session,
+            "source": source,
+            "model": model if source == "model" else None,
+            "category": category,
+            "latency_s": round(latency_s, 4),
+            "ttft_s": round(ttft_s, 4) if ttft_s is not None else None,
+            **fields,
+            "cost_usd": estimate_cost(model, fields) if source == "model" else 0.0,
+            "error": error,
+            **extra,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+        return entry
+
+    def read_recent(self, window_s=24 * 3600, max_bytes=8 * 1024 * 1024):
+        """Records from the last window_s seconds (reads at most max_bytes of tail)."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - max_bytes))
+            data = f.read().decode("utf-8", errors="ignore")
+        if size > max_bytes:
+            data = data.split("\n", 1)[-1]  # drop the partial first line
+        cutoff = time.time() - window_s
+        records = []
+        for line in data.splitlines():
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get("ts", 0) >= cutoff:
+                records.append(rec)
+        return records
+
+
+def rolling_stats(records):
+    """Summary used by the admin panel and for capacity planning."""
+    model_turns = [r for r in records if r.get("source") == "model"]
+    ok_turns = [r for r in model_turns if not r.get("error")]
+    latencies = [r["latency_s"] for r in ok_turns]
+    ttfts = [r["ttft_s"] for r in ok_turns if r.get("ttft_s") is not None]
+    totals = {field: sum(r.get(field) or 0 for r in model_turns) for field in USAGE_FIELDS}
+
+    per_hour = {}
+    for r in model_turns:
+        hour = time.strftime("%Y-%m-%d %H:00", time.localtime(r["ts"]))
+        bucket = per_hour.setdefault(hour, {"input": 0, "output": 0, "cost_usd": 0.0})
+        bucket["input"] += (r.get("input_tokens") or 0) + (r.get("cache_creation_input_tokens") or 0) \
+            + (r.get("cache_read_input_tokens") or 0)
+        bucket["output"] += r.get("output_tokens") or 0
+        bucket["cost_usd"] += r.get("cost_usd") or 0.0
+
+    return {
+        "turns": len(records),
+        "model_calls": len(model_turns),
+        "local_answers": sum(1 for r in records if r.get("source") == "calculator"),
+        "cached_answers": sum(1 for r in records if r.get("source") == "cache"),
+        "routed_answers": sum(1 for r in records if r.get("source") == "router"),
+        "coalesced_answers": sum(1 for r in records if r.get("source") == "coalesced"),
+        "errors": sum(1 for r in records if r.get("error")),
+        "retried_turns": sum(1 for r in model_turns if r.get("retries")),
+        "hedged_turns": sum(1 for r in model_turns if r.get("hedged")),
+        "queued_turns": sum(1 for r in model_turns if r.get("queued_s")),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p95": percentile(ttfts, 95),
+        "cache_hit_rate": cache_hit_rate(totals),
+        "cost_usd": sum(r.get("cost_usd") or 0.0 for r in records),
+        "tokens_per_hour": dict(sorted(per_hour.items())),
+    }
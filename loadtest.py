@@ -0,0 +1,357 @@
+"""
+Exotel HR Chatbot — Load Test
+==============================
+Simulates many employees chatting at once and reports how throughput,
+latency, errors and token spend change with load, so we know how much
+traffic one deployment takes before latency collapses (appraisal week,
+variable-pay week).
+
+Each virtual employee replays a conversation script drawn from a weighted
+mix:
+  quick     a quick-action card question (prompts.QUICK_QUESTIONS)
+  policy    a single validate.py question
+  calc      a single calculation question (variable pay, lease, advance)
+  followup  a multi-turn conversation with short follow-ups
+
+Two load models, each run as a series of steps to draw a curve:
+  open loop    new sessions arrive as a Poisson process at R sessions/s,
+               regardless of how slowly earlier ones are served
+  closed loop  N employees each start a new session as soon as the
+               previous one finishes (plus think time)
+
+Usage:
+    # Against the headless API (server.py)
+    python loadtest.py --url http://localhost:8080 --open 0.5,1,2,4 --duration 60
+
+    # Against the Messages API or the offline stand-in (fake_anthropic.py)
+    export ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=test
+    python loadtest.py --api --closed 1,5,10,20 --duration 30
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import history
+import prompts
+from fake_anthropic import parse_distribution
+from ledger import categorize, estimate_cost, percentile
+from prompt_artifact import load_artifact
+from telemetry import usage_fields
+from validate import TEST_CASES
+
+MAX_TOKENS = 2048
+DEFAULT_MIX = "quick=0.3,policy=0.35,calc=0.15,followup=0.2"
+CALC_CATEGORIES = ("variable_pay", "lease", "salary_advance")
+
+FOLLOW_UP_SCRIPTS = [
+    ["What leave types are available and how many days for each?",
+     "What about carry forward?",
+     "How many can I encash when I leave?"],
+    ["How does the device lease work? What are the EMI limits?",
+     "My supplementary allowance is 12000, what's my max device lease EMI?",
+     "Can I take a car lease as well?"],
+    ["What is the travel reimbursement policy for domestic and international?",
+     "What about for L4?",
+     "Can I upgrade my flight seat?"],
+    ["I am in need of money, can I avail my CPLV now?",
+     "What about a salary advance instead?",
+     "My fixed CTC is 6 lakh per annum, how much advance can I take?"],
+    ["What are the OB attainment slabs for sales incentives?",
+     "If my OB attainment is 85%, what payout percentage do I get?"],
+    ["I have recently joined Exotel at E1 level, what are the BGV checks applicable for me?",
+     "What happens if my previous employer does not respond?"],
+]
+
+
+def build_scripts():
+    """Conversation scripts (lists of user turns) by kind."""
+    calc = [tc for tc in TEST_CASES
+            if any(ch.isdigit() for ch in tc["question"]) and categorize(tc["question"]) in CALC_CATEGORIES]
+    policy = [tc for tc in TEST_CASES if tc not in calc]
+    return {
+        "quick": [[q[3]] for q in prompts.QUICK_QUESTIONS],
+        "policy": [[tc["question"]] for tc in policy],
+        "calc": [[tc["question"]] for tc in calc],
+        "followup": FOLLOW_UP_SCRIPTS,
+    }
+
+
+def parse_mix(spec, kinds):
+    """{"quick": 0.3, ...} from "quick=0.3,policy=0.35,..."."""
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        if kind.strip() not in kinds:
+            raise ValueError(f"Unknown script kind {kind!r} (use {', '.join(kinds)})")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+# ---------------------------------------------------------------------------
+# Targets: async conversation -> (answer, usage dict or None, ttft seconds or None)
+# ---------------------------------------------------------------------------
+def make_chat_target(base_url, connections):
+    """POST to server.py's /chat, streamed so time to first token is measured."""
+    import httpx
+
+    http = httpx.AsyncClient(
+        base_url=base_url.rstrip("/"),
+        timeout=120,
+        limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+    )
+
+    async def ask(conversation):
+        started = time.perf_counter()
+        ttft = None
+        parts, usage = [], None
+        body = {"message": conversation[-1]["content"], "history": conversation[:-1], "stream": True}
+        async with http.stream("POST", "/chat", json=body) as r:
+            if r.status_code != 200:
+                await r.aread()
+                raise RuntimeError(f"HTTP {r.status_code}")
+            event = None
+            async for line in r.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    data = json.loads(line[6:])
+                    if event == "delta":
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        parts.append(data["text"])
+                    elif event == "done":
+                        usage = data.get("usage")
+                    elif event == "error":
+                        raise RuntimeError(data.get("error", "stream error"))
+        return "".join(parts), usage, ttft
+
+    return ask, http.aclose
+
+
+def make_api_target(model, connections):
+    """Call the Messages API directly (or the stand-in at ANTHROPIC_BASE_URL)."""
+    import httpx
+    from anthropic import AsyncAnthropic
+
+    client = AsyncAnthropic(
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=120,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+        ),
+    )
+    prompt = load_artifact()
+    system = prompt.system_blocks()
+    system_text = prompt.system_text
+
+    async def ask(conversation):
+        started = time.perf_counter()
+        ttft = None
+        parts = []
+        async with client.messages.stream(
+            model=model,
+            max_tokens=MAX_TOKENS,
+            temperature=0.2,
+            system=system,
+            messages=history.build_messages(conversation, system_text, MAX_TOKENS),
+        ) as stream:
+            async for text in stream.text_stream:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(text)
+            message = await stream.get_final_message()
+        return "".join(parts), usage_fields(message.usage), ttft
+
+    return ask, client.close
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+class LoadRun:
+    """One load step: picks scripts, runs sessions and collects per-turn samples."""
+
+    def __init__(self, ask, scripts, mix, think, rng):
+        self.ask = ask
+        self.scripts = scripts
+        self.kinds = list(mix)
+        self.weights = [mix[k] for k in self.kinds]
+        self.think = think
+        self.rng = rng
+        self.turns = []
+
+    async def session(self, deadline):
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        script = self.rng.choice(self.scripts[kind])
+        conversation = []
+        for i, question in enumerate(script):
+            if i and time.monotonic() >= deadline:
+                break
+            conversation.append({"role": "user", "content": question})
+            sample = {"kind": kind, "start": time.monotonic(), "ok": False, "usage": None, "ttft_s": None}
+            try:
+                answer, usage, ttft = await self.ask(conversation)
+                sample.update(ok=True, usage=usage, ttft_s=ttft)
+            except Exception as e:
+                answer = ""
+                sample["error"] = type(e).__name__
+            sample["latency_s"] = time.monotonic() - sample["start"]
+            self.turns.append(sample)
+            if not sample["ok"]:
+                break  # an employee who gets an error gives up on the conversation
+            conversation.append({"role": "assistant", "content": answer})
+            if i < len(script) - 1:
+                await asyncio.sleep(self.think(self.rng))
+
+    async def open_loop(self, rate, duration):
+        """Poisson arrivals at rate sessions/s for duration s; then drain."""
+        deadline = time.monotonic() + duration
+        tasks = []
+        while True:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            if time.monotonic() >= deadline:
+                break
+            tasks.append(asyncio.create_task(self.session(deadline)))
+        await asyncio.gather(*tasks)
+
+    async def closed_loop(self, users, duration):
+        """users employees, each starting a new session when the last ends."""
+        deadline = time.monotonic() + duration
+
+        async def employee():
+            # Stagger the first sessions over one think time
+            await asyncio.sleep(self.rng.uniform(0, self.think(self.rng)))
+            while time.monotonic() < deadline:
+                await self.session(deadline)
+                await asyncio.sleep(self.think(self.rng))
+
+        await asyncio.gather(*(employee() for _ in range(users)))
+
+
+def summarize(turns, wall_s, model):
+    ok = [t for t in turns if t["ok"]]
+    latencies = [t["latency_s"] for t in ok]
+    ttfts = [t["ttft_s"] for t in ok if t["ttft_s"] is not None]
+    usages = [usage_fields(t["usage"]) for t in ok if t["usage"]]
+    tokens = sum(sum(u.values()) for u in usages)
+    cost = sum(estimate_cost(model, u) for u in usages)
+    minutes = wall_s / 60 if wall_s else 1
+
+    def pct(values, p):
+        value = percentile(values, p)
+        return round(value, 3) if value is not None else None
+
+    return {
+        "turns": len(turns),
+        "errors": len(turns) - len(ok),
+        "error_rate": round((len(turns) - len(ok)) / len(turns), 4) if turns else 0.0,
+        "throughput_tps": round(len(ok) / wall_s, 3) if wall_s else 0.0,
+        "latency_p50": pct(latencies, 50),
+        "latency_p95": pct(latencies, 95),
+        "latency_p99": pct(latencies, 99),
+        "ttft_p50": pct(ttfts, 50),
+        "ttft_p95": pct(ttfts, 95),
+        "tokens_per_min": round(tokens / minutes),
+        "cost_per_min_usd": round(cost / minutes, 4),
+        "by_kind": {kind: sum(1 for t in turns if t["kind"] == kind) for kind in sorted({t["kind"] for t in turns})},
+    }
+
+
+async def run_steps(ask, steps, scripts, mix, think, duration, seed, model):
+    results = []
+    for mode, load in steps:
+        run = LoadRun(ask, scripts, mix, think, random.Random(seed))
+        started = time.monotonic()
+        if mode == "open":
+            await run.open_loop(load, duration)
+        else:
+            await run.closed_loop(int(load), duration)
+        wall = time.monotonic() - started
+        step = {"mode": mode, "load": load, "wall_s": round(wall, 2), **summarize(run.turns, wall, model)}
+        results.append(step)
+        print_row(step)
+    return results
+
+
+def print_row(step):
+    def secs(value):
+        return f"{value:6.2f}" if value is not None else "     —"
+
+    load = f"{step['load']:g}/s" if step["mode"] == "open" else f"{step['load']:g} users"
+    print(f"  {step['mode']:<6} {load:>9}  {step['turns']:>5}  {step['throughput_tps']:>6.2f}  "
+          f"{secs(step['latency_p50'])} {secs(step['latency_p95'])} {secs(step['latency_p99'])}  "
+          f"{secs(step['ttft_p50'])} {secs(step['ttft_p95'])}  {100 * step['error_rate']:>5.1f}%  "
+          f"{step['tokens_per_min']:>9,}  {step['cost_per_min_usd']:>7.4f}")
+
+
+def parse_steps(spec):
+    return [float(x) for x in spec.split(",") if x.strip()] if spec else []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the Exotel HR Chatbot")
+    parser.add_argument("--url", help="Base URL of server.py (POST /chat)")
+    parser.add_argument("--api", action="store_true",
+                        help="Call the Messages API directly (honours ANTHROPIC_BASE_URL)")
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", "claude-sonnet-4-5-20250929"),
+                        help="Model for --api, and for cost estimates")
+    parser.add_argument("--open", help="Open-loop steps: session arrival rates per second, e.g. 0.5,1,2,4")
+    parser.add_argument("--closed", help="Closed-loop steps: concurrent employees, e.g. 1,5,10,20")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds per step (default: 60)")
+    parser.add_argument("--think", default="exp:3",
+                        help='Think time between turns, e.g. "exp:3", "uniform:2,8" (default: exp:3)')
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Script mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size (default: 100)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for arrivals, scripts and think times")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "loadtest_results.json"),
+                        help="Where to write the JSON report (default: loadtest_results.json)")
+    args = parser.parse_args()
+
+    steps = [("open", r) for r in parse_steps(args.open)] + [("closed", n) for n in parse_steps(args.closed)]
+    if not (args.url or args.api) or not steps:
+        print("ERROR: Provide a target (--url or --api) and at least one of --open / --closed")
+        print("  Example: python loadtest.py --url http://localhost:8080 --open 0.5,1,2 --duration 60")
+        sys.exit(1)
+
+    scripts = build_scripts()
+    try:
+        mix = parse_mix(args.mix, scripts)
+        think = parse_distribution(args.think)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    async def main():
+        if args.url:
+            ask, close = make_chat_target(args.url, args.connections)
+        else:
+            ask, close = make_api_target(args.model, args.connections)
+        try:
+            return await run_steps(ask, steps, scripts, mix, think, args.duration, args.seed, args.model)
+        finally:
+            await close()
+
+    print(f"\n{'='*106}")
+    print(f"  LOAD TEST — {args.url or 'Messages API'} — {args.duration:g}s per step, mix {args.mix}")
+    print(f"{'='*106}")
+    print(f"  {'mode':<6} {'load':>9}  {'turns':>5}  {'thru/s':>6}  {'p50':>6} {'p95':>6} {'p99':>6}  "
+          f"{'ttft50':>6} {'ttft95':>6}  {'errors':>6}  {'tokens/min':>9}  {'$/min':>7}")
+    results = asyncio.run(main())
+    print(f"{'='*106}")
+
+    with open(args.out, "w") as f:
+        json.dump({
+            "target": args.url or "api",
+            "model": args.model,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "think": args.think,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "steps": results,
+        }, f, indent=2)
+    print(f"  Results saved to: {args.out}\n")
@@ -0,0 +1,214 @@
+"""
+Exotel HR Chatbot — Compiled Prompt Artifact
+=============================================
+Compiles the system rules (prompts.py) and the knowledge base into one
+versioned JSON artifact:
+
+  - content_hash   sha256 of rules + KB; the prompt's identity everywhere
+                   (answer-cache keys, cassettes, /healthz)
+  - system_text    the full system prompt, with the offsets and token counts
+                   of each cached segment (rules, routing guide, corpus)
+  - kb             the knowledge base, with the offsets and token counts of
+                   every #/##/### section
+
+app.py, server.py, validate.py and loadtest.py all load it through
+load_artifact(), once per process, so the validator can never test a
+different prompt from the one production sends.
+
+    python prompt_artifact.py                 # build / refresh .kb_index/prompt.json
+    python prompt_artifact.py --check         # exit 1 if the artifact is stale (CI)
+    python prompt_artifact.py --count-tokens  # exact token counts via the API
+
+Token counts are estimates (history.estimate_tokens) unless built with
+--count-tokens.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+import prompts
+from history import estimate_tokens
+from retrieval import INDEX_DIRNAME, KB_PATH, kb_hash, split_sections
+
+ARTIFACT_VERSION = 1
+ARTIFACT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), INDEX_DIRNAME, "prompt.json")
+
+_LOADED = {}  # artifact path -> PromptArtifact
+
+
+def artifact_path_for(kb_path):
+    """.kb_index/prompt.json for the default KB, prompt-<name>.json for others.
+
+    Keeps one artifact per KB file, so validating an alternative KB (e.g. the
+    compact_kb.py output) doesn't recompile the production one.
+    """
+    if os.path.abspath(kb_path) == os.path.abspath(KB_PATH):
+        return ARTIFACT_PATH
+    name = os.path.splitext(os.path.basename(kb_path))[0]
+    return os.path.join(os.path.dirname(ARTIFACT_PATH), f"prompt-{name}.json")
+
+
+def content_hash(kb_text, rules=prompts.SYSTEM_RULES):
+    h = hashlib.sha256()
+    h.update(rules.encode("utf-8"))
+    h.update(b"\0")
+    h.update(kb_text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def compile_artifact(kb_text):
+    """Artifact dict for the current rules and kb_text."""
+    parts = prompts.segments(kb_text)
+    segments = []
+    offset = 0
+    for name, text in parts:
+        segments.append({"name": name, "start": offset, "end": offset + len(text),
+                         "tokens": estimate_tokens(text), "cached": True})
+        offset += len(text)
+    sections = [
+        {"id": s["id"], "level": s["level"], "title": s["title"], "path": s["path"],
+         "start": s["start"], "end": s["end"], "tokens": estimate_tokens(kb_text[s["start"]:s["end"]])}
+        for s in split_sections(kb_text)
+    ]
+    return {
+        "version": ARTIFACT_VERSION,
+        "content_hash": content_hash(kb_text),
+        "kb_hash": kb_hash(kb_text),
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "token_counts": "estimate",
+        "system_tokens": sum(s["tokens"] for s in segments),
+        "segments": segments,
+        "sections": sections,
+        "system_text": "".join(text for _, text in parts),
+        "kb": kb_text,
+    }
+
+
+def count_tokens_exactly(data, client, model):
+    """Replace estimated segment token counts with counts from the API.
+
+    Counts cumulative prefixes, so each segment's count is its true share.
+    """
+    previous = 0
+    text = data["system_text"]
+    for seg in data["segments"]:
+        resp = client.messages.count_tokens(
+            model=model,
+            system=[{"type": "text", "text": text[:seg["end"]]}],
+            messages=[{"role": "user", "content": "hi"}],
+        )
+        seg["tokens"] = resp.input_tokens - previous
+        previous = resp.input_tokens
+    data["system_tokens"] = sum(s["tokens"] for s in data["segments"])
+    data["token_counts"] = model
+    return data
+
+
+def write_artifact(data, path=ARTIFACT_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        # dumps, not dump: the one-shot encoder is the C one
+        f.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    os.replace(tmp, path)
+
+
+class PromptArtifact:
+    """A loaded artifact: system prompt blocks, KB text and section metadata."""
+
+    def __init__(self, data):
+        self.data = data
+        self.version = data["version"]
+        self.content_hash = data["content_hash"]
+        self.kb_text = data["kb"]
+        self.system_text = data["system_text"]
+        self.segments = data["segments"]
+        self.sections = data["sections"]
+        self.system_tokens = data["system_tokens"]
+        # Built once; callers must treat the blocks as read-only
+        self._blocks = [prompts.text_block(self.segment_text(s["name"]), cached=s["cached"]) for s in self.segments]
+
+    def segment_text(self, name):
+        seg = next(s for s in self.segments if s["name"] == name)
+        return self.system_text[seg["start"]:seg["end"]]
+
+    def system_blocks(self):
+        """Full-KB system prompt, one cached block per segment."""
+        return self._blocks
+
+    def retrieval_blocks(self, context):
+        """Cached rules + this question's KB excerpts (see retrieval.py)."""
+        return prompts.retrieval_blocks(context, rules=self.segment_text("rules"))
+
+
+def load_artifact(kb_path=KB_PATH, path=None):
+    """The artifact for the current rules and KB, rebuilt if stale.
+
+    Cached per process; a stale or missing file on disk is recompiled and
+    rewritten (best-effort on read-only filesystems).
+    """
+    path = path or artifact_path_for(kb_path)
+    with open(kb_path, "r", encoding="utf-8") as f:
+        kb_text = f.read()
+    current = content_hash(kb_text)
+
+    loaded = _LOADED.get(path)
+    if loaded and loaded.content_hash == current:
+        return loaded
+
+    data = None
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except ValueError:
+            data = None
+    if not data or data.get("version") != ARTIFACT_VERSION or data.get("content_hash") != current:
+        data = compile_artifact(kb_text)
+        try:
+            write_artifact(data, path)
+        except OSError:
+            pass
+    artifact = _LOADED[path] = PromptArtifact(data)
+    return artifact
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the system prompt + KB artifact")
+    parser.add_argument("--kb", default=KB_PATH, help="Knowledge base markdown file")
+    parser.add_argument("--out", help="Artifact path (default: .kb_index/prompt.json for the default KB)")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if the artifact is missing or stale")
+    parser.add_argument("--count-tokens", action="store_true",
+                        help="Count segment tokens exactly with the API (needs ANTHROPIC_API_KEY)")
+    parser.add_argument("--model", default="claude-sonnet-4-5-20250929", help="Model for --count-tokens")
+    args = parser.parse_args()
+    args.out = args.out or artifact_path_for(args.kb)
+
+    with open(args.kb, "r", encoding="utf-8") as f:
+        kb_text = f.read()
+
+    if args.check:
+        try:
+            with open(args.out, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        fresh = data.get("version") == ARTIFACT_VERSION and data.get("content_hash") == content_hash(kb_text)
+        print(f"{args.out}: {'up to date' if fresh else 'STALE — run python prompt_artifact.py'}")
+        sys.exit(0 if fresh else 1)
+
+    data = compile_artifact(kb_text)
+    if args.count_tokens:
+        from anthropic import Anthropic
+        data = count_tokens_exactly(data, Anthropic(), args.model)
+    write_artifact(data, args.out)
+
+    print(f"Wrote {args.out}")
+    print(f"  content hash {data['content_hash'][:16]}, {len(data['sections'])} KB sections")
+    for seg in data["segments"]:
+        print(f"  {seg['name']:<8} {seg['tokens']:>7,} tokens  [{seg['start']:,}–{seg['end']:,})")
+    print(f"  system   {data['system_tokens']:>7,} tokens ({data['token_counts']})")
@@ -0,0 +1,119 @@
+"""
+Exotel HR Chatbot — Rate Limiting
+==================================
+Token buckets sized to the account's Anthropic quotas, so concurrent callers
+(the validator, batch jobs) stay under requests-per-minute and
+input-tokens-per-minute instead of discovering the limit through 429s.
+
+Token counts are estimated before a call and settled against the usage the
+API reports afterwards; cache reads do not count towards the input-token
+quota, so only input_tokens + cache_creation_input_tokens are charged.
+
+backoff_delay() / retry_status() cover the other half: retrying 429 (rate
+limited) and 529 (overloaded) with jittered exponential backoff, honouring
+retry-after when the server sends one.
+"""
+
+import time
+import random
+import asyncio
+
+RETRY_STATUSES = (429, 529)
+
+
+class TokenBucket:
+    """Refills rate_per_minute units per minute, holding at most one minute's worth."""
+
+    def __init__(self, rate_per_minute, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount):
+        """Seconds until amount can be taken (0 if available now).
+
+        Requests larger than the bucket only wait for a full bucket, so one
+        oversized call cannot block forever.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, delta):
+        """Charge (delta > 0) or refund (delta < 0) after the fact; may go into debt."""
+        self._refill()
+        self.level = min(self.capacity, self.level - delta)
+
+
+class RateLimiter:
+    """Async limiter over a requests-per-minute and a tokens-per-minute bucket.
+
+    Either limit may be 0 (unlimited). Waiters are served in arrival order.
+    """
+
+    def __init__(self, rpm=0, tpm=0):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.waited_s = 0.0
+        self._lock = asyncio.Lock()
+
+    def _charges(self, tokens):
+        if self.requests:
+            yield self.requests, 1
+        if self.tokens:
+            yield self.tokens, tokens
+
+    async def acquire(self, tokens=0):
+        """Wait until one request of ~tokens input tokens fits both quotas."""
+        async with self._lock:
+            while True:
+                wait = max((bucket.delay(n) for bucket, n in self._charges(tokens)), default=0.0)
+                if wait <= 0:
+                    break
+                self.waited_s += wait
+                await asyncio.sleep(wait)
+            for bucket, n in self._charges(tokens):
+                bucket.take(n)
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket once the real usage is known."""
+        if self.tokens:
+            self.tokens.adjust(actual - estimated)
+
+
+def charged_tokens(usage):
+    """Input tokens that count towards the tokens-per-minute quota."""
+    return (usage.get("input_tokens") or 0) + (usage.get("cache_creation_input_tokens") or 0)
+
+
+def retry_status(exc):
+    """(status, retry_after seconds or None) if exc is a retryable 429/529, else None."""
+    status = getattr(exc, "status_code", None)
+    if status not in RETRY_STATUSES:
+        return None
+    response = getattr(exc, "response", None)
+    retry_after = None
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return status, retry_after
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0, retry_after=None):
+    """Full-jitter exponential backoff; retry-after from the server wins."""
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
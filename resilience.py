@@ -0,0 +1,390 @@
+"""
+Exotel HR Chatbot — Resilient Model Calls
+==========================================
+One wrapper around opening a streamed Claude call, shared by app.py (sync
+client) and server.py (async client), so a 429/529 or a slow tail no longer
+lands straight in "Sorry, something went wrong":
+
+  - retries     429, 529, 5xx and network errors are retried with jittered
+                exponential backoff (ratelimit.backoff_delay, honouring
+                retry-after), as long as the per-request deadline allows
+  - budget      retries (and hedges) draw on a shared budget that refills by
+                RETRY_BUDGET_RATIO per call, so an outage cannot turn every
+                user request into 4 upstream requests
+  - breaker     after `failures` consecutive upstream failures (429 excluded)
+                calls fail fast with CircuitOpen for `reset_s` seconds, then
+                one probe call decides whether to close it again
+  - hedging     optional: if no token has arrived after the recent p95 time
+                to first token, a second identical request is sent and
+                whichever starts streaming first is used; the other is closed
+
+Retrying and hedging only happen before the first token. Once text has been
+shown, a failure ends the answer as before.
+
+ResilientCaller.stats() counts calls, retried calls, hedged calls and
+hedge wins, fast failures and deadline misses; the admin panel and /healthz
+show them, and each ledger line records the turn's retries and hedging.
+"""
+
+import time
+import asyncio
+import threading
+import concurrent.futures
+
+from anthropic import APIConnectionError
+
+import ratelimit
+from ledger import percentile
+
+RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504, 529)
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_RESERVE = 10.0
+HEDGE_MIN_SAMPLES = 20
+HEDGE_FLOOR_S = 1.0
+TTFT_WINDOW = 200
+
+
+class CircuitOpen(Exception):
+    """Upstream is failing; the call was not attempted."""
+
+
+class DeadlineExceeded(Exception):
+    """No token arrived within the per-request deadline."""
+
+
+def failure_kind(exc):
+    """'rate_limited', 'upstream' or 'network' for retryable errors, else None."""
+    if isinstance(exc, APIConnectionError):  # includes timeouts
+        return "network"
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        return "rate_limited"
+    if status in RETRYABLE_STATUSES:
+        return "upstream"
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker
+# ---------------------------------------------------------------------------
+class CircuitBreaker:
+    """closed → open after `failures` consecutive failures → half-open after reset_s."""
+
+    def __init__(self, failures=5, reset_s=30.0, clock=time.monotonic):
+        self.failures = failures
+        self.reset_s = reset_s
+        self.opens = 0
+        self._clock = clock
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        return "half-open" if self._clock() - self._opened_at >= self.reset_s else "open"
+
+    def allow(self):
+        """"call" or "probe" if a call may go out now, else False.
+
+        In half-open only one probe goes out at a time; whoever gets "probe"
+        must report success() or failure(), even if the call is abandoned.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return "call"
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return "probe"
+            return False
+
+    def success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or self._consecutive >= self.failures:
+                if self._opened_at is None or self._probing:
+                    self.opens += 1
+                self._opened_at = self._clock()
+            self._probing = False
+
+
+# ---------------------------------------------------------------------------
+# Caller
+# ---------------------------------------------------------------------------
+class Opened:
+    """A stream that has produced its first text chunk.
+
+    first is that chunk ("" if the answer had no text), texts the rest,
+    stream the SDK MessageStream (for get_final_message()); always close().
+    """
+
+    def __init__(self, manager, stream, texts, first, ttft_s):
+        self.manager = manager
+        self.stream = stream
+        self.texts = texts
+        self.first = first
+        self.ttft_s = ttft_s
+        self.retries = 0
+        self.hedged = False
+
+    def close(self):
+        self.manager.__exit__(None, None, None)
+
+    async def aclose(self):
+        await self.manager.__aexit__(None, None, None)
+
+
+class ResilientCaller:
+    """Retries, retry budget, circuit breaker and hedging for streamed calls.
+
+    Thread-safe: one instance is shared by all Streamlit sessions, or by all
+    requests of a server worker.
+    """
+
+    def __init__(self, deadline_s=60.0, max_retries=3, hedge=False, breaker=None):
+        self.deadline_s = deadline_s
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self._budget = RETRY_BUDGET_RESERVE
+        self._ttfts = []
+        self._counts = dict.fromkeys(
+            ("calls", "retried_calls", "retries", "hedged_calls", "hedge_wins", "budget_exhausted",
+             "fast_failures", "deadline_exceeded", "failed_calls"), 0)
+        self._lock = threading.Lock()
+
+    # -- bookkeeping -------------------------------------------------------
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def _withdraw(self):
+        """Take one retry/hedge from the budget; False if it is exhausted."""
+        with self._lock:
+            if self._budget < 1:
+                self._counts["budget_exhausted"] += 1
+                return False
+            self._budget -= 1
+            return True
+
+    def _start_call(self):
+        """True if this call is the breaker's half-open probe."""
+        allowed = self.breaker.allow()
+        if not allowed:
+            self._count("fast_failures")
+            raise CircuitOpen("The model API is failing; not calling it for a moment")
+        with self._lock:
+            self._counts["calls"] += 1
+            self._budget = min(RETRY_BUDGET_RESERVE, self._budget + RETRY_BUDGET_RATIO)
+        return allowed == "probe"
+
+    def _succeeded(self, opened, retries, hedged):
+        self.breaker.success()
+        with self._lock:
+            self._ttfts = (self._ttfts + [opened.ttft_s])[-TTFT_WINDOW:]
+        opened.retries, opened.hedged = retries, hedged
+        return opened
+
+    def _retry_delay(self, exc, attempt, deadline):
+        """Seconds to wait before retrying exc, or raise it (or DeadlineExceeded)."""
+        kind = failure_kind(exc)
+        if kind in ("upstream", "network"):
+            self.breaker.failure()
+        else:
+            self.breaker.success()  # the API answered, it just said no
+        if kind is None or attempt >= self.max_retries or self.breaker.state == "open":
+            self._count("failed_calls")
+            raise exc
+        retry = ratelimit.retry_status(exc)
+        delay = ratelimit.backoff_delay(attempt, retry_after=retry[1] if retry else None)
+        if time.monotonic() + delay >= deadline:
+            self._count("deadline_exceeded")
+            raise DeadlineExceeded(f"No answer within {self.deadline_s:.0f}s ({type(exc).__name__})") from exc
+        if not self._withdraw():
+            self._count("failed_calls")
+            raise exc
+        self._count("retries")
+        if attempt == 0:
+            self._count("retried_calls")
+        return delay
+
+    def hedge_after(self):
+        """Seconds without a first token before hedging, or None (off / too few samples)."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            if len(self._ttfts) < HEDGE_MIN_SAMPLES:
+                return None
+            return max(HEDGE_FLOOR_S, percentile(self._ttfts, 95))
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+            p95 = percentile(self._ttfts, 95)
+        counts.update(breaker=self.breaker.state, breaker_opens=self.breaker.opens,
+                      ttft_p95=round(p95, 3) if p95 is not None else None,
+                      hedge_after_s=self.hedge_after())
+        return counts
+
+    # -- sync (app.py) -----------------------------------------------------
+    def open(self, start):
+        """Open start(timeout) (a sync messages.stream() call) resiliently → Opened.
+
+        Raises CircuitOpen, DeadlineExceeded, or the last API error.
+        """
+        probe = self._start_call()
+        deadline = time.monotonic() + self.deadline_s
+        attempt = 0
+        try:
+            while True:
+                try:
+                    opened, hedged = self._attempt(start, deadline)
+                    probe = False  # settled by _succeeded / _retry_delay
+                    return self._succeeded(opened, attempt, hedged)
+                except Exception as e:
+                    probe = False
+                    delay = self._retry_delay(e, attempt, deadline)
+                time.sleep(delay)
+                attempt += 1
+        finally:
+            if probe:
+                # Interrupted before the probe got an answer (e.g. Streamlit's
+                # StopException): count it as failed rather than leave the
+                # breaker half-open with its only probe slot taken forever
+                self.breaker.failure()
+
+    def _first_chunk(self, start, deadline):
+        started = time.monotonic()
+        manager = start(max(1.0, deadline - started))
+        stream = manager.__enter__()
+        try:
+            texts = iter(stream.text_stream)
+            first = next(texts, "")
+        except BaseException:
+            manager.__exit__(None, None, None)
+            raise
+        return Opened(manager, stream, texts, first, time.monotonic() - started)
+
+    def _attempt(self, start, deadline):
+        hedge_after = self.hedge_after()
+        if hedge_after is None:
+            return self._first_chunk(start, deadline), False
+        # Two threads per hedged call, not a shared pool: a busy pool would
+        # queue the primary request and add the very latency hedging removes
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+        try:
+            primary = pool.submit(self._first_chunk, start, deadline)
+            try:
+                return primary.result(timeout=hedge_after), False
+            except concurrent.futures.TimeoutError:
+                pass
+            if not self._withdraw():
+                return primary.result(), False
+            self._count("hedged_calls")
+            backup = pool.submit(self._first_chunk, start, deadline)
+            pending = {primary, backup}
+            error = None
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        for loser in pending:
+                            loser.add_done_callback(_close_if_opened)
+                        if future is backup:
+                            self._count("hedge_wins")
+                        return future.result(), True
+                    error = future.exception()
+            raise error
+        finally:
+            pool.shutdown(wait=False)
+
+    # -- async (server.py) -------------------------------------------------
+    async def aopen(self, start):
+        """Async open(): start(timeout) is an AsyncAnthropic messages.stream() call."""
+        probe = self._start_call()
+        deadline = time.monotonic() + self.deadline_s
+        attempt = 0
+        try:
+            while True:
+                try:
+                    opened, hedged = await self._aattempt(start, deadline)
+                    probe = False
+                    return self._succeeded(opened, attempt, hedged)
+                except Exception as e:
+                    probe = False
+                    delay = self._retry_delay(e, attempt, deadline)
+                await asyncio.sleep(delay)
+                attempt += 1
+        finally:
+            if probe:  # cancelled before the probe got an answer
+                self.breaker.failure()
+
+    async def _afirst_chunk(self, start, deadline):
+        started = time.monotonic()
+        manager = start(max(1.0, deadline - started))
+        stream = await manager.__aenter__()
+        try:
+            texts = stream.text_stream.__aiter__()
+            first = await anext(texts, "")
+        except BaseException:
+            await manager.__aexit__(None, None, None)
+            raise
+        return Opened(manager, stream, texts, first, time.monotonic() - started)
+
+    async def _aattempt(self, start, deadline):
+        hedge_after = self.hedge_after()
+        if hedge_after is None:
+            return await self._afirst_chunk(start, deadline), False
+        tasks = [asyncio.ensure_future(self._afirst_chunk(start, deadline))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if done or not self._withdraw():
+                return await tasks[0], False
+            self._count("hedged_calls")
+            tasks.append(asyncio.ensure_future(self._afirst_chunk(start, deadline)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        for loser in tasks:
+                            if loser is not task:
+                                _abandon(loser)
+                        if task is tasks[1]:
+                            self._count("hedge_wins")
+                        return task.result(), True
+                    error = task.exception()
+            raise error
+        except BaseException:
+            # Cancelled (the client went away) or failed: nothing may keep
+            # running, or keep a stream open, after this attempt
+            for task in tasks:
+                _abandon(task)
+            raise
+
+
+def _close_if_opened(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _aclose_if_opened(task):
+    # A losing hedge that got its first token before it could be cancelled
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
+
+
+def _abandon(task):
+    """Cancel a first-chunk task, closing its stream if it already opened."""
+    task.add_done_callback(_aclose_if_opened)
+    task.cancel()  # closes its stream on the way out
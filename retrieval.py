@@ -0,0 +1,297 @@
+"""
+Exotel HR Chatbot — Knowledge Base Retrieval
+=============================================
+Splits knowledge_base.md at its #/##/### headings and ranks the sections
+against a question with BM25, so a turn can send the most relevant sections
+instead of the whole knowledge base.
+
+The inverted index is built once per KB version and saved in .kb_index/ next
+to the knowledge base. The postings file is memory-mapped on load, so a
+Streamlit rerun or a fresh worker only pays for reading the JSON header.
+
+Usage:
+    # Build (or rebuild) the index
+    python retrieval.py --build
+
+    # Show the sections a question would be answered from
+    python retrieval.py --query "max device lease EMI on 10000 allowance"
+"""
+
+import os
+import re
+import sys
+import json
+import math
+import mmap
+import array
+import hashlib
+import argparse
+from collections import Counter
+
+KB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.md")
+INDEX_DIRNAME = ".kb_index"
+INDEX_VERSION = 1
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Heading words say what a section is about far better than body words, so
+# they are counted several times. The policy title is counted once so that
+# "device lease EMI" still finds "### Monthly Deduction" under Device Lease.
+HEADING_WEIGHT = 3
+
+HEADING_RE = re.compile(r"^(#{1,3})\s+(.+?)\s*$")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could do does for from had has have
+how i if in into is it its me my of on or our so than that the their them
+then there these they this to was we were what when where which who will
+with would you your am any about after before get got im
+""".split())
+
+
+# ---------------------------------------------------------------------------
+# Tokenizing & splitting
+# ---------------------------------------------------------------------------
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed and plurals folded."""
+    tokens = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        if tok in STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+def kb_hash(kb_text):
+    return hashlib.sha256(kb_text.encode("utf-8")).hexdigest()
+
+
+def split_sections(kb_text):
+    """Split the KB at #, ## and ### headings.
+
+    Returns a list of dicts with the heading level, title, the titles of the
+    enclosing headings (path) and the [start, end) character offsets of the
+    section text, heading line included. #### headings stay inside their
+    parent section.
+    """
+    sections = []
+    path = []
+    offset = 0
+    for line in kb_text.splitlines(keepends=True):
+        m = HEADING_RE.match(line)
+        if m:
+            level = len(m.group(1))
+            title = m.group(2)
+            if sections:
+                sections[-1]["end"] = offset
+            path = path[:level - 1] + [title]
+            sections.append({
+                "id": len(sections),
+                "level": level,
+                "title": title,
+                "path": list(path),
+                "start": offset,
+                "end": len(kb_text),
+            })
+        offset += len(line)
+    return sections
+
+
+# ---------------------------------------------------------------------------
+# Index build
+# ---------------------------------------------------------------------------
+def section_terms(kb_text, section):
+    """Term frequencies for one section, with heading boosts applied."""
+    tf = Counter(tokenize(kb_text[section["start"]:section["end"]]))
+    for tok in tokenize(section["title"]):
+        tf[tok] += HEADING_WEIGHT - 1  # the heading line is already in the body once
+    for tok in tokenize(" ".join(section["path"][:-1])):
+        tf[tok] += 1
+    return tf
+
+
+def build_index(kb_text, index_dir, term_cache=None):
+    """Build the BM25 index for kb_text and write it to index_dir.
+
+    term_cache, if given, maps (heading path, section text) to that section's
+    term frequencies and is reused across builds, so after an edit only the
+    changed sections are re-tokenized (see kb_reload.py). It is pruned to
+    the sections of kb_text.
+    """
+    sections = split_sections(kb_text)
+    doc_len = []
+    postings = {}
+    seen = set()
+    for sec in sections:
+        if term_cache is None:
+            tf = section_terms(kb_text, sec)
+        else:
+            key = (tuple(sec["path"]), kb_text[sec["start"]:sec["end"]])
+            seen.add(key)
+            if key not in term_cache:
+                term_cache[key] = section_terms(kb_text, sec)
+            tf = term_cache[key]
+        doc_len.append(sum(tf.values()))
+        for term, count in tf.items():
+            postings.setdefault(term, []).append((sec["id"], count))
+
+    # Postings are stored as flat (section_id, tf) uint32 pairs; the header
+    # maps each term to its [offset, document frequency] in that array.
+    flat = array.array("I")
+    terms = {}
+    for term in sorted(postings):
+        plist = postings[term]
+        terms[term] = [len(flat) // 2, len(plist)]
+        for sid, count in plist:
+            flat.append(sid)
+            flat.append(count)
+
+    if term_cache is not None:
+        for key in set(term_cache) - seen:
+            del term_cache[key]
+
+    header = {
+        "version": INDEX_VERSION,
+        "kb_hash": kb_hash(kb_text),
+        "avgdl": sum(doc_len) / max(len(doc_len), 1),
+        "doc_len": doc_len,
+        "sections": sections,
+        "terms": terms,
+    }
+
+    os.makedirs(index_dir, exist_ok=True)
+    bin_path = os.path.join(index_dir, "postings.bin")
+    json_path = os.path.join(index_dir, "index.json")
+    with open(bin_path + ".tmp", "wb") as f:
+        flat.tofile(f)
+    with open(json_path + ".tmp", "w", encoding="utf-8") as f:
+        # dumps, not dump: the one-shot encoder is the C one
+        f.write(json.dumps(header, separators=(",", ":")))
+    # Postings first: a header is only ever published next to its postings.
+    os.replace(bin_path + ".tmp", bin_path)
+    os.replace(json_path + ".tmp", json_path)
+    return header
+
+
+# ---------------------------------------------------------------------------
+# Index load & search
+# ---------------------------------------------------------------------------
+class KBIndex:
+    """A loaded BM25 index over the sections of one KB version."""
+
+    def __init__(self, kb_text, header, postings):
+        self.kb_text = kb_text
+        self.kb_hash = header["kb_hash"]
+        self.sections = header["sections"]
+        self.doc_len = header["doc_len"]
+        self.avgdl = header["avgdl"]
+        self.terms = header["terms"]
+        self.postings = postings
+
+    def search(self, question, top_k=8):
+        """Return the top_k (score, section) pairs for question, best first."""
+        n = len(self.sections)
+        scores = {}
+        for term in set(tokenize(question)):
+            meta = self.terms.get(term)
+            if not meta:
+                continue
+            start, df = meta
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i in range(start, start + df):
+                sid = self.postings[2 * i]
+                tf = self.postings[2 * i + 1]
+                norm = K1 * (1 - B + B * self.doc_len[sid] / self.avgdl)
+                scores[sid] = scores.get(sid, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:top_k]
+        return [(score, self.sections[sid]) for sid, score in ranked]
+
+    def section_text(self, section):
+        return self.kb_text[section["start"]:section["end"]].strip()
+
+    def context_for(self, question, top_k=8):
+        """Render the top_k sections for question as a system-prompt block.
+
+        Sections are emitted in KB order, each preceded by the chain of
+        headings it sits under so the model knows which policy it is from.
+        """
+        hits = sorted((sec for _, sec in self.search(question, top_k)), key=lambda s: s["id"])
+        parts = [
+            "The excerpts below are the sections of the knowledge base most "
+            "relevant to this question. If they do not answer it, treat the "
+            "topic as not covered."
+        ]
+        for sec in hits:
+            text = self.section_text(sec)
+            if sec["level"] > 1:
+                text = f"*From: {' › '.join(sec['path'][:-1])}*\n\n{text}"
+            parts.append(text)
+        return "\n\n---\n\n".join(parts)
+
+
+_LOADED = {}
+
+
+def load_index(kb_path=KB_PATH, kb_text=None, term_cache=None):
+    """Load the index for the KB at kb_path, building it first if stale.
+
+    Loaded indexes are kept per process, so repeated calls are free.
+    term_cache is passed on to build_index().
+    """
+    if kb_text is None:
+        with open(kb_path, "r", encoding="utf-8") as f:
+            kb_text = f.read()
+    digest = kb_hash(kb_text)
+    index_dir = os.path.join(os.path.dirname(os.path.abspath(kb_path)), INDEX_DIRNAME)
+    cache_key = (index_dir, digest)
+    if cache_key in _LOADED:
+        return _LOADED[cache_key]
+
+    json_path = os.path.join(index_dir, "index.json")
+    header = None
+    if os.path.exists(json_path):
+        with open(json_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("version") != INDEX_VERSION or header.get("kb_hash") != digest:
+            header = None
+    if header is None:
+        header = build_index(kb_text, index_dir, term_cache)
+
+    with open(os.path.join(index_dir, "postings.bin"), "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    postings = memoryview(mm).cast("I")
+
+    index = KBIndex(kb_text, header, postings)
+    _LOADED[cache_key] = index
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the KB section index")
+    parser.add_argument("--kb", default=KB_PATH, help="Path to the knowledge base markdown")
+    parser.add_argument("--build", action="store_true", help="Rebuild the index from scratch")
+    parser.add_argument("--query", help="Show the top sections for a question")
+    parser.add_argument("--top-k", type=int, default=8, help="Number of sections to return")
+    args = parser.parse_args()
+
+    if not args.build and not args.query:
+        parser.print_help()
+        sys.exit(1)
+
+    with open(args.kb, "r", encoding="utf-8") as f:
+        text = f.read()
+    if args.build:
+        idx_dir = os.path.join(os.path.dirname(os.path.abspath(args.kb)), INDEX_DIRNAME)
+        hdr = build_index(text, idx_dir)
+        print(f"Indexed {len(hdr['sections'])} sections, {len(hdr['terms'])} terms → {idx_dir}")
+    if args.query:
+        idx = load_index(args.kb, text)
+        for score, sec in idx.search(args.query, args.top_k):
+            print(f"  {score:6.2f}  {' › '.join(sec['path'])}")
+        context = idx.context_for(args.query, args.top_k)
+        print(f"\n  Context: {len(context):,} chars (full KB: {len(text):,} chars)")
@@ -0,0 +1,370 @@
+"""
+Exotel HR Chatbot — Local Intent Router
+========================================
+Decides, before any model call, whether a question needs the model at all.
+Everything is read from the knowledge base's Smart Query Routing guide and
+the slang list in prompts.SYSTEM_RULES, so editing the guide changes the
+routing without touching this file:
+
+  - not_covered  topics in the "Not Covered" registry and slang dictionary
+                 (WFH, PF, ESOP, hike, overtime, ...) get the standard
+                 "not covered" answer directly
+  - clarify      first-turn questions missing a parameter the answer
+                 depends on get the clarifying question directly:
+                   the guide's "Incomplete Question" phrasings, a vague
+                   sales role for variable pay, a leave balance or accrual
+                   without a leave type, eligibility without a band, BGV
+                   without a level, and an EMI without saying car or
+                   device lease
+  - model        everything else, with the policies the question maps to
+                 and a slang-expanded query for retrieval mode
+
+route() is a handful of precompiled regex searches: well under a
+millisecond per question.
+
+Usage:
+    python router.py "can I WFH on fridays?"
+    python router.py "what is my leave balance?"
+    python router.py --check    # none of the questions below may be intercepted
+"""
+
+import re
+import sys
+import time
+
+import prompts
+from answer_cache import normalize_question
+from calculator import fmt_pct, iter_tables, load_rules
+from kb_tables import question_band
+from retrieval import KB_PATH, kb_hash, split_sections, tokenize
+
+ROUTE_NOT_COVERED = "not_covered"
+ROUTE_CLARIFY = "clarify"
+ROUTE_MODEL = "model"
+
+HR_CONTACT = "Please reach out to the HR team at hr@exotel.com for guidance."
+
+# Registry statuses that mean "answer as not covered"; PARTIALLY / NOT
+# EXPLICITLY / NOT FULLY COVERED topics still go to the model.
+NOT_COVERED_STATUS = "NOT COVERED"
+
+# Words that make a not-covered phrase too generic to match on its own.
+# "raise" is also "raise a complaint"; "exit" and "bonus" are covered topics.
+IGNORED_PHRASES = frozenset({"raise"})
+GENERIC_TAIL = frozenset({"details", "policy", "process", "support", "programs", "program",
+                          "assistance", "contribution", "criteria", "and"})
+
+# Words from policy titles that say nothing about which policy is meant
+TITLE_STOPWORDS = frozenset({"policy", "exotel", "employee", "process", "company", "workplace",
+                             "structure", "guide", "smart", "query", "routing", "disambiguation",
+                             "hr", "complete", "knowledge", "base", "linked", "pay", "scaleup"})
+
+SALES_VAGUE_RE = re.compile(
+    r"\bsales\s+(?:manager|person|guy|rep|representative|executive|role|team|employee|head)\b"
+    r"|\bi\s*(?:m|am)\s+in\s+sales\b")
+PAY_TOPIC_RE = re.compile(r"\b(?:incentive|variable|commission|payout|slab|ob|gp|bonus|calculat\w*|earn)\b")
+LEAVE_RE = re.compile(r"\bleaves?\b(?!\s+(?:the|my|exotel|company|job|org))")
+# Only what differs by leave type: a balance, or when leave is credited.
+# "How many leaves do I get?" or "how do I apply for leave?" have one answer
+# covering every type, so they go to the model.
+LEAVE_PER_TYPE_RE = re.compile(r"\bbalance\b|\b(?:left|remaining)\b|\baccru\w*|\bcredited\b")
+LEAVE_BROAD_RE = re.compile(r"\b(?:types?|all|each|list|available|exhausted|policy|policies|kinds?|summary|lwp|lop|without pay)\b")
+ELIGIBILITY_RE = re.compile(
+    r"\beligib\w*|\bapplicable (?:for|to) me\b|\bam i allowed\b|\bam i entitled\b"
+    r"|\bcan i (?:get|avail|apply for|opt for|take)\b|\bwhat (?:do i get|is my (?:limit|allowance))\b")
+BAND_GATED_RE = re.compile(r"\bcar lease\b|\bcar\b|\bper diem\b|\bhotel\b|\baccommodation\b|\btravel (?:limit|allowance)s?\b"
+                           r"|\bwhat s applicable for me\b|\bapplicable for me\b")
+MULTI_BENEFIT_RE = re.compile(r"\b(?:together|both|combined|simultaneous\w*)\b")
+LEVEL_WORDS_RE = re.compile(r"\b(?:intern|interns|director|vp|vice president|contractor|trainee|band|level)\b")
+BGV_RE = re.compile(r"\bbgv\b|\bbackground (?:verification|check)s?\b")
+BGV_SPECIFIC_RE = re.compile(r"\b(?:which|what) (?:checks?|verifications?|all)\b|\bfor me\b|\bmy\b|\bwill (?:they|you|exotel) (?:check|verify)\b|\bcredit check\b")
+EMI_RE = re.compile(r"\bemi\b|\blease\b")
+LEASE_TYPE_RE = re.compile(r"\b(?:car|vehicle|device|laptop|phone|mobile|ipad|tablet|gadget|smartwatch|both)\b")
+
+
+def _phrases(cell):
+    """'"Hike" / "Raise"' → ["hike", "raise"]; plain cells → [cell]."""
+    quoted = re.findall(r'"([^"]+)"', cell)
+    return [normalize_question(p) for p in (quoted or [cell])]
+
+
+def _registry_aliases(topic):
+    """Aliases for a Not Covered registry topic, specific enough to match on.
+
+    "Provident Fund (PF) contribution details" → ["pf", "provident fund
+    contribution details", "provident fund"]. Single generic words from a
+    "/" list ("Branches") are dropped.
+    """
+    aliases = [normalize_question(a) for a in re.findall(r"\(([A-Z]{2,})\)", topic)]
+    for part in re.sub(r"\([^)]*\)", " ", topic).split("/"):
+        words = normalize_question(part).split()
+        if len(words) < 2:
+            continue
+        aliases.append(" ".join(words))
+        while len(words) > 2 and words[-1] in GENERIC_TAIL:
+            words = words[:-1]
+            aliases.append(" ".join(words))
+    return aliases
+
+
+def _alternation(phrases):
+    """One compiled regex matching any phrase as whole words, longest first."""
+    ordered = sorted({p for p in phrases if p}, key=len, reverse=True)
+    if not ordered:
+        return re.compile(r"(?!x)x")
+    return re.compile(r"(?<![\w])(?:" + "|".join(re.escape(p) for p in ordered) + r")(?![\w])")
+
+
+class Router:
+    """Routing tables parsed from one KB version; route() is read-only."""
+
+    def __init__(self, kb_text):
+        self.slang = {}          # phrase -> (formal term, [policies])
+        self.not_covered = {}    # phrase -> {topic, why, suggest}
+        self.incomplete = {}     # normalized question -> clarifying reply
+        self.leave_types = []
+        policy_titles = []
+        leave_policy = []  # text of the Leave Policy, for its abbreviations
+
+        for sec in split_sections(kb_text):
+            if sec["level"] == 1:
+                policy_titles.append(sec["title"])
+            body = kb_text[sec["start"]:sec["end"]]
+            if sec["path"][0].endswith("Leave Policy"):
+                leave_policy.append(body)
+            for header, rows in iter_tables(body):
+                cols = [h.lower() for h in header]
+                if cols[0] == "slang/informal":
+                    self._add_slang(cols, rows)
+                elif cols[:2] == ["topic", "status"]:
+                    for row in rows:
+                        if row[1].strip("* ").upper() == NOT_COVERED_STATUS:
+                            entry = {"topic": row[0], "why": row[2], "suggest": row[3] if len(row) > 3 else ""}
+                            for alias in _registry_aliases(row[0]):
+                                self.not_covered.setdefault(alias, entry)
+                elif cols[0] == "incomplete question":
+                    reply_col = next((i for i, c in enumerate(cols) if c.startswith("example response")),
+                                     next((i for i, c in enumerate(cols) if c in ("what to ask", "clarification needed")), 1))
+                    for row in rows:
+                        for question in _phrases(row[0]):
+                            self.incomplete[question] = row[reply_col].strip().strip('"')
+                elif cols[0] == "leave type":
+                    self.leave_types = [re.sub(r"\s*\(.*\)", "", r[0]).strip() for r in rows
+                                        if r[0] and " - " not in r[0]]
+
+        self._add_rules_slang(prompts.SYSTEM_RULES)
+
+        # Leave types: the summary table's names without "leave" ("Sick/Casual
+        # Leave" is two) and the Leave Policy's abbreviations for them ("(AL)")
+        type_words = set()
+        for name in self.leave_types:
+            for part in normalize_question(name).split("/"):
+                type_words.add(" ".join(w for w in part.split() if w != "leave"))
+        type_words.update(normalize_question(a) for a in
+                          re.findall(r"\b(?:leaves?|off)\s*\(([A-Za-z]{2,4})\)", "".join(leave_policy), re.I))
+        self.leave_type_re = _alternation(type_words | {"comp off", "compoff", "lwp", "lop", "privilege", "earned", "medical", "holiday"})
+
+        # Role names for the Growth Incentive policies, e.g. "Accounts Director"
+        self.incentive_roles = [t.split(" - ", 1)[1] for t in policy_titles if t.startswith("Growth Incentive Policy - ")]
+        role_names = set(self.incentive_roles)
+        rules = load_rules(kb_text=kb_text)
+        self.lease_cap_pct = rules["lease_cap_pct"]
+        role_names.update(role for _, role in rules["roles"])
+        self.role_tokens = [set(tokenize(re.sub(r"\(.*?\)|\s-\s.*", "", name))) for name in role_names]
+        self.role_tokens = [t for t in self.role_tokens if t]
+
+        # Policy keywords: distinctive words of every policy title
+        covered = {}
+        for title in policy_titles:
+            if title == prompts.ROUTING_HEADING.lstrip("# "):
+                continue
+            for tok in tokenize(title):
+                if tok not in TITLE_STOPWORDS and len(tok) > 2:
+                    covered.setdefault(tok, title)
+        self.policy_keywords = covered
+
+        self.slang_re = _alternation(self.slang)
+        self.not_covered_re = _alternation(p for p in self.not_covered if p not in IGNORED_PHRASES)
+
+    def _add_slang(self, cols, rows):
+        formal_col = cols.index("formal term") if "formal term" in cols else None
+        policy_col = cols.index("policy") if "policy" in cols else None
+        why_col = next((i for i, c in enumerate(cols) if c in ("clarification", "why not covered")), None)
+        status_col = cols.index("status") if "status" in cols else None
+        for row in rows:
+            policy = row[policy_col] if policy_col is not None else ""
+            status = row[status_col] if status_col is not None else policy
+            for phrase in _phrases(row[0]):
+                if status.strip("* ").upper() == NOT_COVERED_STATUS:
+                    formal = row[formal_col] if formal_col is not None else row[0].strip('"')
+                    self.not_covered.setdefault(phrase, {"topic": formal, "why": row[why_col] if why_col else "",
+                                                         "suggest": ""})
+                elif formal_col is not None:
+                    self.slang.setdefault(phrase, (row[formal_col], [p.strip() for p in policy.split(",") if p.strip()]))
+
+    def _add_rules_slang(self, rules):
+        """- "WFH" = Work From Home (not covered — say so) lines from SYSTEM_RULES."""
+        for line in rules.splitlines():
+            m = re.match(r'^- ((?:"[^"]+"\s*/?\s*)+)=\s*(.+)$', line.strip())
+            if not m:
+                continue
+            formal = re.sub(r"\s*\(.*\)", "", m.group(2)).strip()
+            for phrase in _phrases(m.group(1)):
+                if "not covered" in m.group(2).lower():
+                    self.not_covered.setdefault(phrase, {"topic": formal, "why": "", "suggest": ""})
+                else:
+                    self.slang.setdefault(phrase, (formal, []))
+
+    # ------------------------------------------------------------------
+    # Routing
+    # ------------------------------------------------------------------
+    def expand(self, question):
+        """question plus the formal terms for any slang in it (for retrieval)."""
+        q = normalize_question(question)
+        formal = [self.slang[m.group(0)][0] for m in self.slang_re.finditer(q)]
+        return " ".join([question] + formal)
+
+    def policies_for(self, q):
+        """Policies a normalized question maps to, via slang and policy-title words."""
+        policies = []
+        words = tokenize(q)
+        for m in self.slang_re.finditer(q):
+            formal, slang_policies = self.slang[m.group(0)]
+            policies += slang_policies
+            words += tokenize(formal)
+        for tok in words:
+            title = self.policy_keywords.get(tok)
+            if title:
+                policies.append(title)
+        return list(dict.fromkeys(policies))
+
+    def route(self, question, history=()):
+        """{route, answer, reason, policies, query} for one user message.
+
+        history is the earlier conversation ({"role", "content"} dicts);
+        clarifications are only asked on the first turn, since later turns
+        usually carry the missing detail in context.
+        """
+        q = normalize_question(question)
+        policies = self.policies_for(q)
+        result = {"route": ROUTE_MODEL, "answer": None, "reason": None,
+                  "policies": policies, "query": self.expand(question)}
+
+        m = self.not_covered_re.search(q)
+        if m and not policies:
+            entry = self.not_covered[m.group(0)]
+            return dict(result, route=ROUTE_NOT_COVERED, reason=f"not covered: {m.group(0)}",
+                        answer=self.not_covered_answer(entry))
+
+        if any(turn.get("role") == "user" for turn in history):
+            return result
+        reason, answer = self.clarification(q)
+        if answer:
+            return dict(result, route=ROUTE_CLARIFY, reason=reason, answer=answer)
+        return result
+
+    def not_covered_answer(self, entry):
+        parts = [f"**{entry['topic'].strip()}** isn't covered in our current policies."]
+        if entry["why"] and entry["why"].lower().rstrip(".") not in ("not covered", "not in policies"):
+            parts.append(entry["why"].rstrip(".") + ".")
+        if entry["suggest"]:
+            parts.append(f"Suggested next step: {entry['suggest'].rstrip('.')}.")
+        parts.append(HR_CONTACT)
+        return " ".join(parts)
+
+    def clarification(self, q):
+        """(reason, clarifying question) if q is missing a needed detail, else (None, None)."""
+        if q in self.incomplete:
+            return "incomplete question", self.incomplete[q]
+
+        has_band = question_band(q) is not None or LEVEL_WORDS_RE.search(q)
+        tokens = set(tokenize(q))
+
+        # With figures given, the model works the payout out (and states its assumptions)
+        if SALES_VAGUE_RE.search(q) and PAY_TOPIC_RE.search(q) and not re.search(r"\d", q) \
+                and not any(role <= tokens for role in self.role_tokens):
+            roles = ", ".join(self.incentive_roles)
+            return "sales role", (
+                "Could you tell me your exact role title? Variable pay differs by role — each has its own "
+                f"OB/GP weightages and slab tables. The Growth Incentive policies cover: {roles}.")
+
+        if LEAVE_RE.search(q) and LEAVE_PER_TYPE_RE.search(q) \
+                and not LEAVE_BROAD_RE.search(q) and not self.leave_type_re.search(q):
+            types = ", ".join(t.lower() for t in self.leave_types) or "annual, sick, casual, period, bereavement, marriage, sabbatical"
+            return "leave type", f"Which type of leave do you mean? Exotel has: {types}."
+
+        if EMI_RE.search(q) and not LEASE_TYPE_RE.search(q):
+            shared = (f" (both share the {fmt_pct(self.lease_cap_pct)} supplementary allowance cap)"
+                      if self.lease_cap_pct is not None else "")
+            return "lease type", ("Are you asking about your Car Lease EMI or Device Lease EMI? "
+                                  f"They have different terms and limits{shared}.")
+
+        if BGV_RE.search(q) and BGV_SPECIFIC_RE.search(q) and not has_band:
+            return "bgv level", ("Background verification checks vary by level. "
+                                 "What's your band/level (for example L2, L5 or E1)?")
+
+        if ELIGIBILITY_RE.search(q) and BAND_GATED_RE.search(q) and not has_band and not MULTI_BENEFIT_RE.search(q):
+            return "band", "Eligibility depends on your band. What's your level/band (L1-L5, E1, E2, etc.)?"
+        return None, None
+
+
+# Besides the 25 validation questions and the quick actions, questions that
+# must reach the model (each was once intercepted wrongly)
+MODEL_QUESTIONS = (
+    "How many sick leaves do I get?",
+    "How many casual leaves do I get?",
+    "How many sick leaves can I take in a year?",
+    "How many annual leaves do I get?",
+    "How many period leaves do I get per month?",
+    "How many leaves do I get?",
+    "How do I apply for leave?",
+    "Can I take leave on probation?",
+    "How many leaves can I carry forward?",
+)
+
+
+def check(router):
+    """Questions that should go to the model but are answered locally: [(question, route, reason)]."""
+    from validate import TEST_CASES
+
+    questions = [tc["question"] for tc in TEST_CASES]
+    questions += [question for _, _, _, question in prompts.QUICK_QUESTIONS]
+    questions += MODEL_QUESTIONS
+    routed = ((q, router.route(q)) for q in questions)
+    return [(q, r["route"], r["reason"]) for q, r in routed if r["route"] != ROUTE_MODEL]
+
+
+_ROUTERS = {}
+
+
+def load_router(kb_path=KB_PATH, kb_text=None):
+    """The router for the KB at kb_path; built once per KB version."""
+    if kb_text is None:
+        with open(kb_path, "r", encoding="utf-8") as f:
+            kb_text = f.read()
+    digest = kb_hash(kb_text)
+    if digest not in _ROUTERS:
+        _ROUTERS[digest] = Router(kb_text)
+    return _ROUTERS[digest]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('Usage: python router.py "your question"')
+        sys.exit(1)
+    router = load_router()
+    if sys.argv[1:] == ["--check"]:
+        wrong = check(router)
+        for question, route, reason in wrong:
+            print(f"{route} ({reason}): {question}")
+        print(f"{len(wrong)} questions intercepted wrongly")
+        sys.exit(1 if wrong else 0)
+    question = " ".join(sys.argv[1:])
+    started = time.perf_counter()
+    routed = router.route(question)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"route:    {routed['route']} ({elapsed:.3f} ms){' — ' + routed['reason'] if routed['reason'] else ''}")
+    print(f"policies: {', '.join(routed['policies']) or '—'}")
+    print(f"query:    {routed['query']}")
+    if routed["answer"]:
+        print(f"\n{routed['answer']}")
@@ -0,0 +1,376 @@
+"""
+Exotel HR Chatbot — Admission Control
+======================================
+Every question sends ~70k input tokens, so a few dozen employees asking at
+once can spend the organisation's input-tokens-per-minute quota in seconds,
+and then every session gets a 429 together. The Scheduler sits in front of
+the model call instead:
+
+  - estimate    each request's quota cost is estimated before it is sent:
+                prompt tokens × the share recently charged (cache reads do
+                not count towards the quota, ratelimit.charged_tokens), and
+                corrected with the real usage afterwards
+  - budget      a request is admitted only when it fits the tokens- and
+                requests-per-minute buckets (ratelimit.TokenBucket); with a
+                db_path the buckets live in SQLite and are shared by every
+                worker and job on the host
+  - fairness    waiting requests are served interactive first, then in
+                turns across users (fair queuing): everyone's next question
+                before anyone's one after, so one busy tab cannot starve
+                the rest
+  - background  validation runs and other batch jobs queue behind chat and
+                leave BACKGROUND_RESERVE of each bucket for it, which also
+                holds across processes in host-wide mode
+
+A waiting request reports its queue position (app.py shows "you're #3 in
+line", server.py sends `queued` events) instead of failing; interactive
+requests give up with QueueTimeout after timeout_s.
+
+Usage:
+    # Tokens and requests left in a host-wide scheduler's shared budget
+    python scheduler.py --db .kb_index/scheduler.db --tpm 400000
+"""
+
+import time
+import sqlite3
+import asyncio
+import argparse
+import itertools
+import threading
+
+import ratelimit
+from history import estimate_tokens
+from ledger import percentile
+from ratelimit import TokenBucket
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+BACKGROUND_RESERVE = 0.25  # share of each bucket background jobs leave to chat
+POLL_S = 0.25
+CHARGE_SMOOTHING = 0.2
+MIN_CHARGE_RATIO = 0.02
+WAIT_WINDOW = 200
+
+
+class QueueTimeout(Exception):
+    """An interactive request waited longer than timeout_s to be admitted."""
+
+
+def request_tokens(system_text, messages):
+    """Estimated input tokens of one request (system prompt + messages)."""
+    return estimate_tokens(system_text) + sum(estimate_tokens(m["content"]) for m in messages)
+
+
+def _take(charges, reserve=0.0):
+    """Take every (bucket, amount) and return 0, or return the seconds until all fit.
+
+    reserve is the share of each bucket that must be left over afterwards.
+    """
+    wait = max((bucket.delay(n + reserve * bucket.capacity) for bucket, n in charges), default=0.0)
+    if wait <= 0:
+        for bucket, n in charges:
+            bucket.take(n)
+    return wait
+
+
+# ---------------------------------------------------------------------------
+# Budgets
+# ---------------------------------------------------------------------------
+class LocalBudget:
+    """Requests- and tokens-per-minute buckets for this process (0 = unlimited)."""
+
+    host_wide = False
+
+    def __init__(self, rpm=0, tpm=0):
+        self.buckets = {name: TokenBucket(limit) for name, limit in (("requests", rpm), ("tokens", tpm)) if limit}
+        self._lock = threading.Lock()
+
+    def take(self, tokens, reserve=0.0):
+        with self._lock:
+            return _take(_charges(self.buckets, tokens), reserve)
+
+    def adjust(self, delta):
+        if "tokens" in self.buckets:
+            with self._lock:
+                self.buckets["tokens"].adjust(delta)
+
+    def levels(self):
+        with self._lock:
+            return {name: round(bucket.level) for name, bucket in _refilled(self.buckets)}
+
+
+class SharedBudget:
+    """The same buckets kept in a SQLite file, so every process on the host shares them.
+
+    Each operation is one IMMEDIATE transaction, so concurrent workers never
+    spend the same tokens twice. Levels are stored with a wall-clock
+    timestamp and refilled on read.
+    """
+
+    host_wide = True
+
+    def __init__(self, db_path, rpm=0, tpm=0):
+        self.db_path = db_path
+        self.limits = {name: limit for name, limit in (("requests", rpm), ("tokens", tpm)) if limit}
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY, level REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+
+    def _update(self, change):
+        """Run change(buckets) on the stored buckets in one transaction; returns its result."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            buckets = {}
+            for name, limit in self.limits.items():
+                bucket = buckets[name] = TokenBucket(limit, clock=time.time)
+                row = conn.execute("SELECT level, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                if row:
+                    bucket.level, bucket._updated = min(row[0], bucket.capacity), row[1]
+            result = change(buckets)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (name, level, updated) VALUES (?, ?, ?)",
+                [(name, bucket.level, bucket._updated) for name, bucket in buckets.items()],
+            )
+            conn.execute("COMMIT")
+            return result
+        finally:
+            conn.close()  # without COMMIT, the transaction is rolled back
+
+    def take(self, tokens, reserve=0.0):
+        if not self.limits:
+            return 0.0
+        return self._update(lambda buckets: _take(_charges(buckets, tokens), reserve))
+
+    def adjust(self, delta):
+        if "tokens" in self.limits:
+            self._update(lambda buckets: buckets["tokens"].adjust(delta))
+
+    def levels(self):
+        if not self.limits:
+            return {}
+        return self._update(lambda buckets: {name: round(bucket.level) for name, bucket in _refilled(buckets)})
+
+
+def _charges(buckets, tokens):
+    return [(bucket, 1 if name == "requests" else tokens) for name, bucket in buckets.items()]
+
+
+def _refilled(buckets):
+    for name, bucket in buckets.items():
+        bucket.delay(0)  # refills
+        yield name, bucket
+
+
+# ---------------------------------------------------------------------------
+# Queue
+# ---------------------------------------------------------------------------
+class Ticket:
+    """One request waiting for (or granted) admission."""
+
+    def __init__(self, user, prompt_tokens, tokens, priority, seq, turn, deadline):
+        self.user = user
+        self.prompt_tokens = prompt_tokens
+        self.tokens = tokens
+        self.priority = priority
+        self.seq = seq
+        self.turn = turn
+        self.deadline = deadline
+        self.queued_at = time.monotonic()
+        self.waited_s = None  # set on admission
+
+
+class Scheduler:
+    """Fair, priority-aware admission of model calls under a per-minute budget.
+
+    Thread-safe: one instance is shared by all Streamlit sessions, or by all
+    requests of a server worker. With tpm=rpm=0 every request is admitted
+    at once.
+    """
+
+    def __init__(self, tpm=0, rpm=0, db_path=None, timeout_s=120.0):
+        self.budget = SharedBudget(db_path, rpm, tpm) if db_path else LocalBudget(rpm, tpm)
+        self.timeout_s = timeout_s
+        self.charge_ratio = 1.0  # assume a cold prompt cache until usage says otherwise
+        self._queue = []  # pending tickets, in arrival order
+        self._seq = itertools.count()
+        # Fair queuing: a ticket's turn is one past its user's previous ticket,
+        # or past the last admitted turn if the user has had nothing queued since
+        self._served = dict.fromkeys(PRIORITY_NAMES, 0)  # priority -> last admitted turn
+        self._last_turn = {}  # (priority, user) -> turn of their latest ticket
+        self._waits = []
+        self._counts = dict.fromkeys(("admitted", "queued", "timed_out", "cancelled"), 0)
+        self._cond = threading.Condition()
+
+    def submit(self, user, prompt_tokens, priority=INTERACTIVE, tokens=None):
+        """Queue a request of ~prompt_tokens input tokens for user → Ticket.
+
+        tokens overrides the estimated quota charge (for callers that
+        estimate it themselves, like validate.py). Follow with queue() or
+        aqueue(), and settle() once the call is over.
+        """
+        with self._cond:
+            if tokens is None:
+                tokens = max(1, round(prompt_tokens * self.charge_ratio))
+            deadline = time.monotonic() + self.timeout_s if priority == INTERACTIVE and self.timeout_s else None
+            turn = max(self._served[priority], self._last_turn.get((priority, user), 0)) + 1
+            self._last_turn[(priority, user)] = turn
+            ticket = Ticket(user, prompt_tokens, tokens, priority, next(self._seq), turn, deadline)
+            self._queue.append(ticket)
+        return ticket
+
+    def _ordered(self):
+        """Pending tickets in service order: priority, then turn, then arrival."""
+        return sorted(self._queue, key=lambda t: (t.priority, t.turn, t.seq))
+
+    def _step(self, ticket):
+        """(0, 0) once ticket is admitted, else (its queue position, seconds to wait)."""
+        with self._cond:
+            position = self._ordered().index(ticket) + 1
+            if position == 1:
+                wait = self.budget.take(ticket.tokens, BACKGROUND_RESERVE if ticket.priority == BACKGROUND else 0.0)
+                if wait <= 0:
+                    self._admit(ticket)
+                    return 0, 0.0
+            else:
+                wait = POLL_S
+            if ticket.deadline and time.monotonic() >= ticket.deadline:
+                self._queue.remove(ticket)
+                self._counts["timed_out"] += 1
+                self._cond.notify_all()
+                raise QueueTimeout(f"Still #{position} in line after {self.timeout_s:.0f}s")
+            return position, min(wait, POLL_S)
+
+    def _admit(self, ticket):
+        self._queue.remove(ticket)
+        self._served[ticket.priority] = max(self._served[ticket.priority], ticket.turn)
+        if len(self._last_turn) > 1000:
+            # Users with nothing queued ahead of the served turn start fresh anyway
+            self._last_turn = {k: turn for k, turn in self._last_turn.items() if turn > self._served[k[0]]}
+        ticket.waited_s = time.monotonic() - ticket.queued_at
+        self._counts["admitted"] += 1
+        if ticket.waited_s > 0.05:
+            self._counts["queued"] += 1
+        self._waits = (self._waits + [ticket.waited_s])[-WAIT_WINDOW:]
+        self._cond.notify_all()
+
+    def cancel(self, ticket):
+        """Withdraw a ticket that is still waiting (no-op once admitted)."""
+        with self._cond:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+                self._counts["cancelled"] += 1
+                self._cond.notify_all()
+
+    def queue(self, ticket):
+        """Wait for admission; yields the queue position each time it changes.
+
+        Returns as soon as the ticket is admitted (at once, without yielding,
+        if the budget has room). Raises QueueTimeout for an interactive
+        ticket that waited too long. Abandoning the generator cancels it.
+        """
+        shown = None
+        try:
+            while True:
+                position, wait = self._step(ticket)
+                if not position:
+                    return
+                if position != shown:
+                    shown = position
+                    yield position
+                with self._cond:
+                    self._cond.wait(wait)
+        finally:
+            self.cancel(ticket)
+
+    async def aqueue(self, ticket):
+        """Async queue(), for server.py and validate.py."""
+        shown = None
+        try:
+            while True:
+                position, wait = self._step(ticket)
+                if not position:
+                    return
+                if position != shown:
+                    shown = position
+                    yield position
+                await asyncio.sleep(wait)
+        finally:
+            self.cancel(ticket)
+
+    def settle(self, ticket, usage):
+        """Replace ticket's estimated charge with the usage the API reported.
+
+        usage is a telemetry.usage_fields dict, or None if the call failed
+        (refunds the estimate). Real usage also recalibrates the estimate
+        for the next requests.
+        """
+        actual = ratelimit.charged_tokens(usage) if usage else 0
+        self.budget.adjust(actual - ticket.tokens)
+        if usage and ticket.prompt_tokens:
+            with self._cond:
+                ratio = min(1.0, actual / ticket.prompt_tokens)
+                self.charge_ratio = max(MIN_CHARGE_RATIO,
+                                        (1 - CHARGE_SMOOTHING) * self.charge_ratio + CHARGE_SMOOTHING * ratio)
+
+    def limiter(self, user, priority=BACKGROUND):
+        """A ratelimit.RateLimiter stand-in that queues through this scheduler."""
+        return QueuedLimiter(self, user, priority)
+
+    def stats(self):
+        with self._cond:
+            waiting = {name: sum(1 for t in self._queue if t.priority == p) for p, name in PRIORITY_NAMES.items()}
+            counts = dict(self._counts)
+            p95 = percentile(self._waits, 95)
+            ratio = self.charge_ratio
+        return {
+            **counts,
+            "waiting": waiting,
+            "wait_p95_s": round(p95, 3) if p95 is not None else None,
+            "charge_ratio": round(ratio, 3),
+            "host_wide": self.budget.host_wide,
+            "budget": self.budget.levels(),
+        }
+
+
+class QueuedLimiter:
+    """acquire() / settle() / waited_s like ratelimit.RateLimiter, as one scheduler user."""
+
+    def __init__(self, scheduler, user, priority=BACKGROUND):
+        self.scheduler = scheduler
+        self.user = user
+        self.priority = priority
+        self.waited_s = 0.0
+
+    async def acquire(self, tokens=0):
+        started = time.monotonic()
+        ticket = self.scheduler.submit(self.user, tokens, self.priority, tokens=tokens)
+        async for _ in self.scheduler.aqueue(ticket):
+            pass
+        self.waited_s += time.monotonic() - started
+
+    def settle(self, estimated, actual):
+        self.scheduler.budget.adjust(actual - estimated)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show a host-wide scheduler's shared budget")
+    parser.add_argument("--db", required=True, help="SCHEDULER_DB file shared by the workers")
+    parser.add_argument("--tpm", type=int, default=0, help="Input-tokens-per-minute limit (TPM_LIMIT)")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests-per-minute limit (RPM_LIMIT)")
+    args = parser.parse_args()
+
+    budget = SharedBudget(args.db, rpm=args.rpm, tpm=args.tpm)
+    levels = budget.levels()
+    for name, limit in budget.limits.items():
+        print(f"  {name:<9} {levels[name]:>9,} of {limit:,} per minute available")
+    if not budget.limits:
+        print("  No limits given (--tpm / --rpm)")
@@ -0,0 +1,170 @@
+"""
+Exotel HR Chatbot — Answer Scoring
+===================================
+Grades an answer against a test case's expected and forbidden keywords.
+
+Numbers are compared by value, not spelling: "₹11,988", "11988", "INR
+11,988.00" and "Rs 11988" all match the keyword "11,988", "1.2L" and
+"1,20,000" are the same amount, and "40%" no longer matches inside "140%".
+A keyword with a % must appear as a percentage; a bare number matches the
+value however it is written. Text keywords are case-insensitive
+substrings, as before.
+
+A keyword may also be a list of alternatives, any one of which counts
+(e.g. ["₹11,987.50", "₹11,988"] to accept rounding to the rupee). Keywords
+that normalize to the same value are one requirement, so ["11,988",
+"11988"] needs the number once.
+
+Each case's keywords are parsed once per process, into the few ways each
+expected number can be spelled. An answer is never parsed whole: every
+spelling is located with a plain substring search and the number is parsed
+only where one occurs, so scoring 10,000 generated answers (calc_cases.py)
+takes a fraction of a second.
+"""
+
+import re
+from decimal import Decimal
+
+UNIT_MULTIPLIERS = {
+    "k": 1000, "l": 100000, "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000, "lpa": 100000,
+    "cr": 10000000, "crore": 10000000, "crores": 10000000,
+}
+UNIT_ZEROS = (3, 5, 7)  # amounts may also be written in k, lakh or crore
+
+CURRENCY_RE = re.compile(r"^(?:₹|rs\.?|inr|\$)\s?")
+# A number with western (1,234,567) or Indian (12,34,567) digit grouping or
+# none, and an optional unit or percent after it
+NUMBER_RE = re.compile(
+    r"(\d{1,3}(?:,\d{3})+|\d{1,2}(?:,\d\d)+,\d{3}|\d+)(?:\.(\d+))?(?!,?\d)"
+    r"(?:\s?(k|lakhs?|lacs?|lpa|l|cr|crores?)\b)?"
+    r"(\s?%|\s?percent\b)?"
+)
+
+
+def _canonical(whole, fraction, unit):
+    """'1,20,000' → '120000', '11988' + '00' → '11988', '1' + '2' + 'l' → '120000'."""
+    whole = whole.replace(",", "").lstrip("0") or "0"
+    fraction = (fraction or "").rstrip("0")
+    if unit:
+        value = Decimal(f"{whole}.{fraction or 0}") * UNIT_MULTIPLIERS[unit]
+        whole, _, fraction = f"{value:f}".partition(".")
+        fraction = fraction.rstrip("0")
+    return f"{whole}.{fraction}" if fraction else whole
+
+
+def keyword_form(keyword):
+    """(normalized value, is a percentage) of a keyword that is just a number
+    (with optional currency, unit or %), else None."""
+    m = NUMBER_RE.fullmatch(CURRENCY_RE.sub("", keyword.strip().lower()))
+    if not m:
+        return None
+    return _canonical(m.group(1), m.group(2), m.group(3)), bool(m.group(4))
+
+
+def _groupings(whole):
+    """'120000' → {'120000', '120,000', '1,20,000'}."""
+    western = f"{int(whole):,}"
+    indian = whole[-3:]
+    head = whole[:-3]
+    while head:
+        indian = f"{head[-2:]},{indian}"
+        head = head[:-2]
+    return {whole, western, indian}
+
+
+def _spellings(value):
+    """Digit strings value can start with in an answer: grouped or not, and
+    in k/lakh/crore ('120000' → '1,20,000', '120,000', '120', '1.2', ...)."""
+    whole, _, fraction = value.partition(".")
+    spellings = _groupings(whole)
+    for zeros in UNIT_ZEROS:
+        if len(whole) <= zeros:
+            break
+        head, tail = whole[:-zeros], (whole[-zeros:] + fraction).rstrip("0")
+        if len(tail) <= 2:
+            spellings.add(f"{head}.{tail}" if tail else head)
+    return tuple(sorted(spellings))
+
+
+def _contains_number(answer, value, percent, spellings):
+    """True if the lower-cased answer has value as a whole number.
+
+    Each spelling is found with a plain substring search and parsed only
+    where it occurs; the character before must not be part of a word or
+    another number ("q3", "1.5", "140%" do not contain 3, 5 or 40%).
+    """
+    for spelling in spellings:
+        start = answer.find(spelling)
+        while start != -1:
+            before = answer[start - 1] if start else " "
+            if not (before.isalnum() or before in "._,"):
+                m = NUMBER_RE.match(answer, start)
+                if (m and _canonical(m.group(1), m.group(2), m.group(3)) == value
+                        and (m.group(4) or not percent)):
+                    return True
+            start = answer.find(spelling, start + 1)
+    return False
+
+
+def _compile_group(keyword):
+    """(label, numbers, text alternatives) for one keyword or list of alternatives.
+
+    numbers is a tuple of (value, is a percentage, spellings).
+    """
+    alternatives = keyword if isinstance(keyword, (list, tuple)) else [keyword]
+    numbers, texts = [], []
+    for alt in alternatives:
+        form = keyword_form(alt)
+        if form is None:
+            texts.append(alt.lower())
+        elif form not in [n[:2] for n in numbers]:
+            numbers.append((*form, _spellings(form[0])))
+    return alternatives[0], tuple(numbers), tuple(texts)
+
+
+def _compile_groups(keywords):
+    groups, seen = [], set()
+    for keyword in keywords:
+        label, numbers, texts = _compile_group(keyword)
+        key = (frozenset(n[:2] for n in numbers), texts)
+        if key not in seen:  # "11,988" and "11988" are one requirement
+            seen.add(key)
+            groups.append((label, numbers, texts))
+    return groups
+
+
+_COMPILED = {}  # id(case) -> (case, expected groups, forbidden groups)
+
+
+def compile_case(tc):
+    """The case's keyword groups, compiled once per case object."""
+    entry = _COMPILED.get(id(tc))
+    if entry is None or entry[0] is not tc:
+        expected = _compile_groups(tc["expected_keywords"])
+        forbidden = _compile_groups(tc["expected_not"])
+        entry = _COMPILED[id(tc)] = (tc, expected, forbidden)
+    return entry
+
+
+def _found(numbers, texts, answer):
+    return (any(_contains_number(answer, *number) for number in numbers)
+            or any(text in answer for text in texts))
+
+
+def score_answer(tc, answer):
+    """Grade one lower-cased answer against a test case.
+
+    Returns (status, reason, missing, forbidden_found).
+    """
+    _, expected, forbidden = compile_case(tc)
+    missing = [label for label, numbers, texts in expected if not _found(numbers, texts, answer)]
+    forbidden_found = [label for label, numbers, texts in forbidden if _found(numbers, texts, answer)]
+    found = len(expected) - len(missing)
+
+    if forbidden_found:
+        return "FAIL", f"Contains forbidden: {forbidden_found}", missing, forbidden_found
+    if len(missing) == 0:
+        return "PASS", "", missing, forbidden_found
+    if found >= len(expected) / 2:
+        return "PARTIAL", f"Missing: {missing}", missing, forbidden_found
+    return "FAIL", f"Missing: {missing}", missing, forbidden_found
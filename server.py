@@ -0,0 +1,488 @@
+"""
+Exotel HR Policy Assistant — Headless HTTP API
+===============================================
+An async JSON/SSE endpoint for Slack bots, the intranet and validate.py,
+alongside the Streamlit UI. One process holds one prompt/KB build and one
+pooled AsyncAnthropic client for every request, instead of re-running a
+script per interaction.
+
+    uvicorn server:app --host 0.0.0.0 --port 8080 --workers 2
+
+Endpoints:
+  POST /chat     {"message": "...", "history": [{"role", "content"}, ...],
+                  "stream": false, "session": "optional id"}
+                 → {"response", "source", "usage"}; with "stream": true or
+                 "Accept: text/event-stream", server-sent events:
+                 `delta` {"text"} ... then `done` {"source", "usage"}
+                 (or `error` {"error"}), preceded by `queued` {"position"}
+                 while the call waits for room in the token budget
+  GET  /healthz  → model, model tiers, KB mode and version, prompt version,
+                 calls served, retry / hedge / circuit-breaker counters,
+                 admission queue and budget, coalesced requests
+
+Answers go through the same pipeline as app.py: local calculator, local
+router (not-covered topics, clarifying questions), first-turn answer cache
+(shared with the UI via ANSWER_CACHE_DB), then Claude with the history
+budget. With SMALL_MODEL set, lookups go to the small model first and are
+re-asked on MODEL_NAME if the answer fails the checks in tiers.py;
+small-tier answers are buffered, so they stream as a single `delta`. Older
+turns are summarized locally; the server keeps no per-session state.
+
+Identical first-turn questions arriving while one is being answered share
+its model call (coalesce.py); their source is "coalesced". That call
+belongs to the flight, so it finishes and is cached even if the client
+that asked first disconnects.
+
+The knowledge base is hot-reloaded (kb_reload.py): each request answers from
+the snapshot current when it arrived. An edit drops every cached full-KB
+answer; in KB_MODE=retrieval, only those drawn from the changed sections.
+"""
+
+import os
+import json
+import time
+
+from anthropic import APIStatusError, AsyncAnthropic
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import answer_cache
+import coalesce
+import history
+import kb_reload
+import ledger
+import prompts
+import resilience
+import scheduler
+import tiers
+from calculator import answer as calculate_locally
+from retrieval import KB_PATH
+from router import ROUTE_MODEL
+from telemetry import CACHE_TELEMETRY
+
+# ---------------------------------------------------------------------------
+# Configuration (same environment variables as app.py)
+# ---------------------------------------------------------------------------
+ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY", "")
+MODEL_NAME = os.environ.get("MODEL_NAME", "claude-sonnet-4-5-20250929")
+SMALL_MODEL = os.environ.get("SMALL_MODEL", "")
+TIER_ROUTES = os.environ.get("TIER_ROUTES", tiers.DEFAULT_ROUTES)
+TEMPERATURE = 0.2
+MAX_TOKENS = 2048
+KB_FILE = os.environ.get("KB_FILE", KB_PATH)
+KB_MODE = os.environ.get("KB_MODE", "full")
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "8"))
+KB_RELOAD_INTERVAL = float(os.environ.get("KB_RELOAD_INTERVAL", "5"))
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = int(os.environ.get("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_DB = os.environ.get("ANSWER_CACHE_DB", "")
+HISTORY_TURNS = int(os.environ.get("HISTORY_TURNS", "4"))
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "8000"))
+CONTEXT_LIMIT = int(os.environ.get("CONTEXT_LIMIT", "200000"))
+LEDGER_PATH = os.environ.get("LEDGER_PATH", "logs/turns.jsonl")
+CALL_DEADLINE_S = float(os.environ.get("CALL_DEADLINE_S", "60"))
+CALL_MAX_RETRIES = int(os.environ.get("CALL_MAX_RETRIES", "3"))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.environ.get("BREAKER_RESET_S", "30"))
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "") not in ("", "0", "false")
+TPM_LIMIT = int(os.environ.get("TPM_LIMIT", "0"))
+RPM_LIMIT = int(os.environ.get("RPM_LIMIT", "0"))
+SCHEDULER_DB = os.environ.get("SCHEDULER_DB", "")
+QUEUE_TIMEOUT_S = float(os.environ.get("QUEUE_TIMEOUT_S", "120"))
+MAX_HISTORY_MESSAGES = 50
+
+if not ANTHROPIC_API_KEY:
+    raise SystemExit("ANTHROPIC_API_KEY not set")
+
+# ---------------------------------------------------------------------------
+# Shared, built once per process
+# ---------------------------------------------------------------------------
+PROMPT_VERSION = answer_cache.prompt_version(prompts.SYSTEM_RULES, KB_MODE, RETRIEVAL_TOP_K)
+TIERS = tiers.load_tiers(SMALL_MODEL, MODEL_NAME, TIER_ROUTES)
+ANSWER_CACHE = answer_cache.AnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl_seconds=ANSWER_CACHE_TTL,
+    db_path=ANSWER_CACHE_DB or None,
+)
+# Prompt, index, tables, calculator rules and router for the current KB version
+KB = kb_reload.HotKB(KB_FILE, interval=KB_RELOAD_INTERVAL,
+                     on_reload=lambda diff, stale_tags: ANSWER_CACHE.invalidate(stale_tags))
+TURN_LEDGER = ledger.TurnLedger(os.path.join(os.path.dirname(__file__), LEDGER_PATH)) if LEDGER_PATH else None
+
+# One client, one connection pool, for every request in this worker. Retries
+# are made by CALLER (resilience.py) under a deadline, not by the SDK.
+client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY, max_retries=0)
+CALLER = resilience.ResilientCaller(
+    deadline_s=CALL_DEADLINE_S,
+    max_retries=CALL_MAX_RETRIES,
+    hedge=HEDGE_REQUESTS,
+    breaker=resilience.CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_S),
+)
+# Identical first-turn questions in flight share one call (coalesce.py)
+FLIGHTS = coalesce.SingleFlight()
+# Fair admission under the org's per-minute quota (host-wide with SCHEDULER_DB)
+SCHEDULER = scheduler.Scheduler(tpm=TPM_LIMIT, rpm=RPM_LIMIT, db_path=SCHEDULER_DB or None,
+                                timeout_s=QUEUE_TIMEOUT_S)
+
+
+class Queued(int):
+    """A queue position, yielded by stream_model while the call waits for admission."""
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+def parse_request(body):
+    """(message, conversation) from a /chat body; raises ValueError if malformed."""
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object")
+    message = body.get("message")
+    if not isinstance(message, str) or not message.strip():
+        raise ValueError("'message' must be a non-empty string")
+    conversation = []
+    for turn in (body.get("history") or [])[-MAX_HISTORY_MESSAGES:]:
+        if not isinstance(turn, dict) or turn.get("role") not in ("user", "assistant") \
+                or not isinstance(turn.get("content"), str):
+            raise ValueError("'history' items must be {\"role\": \"user\"|\"assistant\", \"content\": str}")
+        conversation.append({"role": turn["role"], "content": turn["content"]})
+    conversation.append({"role": "user", "content": message.strip()})
+    return message.strip(), conversation
+
+
+def system_for(conversation, kb):
+    if KB_MODE == "retrieval":
+        # Query on the last two user turns so short follow-ups still match
+        recent = [m["content"] for m in conversation if m["role"] == "user"][-2:]
+        return kb.prompt.retrieval_blocks(kb.retrieval_context(kb.router.expand(" ".join(recent)), RETRIEVAL_TOP_K))
+    return kb.system_blocks
+
+
+async def stream_model(conversation, status, kb, user, model=MODEL_NAME):
+    """Yield the model's reply chunk by chunk; fills status like app.stream_reply.
+
+    While the call waits in SCHEDULER's queue, yields its Queued position
+    instead of text. Raises ValueError (question too long) before any
+    request is made. Other failures (a queue timeout, or an API error after
+    CALLER's retries) set status["error"] / status["exception"] and end the
+    stream.
+    """
+    system = system_for(conversation, kb)
+    api_messages = history.build_messages(
+        conversation,
+        prompts.system_text(system),
+        MAX_TOKENS,
+        keep_turns=HISTORY_TURNS,
+        history_budget=HISTORY_TOKEN_BUDGET,
+        context_limit=CONTEXT_LIMIT,
+    )
+    ticket = SCHEDULER.submit(user, scheduler.request_tokens(prompts.system_text(system), api_messages))
+    try:
+        async for position in SCHEDULER.aqueue(ticket):
+            yield Queued(position)
+        if ticket.waited_s >= 0.05:
+            status["queued_s"] = round(ticket.waited_s, 3)
+        opened = await CALLER.aopen(lambda timeout: client.messages.stream(
+            model=model,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            system=system,
+            messages=api_messages,
+            timeout=timeout,
+        ))
+        status["retries"], status["hedged"] = opened.retries, opened.hedged
+        status["ttft_s"] = time.perf_counter() - status["started"]
+        try:
+            if opened.first:
+                yield opened.first
+            async for text in opened.texts:
+                yield text
+            message = await opened.stream.get_final_message()
+        finally:
+            await opened.aclose()
+        status["usage"] = CACHE_TELEMETRY.record(message.usage)
+        status["stop_reason"] = message.stop_reason
+        status["complete"] = True
+    except Exception as e:
+        status["error"] = type(e).__name__
+        status["exception"] = e
+    finally:
+        SCHEDULER.cancel(ticket)  # the client went away while it was queued
+        if ticket.waited_s is not None:
+            SCHEDULER.settle(ticket, status.get("usage"))
+
+
+async def chain_first(first, chunks):
+    if first is not None:
+        yield first
+    async for part in chunks:
+        yield part
+
+
+async def text_only(chunks):
+    """The text of a stream_model() reply, skipping queue positions."""
+    async for part in chunks:
+        if not isinstance(part, Queued):
+            yield part
+
+
+def record_turn(message, source, status, session, **extra):
+    if TURN_LEDGER:
+        TURN_LEDGER.record(
+            model=status.get("model", MODEL_NAME),
+            source=source,
+            latency_s=time.perf_counter() - status["started"],
+            ttft_s=status.get("ttft_s"),
+            usage=status.get("usage"),
+            error=status.get("error"),
+            category=ledger.categorize(message),
+            session=session,
+            **{k: status[k] for k in ("retries", "hedged", "queued_s") if k in status},
+            **extra,
+        )
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def error_response(exc):
+    """Pass upstream 429/529 (with retry-after) through so callers back off.
+
+    An open circuit, a missed deadline or a queue timeout is a 503 with
+    retry-after.
+    """
+    if isinstance(exc, resilience.CircuitOpen):
+        return JSONResponse({"error": "The assistant is briefly unavailable, please retry shortly."},
+                            status_code=503, headers={"retry-after": str(int(BREAKER_RESET_S))})
+    if isinstance(exc, (resilience.DeadlineExceeded, scheduler.QueueTimeout)):
+        return JSONResponse({"error": "The assistant is busy, please retry shortly."},
+                            status_code=503, headers={"retry-after": "5"})
+    if isinstance(exc, APIStatusError) and exc.status_code in (429, 529):
+        headers = {}
+        if exc.response.headers.get("retry-after"):
+            headers["retry-after"] = exc.response.headers["retry-after"]
+        return JSONResponse({"error": "The assistant is busy, please retry shortly."},
+                            status_code=exc.status_code, headers=headers)
+    return JSONResponse({"error": f"Upstream error: {str(exc)[:100]}"}, status_code=502)
+
+
+# ---------------------------------------------------------------------------
+# Routes
+# ---------------------------------------------------------------------------
+async def chat(request):
+    status = {"started": time.perf_counter()}
+    try:
+        body = await request.json()
+        message, conversation = parse_request(body)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    session = body.get("session")
+    # Queued fairly per session, or per client when the caller sends none
+    user = session or (request.client.host if request.client else "anonymous")
+    wants_stream = bool(body.get("stream")) or "text/event-stream" in request.headers.get("accept", "")
+
+    # One KB version for the whole request, even if the file changes meanwhile
+    kb = KB.current()
+
+    # Calculator, local router, then the first-turn answer cache (same as app.py)
+    source = "calculator"
+    text = calculate_locally(message, kb.rules)
+    if text is None:
+        routed = kb.router.route(message, conversation[:-1])
+        if routed["route"] != ROUTE_MODEL:
+            text, source = routed["answer"], "router"
+    choice = tiers.choose(TIERS, message)
+    status["model"] = choice["model"] or MODEL_NAME
+    cache_key = None
+    if text is None and len(conversation) == 1:
+        cache_key = answer_cache.make_key(message, status["model"], PROMPT_VERSION, TEMPERATURE)
+        escalatable = status["model"] != MODEL_NAME
+        text = ANSWER_CACHE.get(cache_key, kb.tags, count_miss=not escalatable)
+        if text is None and escalatable:
+            # An escalated small-tier answer is cached under MODEL_NAME
+            text = ANSWER_CACHE.get(answer_cache.make_key(message, MODEL_NAME, PROMPT_VERSION, TEMPERATURE), kb.tags)
+        source = "cache"
+
+    if text is not None:
+        record_turn(message, source, status, session)
+        if wants_stream:
+            events = [sse("delta", {"text": text}), sse("done", {"source": source, "usage": None})]
+            return StreamingResponse(iter(events), media_type="text/event-stream")
+        return JSONResponse({"response": text, "source": source, "usage": None})
+
+    # An identical first-turn question already being answered in this worker
+    # is streamed from that call rather than asked again
+    flight, leader = FLIGHTS.join(cache_key + kb.content_hash) if cache_key else (None, False)
+    if flight and not leader:
+        chunks = flight.afollow()
+        try:
+            first = await anext(chunks, None)
+            while isinstance(first, Queued):  # the leader's place in line
+                first = await anext(chunks, None)
+        except coalesce.LeaderGone:
+            flight = None  # that request failed first; make our own call
+        else:
+            return await followed(flight, first, chunks, message, status, session, wants_stream)
+    try:
+        return await model_answer(message, conversation, status, kb, user, session, choice, cache_key,
+                                  wants_stream, flight if leader else None)
+    except BaseException:
+        if leader and not flight.running:
+            flight.close(complete=False)
+        raise
+
+
+async def followed(flight, first, chunks, message, status, session, wants_stream):
+    """Answer from another request's in-flight call (coalesce.py); nothing is billed."""
+    status["ttft_s"] = time.perf_counter() - status["started"]
+
+    def finish():
+        if not flight.complete:
+            status["error"] = "LeaderCutOff"
+        record_turn(message, "coalesced", status, session)
+
+    if wants_stream:
+        async def events():
+            async for text in chain_first(first, chunks):
+                yield sse("delta", {"text": text})
+            finish()
+            if flight.complete:
+                yield sse("done", {"source": "coalesced", "usage": None})
+            else:
+                yield sse("error", {"error": "The answer was cut off"})
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"cache-control": "no-cache", "x-accel-buffering": "no"})
+
+    parts = [text async for text in chain_first(first, chunks)]
+    finish()
+    if not flight.complete:
+        return JSONResponse({"error": "The answer was cut off, please retry."}, status_code=502)
+    return JSONResponse({"response": "".join(parts), "source": "coalesced", "usage": None})
+
+
+async def tiered(message, conversation, status, kb, user, session, choice, tier):
+    """Yield the answer like stream_model(), through the model tiers.
+
+    A small-tier answer is buffered and checked before it is yielded (so it
+    arrives as one chunk); one that fails the checks is recorded as
+    discarded and the question re-asked on MODEL_NAME. status and tier end
+    up describing the call that produced the answer.
+    """
+    if choice["tier"] == "small":
+        draft = {"started": status["started"], "model": choice["model"]}
+        text = "".join([part async for part in text_only(stream_model(conversation, draft, kb, user,
+                                                                       choice["model"]))])
+        escalated = tiers.escalation_reason(message, text, draft, kb.figures)
+        if escalated is None:
+            status.update(draft)
+            yield text
+            return
+        record_turn(message, "model", draft, session, tier="small", discarded=escalated)
+        status["model"] = MODEL_NAME
+        tier.update(tier="large", escalated=escalated)
+    async for part in stream_model(conversation, status, kb, user, status["model"]):
+        yield part
+
+
+async def model_answer(message, conversation, status, kb, user, session, choice, cache_key, wants_stream,
+                       flight=None):
+    """Answer with the model tiers; as a flight's leader, through the flight.
+
+    The leader's call runs in a task the flight owns (coalesce.py): it goes
+    on to the end, caches the answer and serves the followers even if this
+    request's client disconnects, and this request follows it like they do.
+    """
+    tier = {"tier": choice["tier"]} if choice["tier"] else {}
+    chunks = tiered(message, conversation, status, kb, user, session, choice, tier)
+
+    def finish(text):
+        """Cache and record the answer; True if it completed."""
+        if cache_key and status.get("complete"):
+            # Keyed by the model that answered: MODEL_NAME if the small tier escalated
+            key = answer_cache.make_key(message, status["model"], PROMPT_VERSION, TEMPERATURE)
+            ANSWER_CACHE.put(key, text, kb.dependencies(message, RETRIEVAL_TOP_K, KB_MODE))
+        record_turn(message, "model", status, session, **tier)
+        return not status.get("exception")
+
+    if flight:
+        flight.arun(chunks, finish)
+        chunks = flight.afollow()
+    try:
+        first = await anext(chunks, None)
+        if not wants_stream:
+            while isinstance(first, Queued):
+                first = await anext(chunks, None)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except coalesce.LeaderGone:
+        # The flight's call failed before any text; status says why
+        if isinstance(flight.error, ValueError):
+            return JSONResponse({"error": str(flight.error)}, status_code=400)
+        first = None
+
+    if first is None and status.get("exception"):
+        # Failed before any text: a plain HTTP error is more useful than an empty stream
+        if not flight:
+            finish("")
+        return error_response(status["exception"])
+
+    if wants_stream:
+        async def events():
+            # A queued call starts the stream early with `queued` events, so
+            # the caller can show its place in line
+            parts = []
+            try:
+                async for part in chain_first(first, chunks):
+                    if isinstance(part, Queued):
+                        yield sse("queued", {"position": int(part)})
+                    else:
+                        parts.append(part)
+                        yield sse("delta", {"text": part})
+            except coalesce.LeaderGone:
+                pass  # failed while queued; status says why
+            if not flight:
+                finish("".join(parts))
+            if status.get("exception"):
+                error = "The assistant is busy, please retry shortly." if not parts \
+                    else f"The answer was cut off ({status['error']})"
+                yield sse("error", {"error": error})
+            else:
+                yield sse("done", {"source": "model", "usage": status.get("usage")})
+        return StreamingResponse(events(), media_type="text/event-stream",
+                                 headers={"cache-control": "no-cache", "x-accel-buffering": "no"})
+
+    parts = [text async for text in chain_first(first, chunks)]
+    if not flight:
+        finish("".join(parts))
+    if status.get("exception"):
+        return error_response(status["exception"])
+    return JSONResponse({"response": "".join(parts), "source": "model", "usage": status.get("usage")})
+
+
+async def healthz(request):
+    return JSONResponse({
+        "status": "ok",
+        "model": MODEL_NAME,
+        "tiers": TIERS,
+        "kb_mode": KB_MODE,
+        "prompt_version": PROMPT_VERSION,
+        "model_calls": CACHE_TELEMETRY.snapshot()["calls"],
+        "answer_cache": ANSWER_CACHE.stats(),
+        "model_api": CALLER.stats(),
+        "scheduler": SCHEDULER.stats(),
+        "coalescing": FLIGHTS.stats(),
+        "knowledge_base": KB.stats(),
+    })
+
+
+app = Starlette(routes=[
+    Route("/chat", chat, methods=["POST"]),
+    Route("/healthz", healthz, methods=["GET"]),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("server:app", host="0.0.0.0", port=int(os.environ.get("PORT", "8080")))
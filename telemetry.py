@@ -0,0 +1,66 @@
+"""
+Exotel HR Chatbot — Prompt Cache Telemetry
+===========================================
+Records the token usage Claude reports for every call, including
+cache_creation_input_tokens (prefix written to the cache) and
+cache_read_input_tokens (prefix served from the cache), so the prompt-cache
+hit rate can be shown under real traffic.
+"""
+
+import threading
+
+USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+
+def usage_fields(usage):
+    """Plain dict of the token counts in a response.usage (missing → 0)."""
+    if usage is None:
+        return {field: 0 for field in USAGE_FIELDS}
+    if isinstance(usage, dict):
+        return {field: usage.get(field) or 0 for field in USAGE_FIELDS}
+    return {field: getattr(usage, field, 0) or 0 for field in USAGE_FIELDS}
+
+
+def cache_hit_rate(totals):
+    """Share of prompt tokens served from the cache."""
+    prompt = totals["input_tokens"] + totals["cache_creation_input_tokens"] + totals["cache_read_input_tokens"]
+    return totals["cache_read_input_tokens"] / prompt if prompt else 0.0
+
+
+class CacheTelemetry:
+    """Thread-safe running totals of token usage across calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.calls_with_cache_read = 0
+            self.totals = {field: 0 for field in USAGE_FIELDS}
+
+    def record(self, usage):
+        """Add one response's usage; returns it as a plain dict."""
+        fields = usage_fields(usage)
+        with self._lock:
+            self.calls += 1
+            if fields["cache_read_input_tokens"]:
+                self.calls_with_cache_read += 1
+            for field, value in fields.items():
+                self.totals[field] += value
+        return fields
+
+    def snapshot(self):
+        with self._lock:
+            totals = dict(self.totals)
+            return {
+                "calls": self.calls,
+                "calls_with_cache_read": self.calls_with_cache_read,
+                **totals,
+                "cache_hit_rate": cache_hit_rate(totals),
+            }
+
+
+# One per process: every Claude call in the app records here
+CACHE_TELEMETRY = CacheTelemetry()
@@ -0,0 +1,125 @@
+"""
+Exotel HR Chatbot — Tiered Model Routing
+=========================================
+Picks a model per question instead of sending everything to MODEL_NAME:
+
+  - large  calculations (figures plus "calculate", "payout", "EMI", ...),
+           questions spanning several policy categories, and any category
+           the routing table sends there (variable pay by default)
+  - small  single-policy lookups ("is home a workplace under POSH?")
+
+The routing table maps ledger.categorize() categories to tiers and is set
+with TIER_ROUTES, e.g. "variable_pay=large,lease=large,*=small".
+
+A small-tier answer is checked before it is shown, and the question is
+re-asked on the large model if the answer:
+  - is empty, errored or hit max_tokens
+  - hedges ("I'm not sure", "I don't have enough information", ...)
+  - quotes an amount or percentage that appears neither in the knowledge
+    base nor in the question (a sign it was made up)
+
+Tiering is off unless SMALL_MODEL is set; validate.py --tiers reports
+accuracy and latency per tier so the small tier can be proven safe first.
+"""
+
+import re
+
+import ledger
+from retrieval import kb_hash
+
+TIERS = ("small", "large")
+DEFAULT_ROUTES = "variable_pay=large,other=large,*=small"
+
+CALCULATION_RE = re.compile(
+    r"\b(?:calculat\w*|compute|how much|payout|emi|attainment|achieved|interpolat\w*|slab|multiplier)\b")
+FIGURE_RE = re.compile(r"\d")
+HEDGE_RE = re.compile(
+    r"\bi(?:'m| am) not (?:sure|certain)\b|\bi (?:don't|do not) have (?:enough|that|the exact)\b"
+    r"|\b(?:cannot|can't|unable to) (?:determine|confirm|verify)\b|\bi (?:believe|think) (?:it|this|that)\b"
+    r"|\bnot (?:entirely )?clear from\b", re.I)
+FIGURE_IN_ANSWER_RE = re.compile(
+    r"(?:₹|rs\.?\s*|inr\s*|\$|usd\s*)(\d[\d,]*(?:\.\d+)?)|(\d[\d,]*(?:\.\d+)?)\s*%", re.I)
+NUMBER_RE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+
+def parse_routes(spec):
+    """'variable_pay=large,*=small' → {"variable_pay": "large", "*": "small"}.
+
+    Raises ValueError on an unknown category or tier.
+    """
+    known = {name for name, _ in ledger.CATEGORIES} | {"other", "*"}
+    routes = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        category, _, tier = part.partition("=")
+        category, tier = category.strip(), tier.strip()
+        if category not in known:
+            raise ValueError(f"unknown category {category!r} (expected one of {', '.join(sorted(known))})")
+        if tier not in TIERS:
+            raise ValueError(f"unknown tier {tier!r} for {category} (expected small or large)")
+        routes[category] = tier
+    return routes
+
+
+def load_tiers(small_model, large_model, routes=DEFAULT_ROUTES):
+    """Tier config, or None when no small model is configured (tiering off)."""
+    if not small_model:
+        return None
+    return {"models": {"small": small_model, "large": large_model}, "routes": parse_routes(routes)}
+
+
+def choose(config, question):
+    """{tier, model, reason} for a question; tier is None when tiering is off."""
+    if config is None:
+        return {"tier": None, "model": None, "reason": "tiering off"}
+    q = question.lower()
+    categories = [name for name, pattern in ledger.CATEGORIES if re.search(pattern, q)]
+    if FIGURE_RE.search(q) and CALCULATION_RE.search(q):
+        tier, reason = "large", "calculation"
+    elif len(categories) > 1:
+        tier, reason = "large", f"multi-policy ({', '.join(categories)})"
+    else:
+        category = categories[0] if categories else "other"
+        tier = config["routes"].get(category, config["routes"].get("*", "large"))
+        reason = f"category {category}"
+    return {"tier": tier, "model": config["models"][tier], "reason": reason}
+
+
+def _figure(number):
+    """'7,000.00' → '7000'; used to compare figures however they are written."""
+    value = number.replace(",", "")
+    if "." in value:
+        value = value.rstrip("0").rstrip(".")
+    return value
+
+
+_KB_FIGURES = {}
+
+
+def kb_figures(kb_text):
+    """Every number written in the knowledge base, normalized; cached per KB version."""
+    digest = kb_hash(kb_text)
+    if digest not in _KB_FIGURES:
+        _KB_FIGURES[digest] = frozenset(_figure(n) for n in NUMBER_RE.findall(kb_text))
+    return _KB_FIGURES[digest]
+
+
+def escalation_reason(question, answer, status, figures):
+    """Why a small-tier answer should be re-asked on the large model, or None.
+
+    status is the stream status dict (error / complete / stop_reason);
+    figures is kb_figures() of the knowledge base in use.
+    """
+    if status.get("error") or not status.get("complete"):
+        return f"error ({status.get('error') or 'incomplete'})"
+    if status.get("stop_reason") == "max_tokens":
+        return "truncated"
+    if not answer.strip():
+        return "empty answer"
+    if HEDGE_RE.search(answer):
+        return "low confidence"
+    asked = {_figure(n) for n in NUMBER_RE.findall(question)}
+    quoted = [_figure(m.group(1) or m.group(2)) for m in FIGURE_IN_ANSWER_RE.finditer(answer)]
+    ungrounded = [n for n in quoted if n not in figures and n not in asked]
+    if ungrounded:
+        return f"ungrounded figures ({', '.join(ungrounded[:3])})"
+    return None
@@ -11,14 +11,79 @@ Usage:
     # Test directly via Anthropic Claude API:
     export ANTHROPIC_API_KEY="your-key"
     python validate.py --api
+
+    # Questions run concurrently under the account's rate limits:
+    python validate.py --api --concurrency 8 --rpm 50 --tpm 400000
+
+    # Benchmark latency/tokens/cost (5 runs per question) against a baseline:
+    python validate.py --api --bench 5 --baseline bench_baseline.json
+
+    # Record answers once, then rescore offline after editing TEST_CASES:
+    python validate.py --api --record validation.cassette.json.gz
+    python validate.py --replay validation.cassette.json.gz
+
+    # Same questions against another knowledge base (e.g. compact_kb.py output):
+    python validate.py --api --kb knowledge_base.compact.md
+
+    # Route lookups to a small model (see tiers.py) and report each tier:
+    python validate.py --api --tiers --small-model claude-haiku-4-5-20251001
+
+    # Share the chat workers' token budget (SCHEDULER_DB), queued behind chat:
+    python validate.py --api --tpm 400000 --scheduler-db .kb_index/scheduler.db
+
+    # Submit every question as Message Batches jobs (half price, no
+    # per-minute limits; results within 24h), or resume waiting on them:
+    python validate.py --api --batch
+    python validate.py --api --batch-id msgbatch_...[,msgbatch_...]
+
+    # Compare models × prompt variants in one concurrent run, one table:
+    python validate.py --api --matrix --models claude-sonnet-4-5-20250929,claude-haiku-4-5-20251001 \
+        --variants full,compact,retrieval --accuracy-bar 0.9
+
+    # Instead of the 25 questions, 2000 calculations generated from the
+    # policy rules with exact answers (calc_cases.py); works with --batch
+    # and --matrix too:
+    python validate.py --api --calc 2000 --seed 7 --batch
 """
 
 import os
 import sys
 import json
 import time
+import asyncio
 import argparse
 
+import calc_cases
+import cassette
+import compact_kb
+import prompts
+import ratelimit
+import scheduler
+import tiers
+from calculator import load_rules
+from history import estimate_tokens
+from kb_tables import load_tables, with_band_rows
+from ledger import BATCH_DISCOUNT, estimate_cost, percentile
+from prompt_artifact import load_artifact
+from retrieval import KB_PATH, load_index
+from router import load_router
+from scoring import score_answer
+from telemetry import USAGE_FIELDS, CacheTelemetry, usage_fields
+
+# Message Batches polling: first wait, growth per poll, longest wait (seconds)
+BATCH_POLL_S = (2.0, 1.5, 60.0)
+# Message Batches per-batch limits: requests, and body size (256 MB; kept a
+# little under it, since every request carries the whole ~300 KB prompt)
+BATCH_MAX_REQUESTS = 100_000
+BATCH_MAX_BYTES = 250 * 1000 * 1000
+
+# --matrix prompt variants: the whole KB as app.py sends it, the
+# compact_kb.py compaction of it, and KB_MODE=retrieval's top sections
+PROMPT_VARIANTS = ("full", "compact", "retrieval")
+
+# Above this many cases (--calc), only the ones that did not pass are printed
+QUIET_ABOVE = 100
+
 # ---------------------------------------------------------------------------
 # The 25 validated Q&A pairs from the Claude stress test
 # Each has: question, expected_keywords (must appear), expected_NOT (must NOT appear),
@@ -203,27 +268,29 @@ TEST_CASES = [
 ]
 
 
-def test_with_claude_api(api_key, model_name):
-    """Test directly against Claude API."""
-    from anthropic import Anthropic
+def load_system_prompt(kb_path=KB_PATH):
+    """The exact system prompt app.py sends (same compiled artifact)."""
+    return load_artifact(kb_path=kb_path).system_blocks()
 
-    client = Anthropic(api_key=api_key)
 
-    kb_path = os.path.join(os.path.dirname(__file__), "knowledge_base.md")
-    with open(kb_path, "r", encoding="utf-8") as f:
-        kb_content = f.read()
+def test_with_claude_api(api_key, model_name, kb_path=KB_PATH, tier_config=None):
+    """Test directly against Claude API (tier_config: tiers.load_tiers(), or None)."""
+    from anthropic import AsyncAnthropic
 
-    # Build system prompt same way app.py does
-    app_path = os.path.join(os.path.dirname(__file__), "app.py")
-    with open(app_path, "r", encoding="utf-8") as f:
-        app_source = f.read()
+    # Retries are handled by the runner (429/529 backoff), not the SDK
+    client = AsyncAnthropic(api_key=api_key, max_retries=0)
 
-    idx_start = app_source.find('SYSTEM_PROMPT = """')
-    idx_end = app_source.find('""" + kb_content')
-    raw_prompt = app_source[idx_start + len('SYSTEM_PROMPT = """'):idx_end]
-    system_prompt = raw_prompt + kb_content
+    prompt = load_artifact(kb_path=kb_path)
+    return {"client": client, "model": model_name, "system": prompt.system_blocks(),
+            "tiers": tier_config, "kb_figures": tiers.kb_figures(prompt.kb_text)}, "api"
 
-    return {"client": client, "model": model_name, "system_prompt": system_prompt}, "api"
+
+def test_with_batches(api_key, model_name, kb_path=KB_PATH):
+    """Test via the Message Batches API: one job for every question."""
+    from anthropic import Anthropic
+
+    client = Anthropic(api_key=api_key)
+    return {"client": client, "model": model_name, "system": load_system_prompt(kb_path)}, "batch"
 
 
 def test_with_url(base_url):
@@ -232,108 +299,736 @@ def test_with_url(base_url):
     return base_url.rstrip("/"), "url"
 
 
-def run_tests(target, mode):
-    """Run all test cases and report results."""
+def test_with_cassette(path, model_name, kb_path=KB_PATH):
+    """Rescore answers recorded by an earlier --record run (no API calls)."""
+    return {"cassette": cassette.Cassette(path), "model": model_name, "system": load_system_prompt(kb_path)}, "replay"
+
+
+class RetryableStatus(Exception):
+    """HTTP 429/529 from the deployed service (shaped like the SDK's errors)."""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.status_code = response.status_code
+        self.response = response
+
+
+def make_asker(target, mode, concurrency):
+    """Async function question -> (answer text, usage or None, seconds to first token or None, tier).
+
+    tier is None unless --tiers is on; then {"tier", "model", "escalated"}.
+    """
+    if mode == "replay":
+        prompt_hash = cassette.prompt_hash(target["system"])
+
+        async def ask(question):
+            entry = target["cassette"].get(target["model"], prompt_hash, question)
+            return entry["answer"], entry["usage"], entry.get("ttft_s"), None
+        return ask
+
+    if mode == "api":
+        async def ask_model(question, model):
+            # Streamed like app.py, so time to first token can be measured
+            started = time.perf_counter()
+            ttft = None
+            parts = []
+            system_for = target.get("system_for")
+            async with target["client"].messages.stream(
+                model=model,
+                max_tokens=2048,
+                temperature=0.2,
+                system=system_for(question) if system_for else target["system"],
+                messages=[{"role": "user", "content": question}],
+            ) as stream:
+                async for text in stream.text_stream:
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    parts.append(text)
+                message = await stream.get_final_message()
+            return "".join(parts), message, ttft
+
+        async def ask(question):
+            choice = tiers.choose(target.get("tiers"), question)
+            if choice["tier"] is None:
+                answer, message, ttft = await ask_model(question, target["model"])
+                return answer, message.usage, ttft, None
+            answer, message, ttft = await ask_model(question, choice["model"])
+            tier = {"tier": choice["tier"], "model": choice["model"], "escalated": None}
+            if choice["tier"] == "small":
+                status = {"complete": True, "stop_reason": message.stop_reason}
+                tier["escalated"] = tiers.escalation_reason(question, answer, status, target["kb_figures"])
+            if tier["escalated"] is None:
+                return answer, message.usage, ttft, tier
+            # Both calls are paid for, so usage is their sum
+            small_usage = usage_fields(message.usage)
+            answer, message, _ = await ask_model(question, target["model"])
+            usage = {field: small_usage[field] + value for field, value in usage_fields(message.usage).items()}
+            tier["model"] = target["model"]
+            return answer, usage, ttft, tier
+        return ask
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    # One keep-alive pool shared by all workers
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+    session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+
+    def post(question):
+        r = session.post(f"{target}/chat", json={"message": question, "history": []}, timeout=60)
+        if r.status_code in ratelimit.RETRY_STATUSES:
+            raise RetryableStatus(r)
+        data = r.json()
+        return data.get("response", ""), data.get("usage"), None, None
+
+    async def ask(question):
+        return await asyncio.to_thread(post, question)
+    return ask
+
+
+async def run_case(tc, ask, limiter, semaphore, token_estimate, retries):
+    """Ask one question under the concurrency and rate limits, retrying 429/529.
+
+    Latency covers the successful attempt only, not time spent queued,
+    rate-limited or backing off.
+    """
+    async with semaphore:
+        for attempt in range(retries + 1):
+            estimate = token_estimate(tc["question"])
+            await limiter.acquire(estimate)
+            started = time.perf_counter()
+            try:
+                answer, usage, ttft, tier = await ask(tc["question"])
+            except Exception as e:
+                limiter.settle(estimate, 0)
+                retry = ratelimit.retry_status(e)
+                if retry is None or attempt == retries:
+                    raise
+                delay = ratelimit.backoff_delay(attempt, retry_after=retry[1])
+                print(f"  [case {tc['id']}] HTTP {retry[0]}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            latency = time.perf_counter() - started
+            if usage is not None:
+                limiter.settle(estimate, ratelimit.charged_tokens(usage_fields(usage)))
+            return {"answer": answer, "usage": usage, "retries": attempt,
+                    "latency_s": latency, "ttft_s": ttft, "tier": tier}
+
+
+def make_limiter(mode, rpm, tpm, scheduler_db=None):
+    """Rate limiter for a run: the host-wide scheduler budget with
+    scheduler_db (--api only), else a local one for this process."""
+    if scheduler_db and mode == "api":
+        return scheduler.Scheduler(tpm=tpm, rpm=rpm, db_path=scheduler_db).limiter("validate")
+    return ratelimit.RateLimiter(rpm=rpm, tpm=tpm if mode == "api" else 0)
+
+
+async def run_all(target, mode, cases, concurrency, rpm, tpm, retries, cache_stats, record=None,
+                  scheduler_db=None, limiter=None, semaphore=None):
+    """Run the cases concurrently; returns one outcome dict per case, in order.
+
+    record(question, answer, usage, latency_s, ttft_s), if given, is called
+    for every answer received (see --record). With scheduler_db (--api only)
+    the rpm/tpm budget is the host-wide one the chat workers use, and the
+    questions wait behind their users as a background job (scheduler.py).
+    limiter and semaphore, if given, are shared with other concurrent runs
+    (see --matrix) instead of being made for this one.
+    """
+    ask = make_asker(target, mode, concurrency)
+    if limiter is None:
+        limiter = make_limiter(mode, rpm, tpm, scheduler_db)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(concurrency)
+
+    # Until a call reports its usage, assume the whole prompt is uncached;
+    # afterwards use the average tokens actually charged per call.
+    prompt_tokens = estimate_tokens(prompts.system_text(target["system"])) if mode == "api" else 0
+    charged = []
+
+    def token_estimate(question):
+        base = sum(charged) / len(charged) if charged else prompt_tokens
+        return int(base) + estimate_tokens(question)
+
+    async def one(tc):
+        try:
+            outcome = await run_case(tc, ask, limiter, semaphore, token_estimate, retries)
+        except Exception as e:
+            return {"tc": tc, "answer": None, "error": e}
+        outcome["tc"] = tc
+        if outcome["usage"] is not None:
+            outcome["usage"] = cache_stats.record(outcome["usage"])
+            charged.append(ratelimit.charged_tokens(outcome["usage"]))
+        if record:
+            record(tc["question"], outcome["answer"], outcome["usage"], outcome["latency_s"], outcome["ttft_s"])
+        outcome["answer"] = outcome["answer"].lower()
+        return outcome
+
+    outcomes = await asyncio.gather(*(one(tc) for tc in cases))
+    if mode == "api":
+        await target["client"].close()
+    return outcomes, limiter
+
+
+def batch_request(target, tc):
+    """One Message Batches request, with the same parameters as the --api calls."""
+    return {
+        "custom_id": f"case-{tc['id']}",
+        "params": {
+            "model": target["model"],
+            "max_tokens": 2048,
+            "temperature": 0.2,
+            "system": target["system"],
+            "messages": [{"role": "user", "content": tc["question"]}],
+        },
+    }
+
+
+def split_batches(requests, max_requests=BATCH_MAX_REQUESTS, max_bytes=BATCH_MAX_BYTES):
+    """Group batch requests into as few batches as the per-batch limits allow."""
+    batches, size = [[]], 0
+    for req in requests:
+        n = len(json.dumps(req).encode("utf-8")) + 2
+        if batches[-1] and (len(batches[-1]) == max_requests or size + n > max_bytes):
+            batches.append([])
+            size = 0
+        batches[-1].append(req)
+        size += n
+    return batches
+
+
+def wait_for_batch(client, batch_id, poll_s=BATCH_POLL_S):
+    """Poll a batch with growing waits until it has ended; returns the final batch."""
+    delay, growth, longest = poll_s
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        done = counts.succeeded + counts.errored + counts.canceled + counts.expired
+        print(f"  {batch_id}: {batch.processing_status}, {done}/{done + counts.processing} done")
+        if batch.processing_status == "ended":
+            return batch
+        time.sleep(delay)
+        delay = min(delay * growth, longest)
+
+
+def resume_args(batch_ids):
+    """This run's arguments for waiting on batch_ids again (same --calc/--seed)."""
+    args = [a for a in sys.argv[1:] if a != "--batch"]
+    if "--batch-id" in args:
+        del args[args.index("--batch-id"):args.index("--batch-id") + 2]
+    return " ".join(args + ["--batch-id", ",".join(batch_ids)])
+
+
+def run_batch(target, cases, cache_stats, record=None, batch_ids=None):
+    """Run the cases as Message Batches jobs; returns (outcomes in order, batch info).
+
+    The cases go in as few batches as the per-batch limits allow (every
+    request carries the whole prompt, so about 800 fit in one). With
+    batch_ids, waits on (and scores) batches submitted earlier instead of
+    submitting new ones. Results are streamed from each results file into
+    the same outcome dicts run_all() returns; latency is not known per
+    request, so latency_s and ttft_s are None.
+    """
+    from anthropic import NotFoundError
+
+    client = target["client"]
+    if batch_ids is None:
+        batch_ids = []
+        for requests in split_batches([batch_request(target, tc) for tc in cases]):
+            batch_ids.append(client.messages.batches.create(requests=requests).id)
+            print(f"  Submitted {batch_ids[-1]} ({len(requests)} requests)")
+        print(f"  If interrupted, resume with: python validate.py {resume_args(batch_ids)}\n")
+    batches = []
+    try:
+        for batch_id in batch_ids:
+            batches.append(wait_for_batch(client, batch_id))
+    except NotFoundError:
+        print(f"ERROR: No batch {batch_id} (batches and their results are kept for 29 days)")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(f"\n  Stopped waiting; the batches keep running. Resume with: python validate.py {resume_args(batch_ids)}")
+        sys.exit(130)
+
+    by_id = {f"case-{tc['id']}": tc for tc in cases}
+    outcomes = {}
+    for batch_id in batch_ids:
+        for item in client.messages.batches.results(batch_id):
+            tc = by_id.get(item.custom_id)
+            if tc is None:
+                print(f"  Skipping result for unknown {item.custom_id} (cases changed since submitting?)")
+                continue
+            result = item.result
+            if result.type != "succeeded":
+                error = getattr(getattr(result, "error", None), "error", None)
+                detail = f"{error.type}: {error.message}" if error is not None else "no answer"
+                outcomes[tc["id"]] = {"tc": tc, "answer": None, "error": f"batch request {result.type} ({detail})"}
+                continue
+            message = result.message
+            answer = "".join(block.text for block in message.content if block.type == "text")
+            usage = cache_stats.record(message.usage)
+            if record:
+                record(tc["question"], answer, usage, None, None)
+            outcomes[tc["id"]] = {"tc": tc, "answer": answer.lower(), "usage": usage, "retries": 0,
+                                  "latency_s": None, "ttft_s": None, "tier": None}
+
+    created = min(batch.created_at for batch in batches)
+    ended = max(batch.ended_at for batch in batches) if all(batch.ended_at for batch in batches) else None
+    info = {"ids": batch_ids, "created_at": created.isoformat(),
+            "ended_at": ended.isoformat() if ended else None,
+            "processing_s": round((ended - created).total_seconds(), 1) if ended else None}
+    return [outcomes.get(tc["id"]) or {"tc": tc, "answer": None, "error": "no result in the batch"}
+            for tc in cases], info
+
+
+def run_tests(target, mode, concurrency=5, rpm=50, tpm=0, retries=5, record=None, scheduler_db=None,
+              batch_ids=None, cases=TEST_CASES):
+    """Run all test cases and report results (mode "batch": Message Batches jobs).
+
+    For a --calc suite, results are also counted per kind and focus.
+    """
     results = []
     passed = 0
     partial = 0
     failed = 0
+    unrecorded = 0
+    cache_stats = CacheTelemetry()
 
     print(f"\n{'='*70}")
-    print(f"  EXOTEL HR CHATBOT VALIDATION — {len(TEST_CASES)} Questions")
+    print(f"  EXOTEL HR CHATBOT VALIDATION — {len(cases)} Questions")
+    if mode == "batch":
+        print(f"  Message Batches, {100 * BATCH_DISCOUNT:.0f}% of the usual price, no rate limits")
+    else:
+        print(f"  concurrency {concurrency}, {rpm or 'unlimited'} req/min, {tpm or 'unlimited'} tokens/min")
     print(f"{'='*70}\n")
 
-    for tc in TEST_CASES:
-        qnum = tc["id"]
-        question = tc["question"]
-        print(f"  [{qnum:2d}/25] {question[:65]}...")
+    started = time.perf_counter()
+    batch = None
+    if mode == "batch":
+        outcomes, batch = run_batch(target, cases, cache_stats, record=record, batch_ids=batch_ids)
+        waited_s = 0.0
+    else:
+        outcomes, limiter = asyncio.run(run_all(target, mode, cases, concurrency, rpm, tpm, retries,
+                                                cache_stats, record=record, scheduler_db=scheduler_db))
+        waited_s = limiter.waited_s
+    elapsed = time.perf_counter() - started
 
-        try:
-            if mode == "api":
-                resp = target["client"].messages.create(
-                    model=target["model"],
-                    max_tokens=2048,
-                    temperature=0.2,
-                    system=target["system_prompt"],
-                    messages=[{"role": "user", "content": question}],
-                )
-                answer = resp.content[0].text.lower()
-            else:
-                import requests
-                r = requests.post(
-                    f"{target}/chat",
-                    json={"message": question, "history": []},
-                    timeout=60,
-                )
-                answer = r.json().get("response", "").lower()
-
-            # Check expected keywords
-            found = [kw for kw in tc["expected_keywords"] if kw.lower() in answer]
-            missing = [kw for kw in tc["expected_keywords"] if kw.lower() not in answer]
-
-            # Check forbidden keywords
-            forbidden_found = [kw for kw in tc["expected_not"] if kw.lower() in answer]
-
-            if forbidden_found:
-                status = "FAIL"
-                failed += 1
-                reason = f"Contains forbidden: {forbidden_found}"
-            elif len(missing) == 0:
-                status = "PASS"
-                passed += 1
-                reason = ""
-            elif len(found) >= len(tc["expected_keywords"]) / 2:
-                status = "PARTIAL"
-                partial += 1
-                reason = f"Missing: {missing}"
-            else:
-                status = "FAIL"
-                failed += 1
-                reason = f"Missing: {missing}"
-
-            icon = {"PASS": "✅", "PARTIAL": "⚠️", "FAIL": "❌"}[status]
-            print(f"         {icon} {status} {reason}")
+    quiet = len(cases) > QUIET_ABOVE
+    width = len(str(len(cases)))
 
-            results.append({
-                "id": qnum,
-                "question": question,
-                "status": status,
-                "expected": tc["expected_summary"],
-                "missing_keywords": missing,
-                "forbidden_found": forbidden_found,
-                "answer_preview": answer[:200],
-            })
+    def heading():
+        print(f"  [{qnum:{width}d}/{len(cases)}] {question[:65]}...")
 
-            time.sleep(1)  # Rate limiting
+    # Report in test order, whatever order the answers arrived in
+    for outcome in outcomes:
+        tc, answer = outcome["tc"], outcome["answer"]
+        qnum = tc["id"]
+        question = tc["question"]
+        if not quiet:
+            heading()
 
-        except Exception as e:
-            print(f"         ❌ ERROR: {e}")
+        if isinstance(outcome.get("error"), cassette.MissingRecording):
+            if quiet:
+                heading()
+            print("         ⏺ NO RECORDING (re-record with --record)")
+            unrecorded += 1
+            results.append({"id": qnum, "question": question, "status": "UNRECORDED"})
+            continue
+
+        if answer is None:
+            if quiet:
+                heading()
+            print(f"         ❌ ERROR: {outcome['error']}")
             failed += 1
             results.append({
                 "id": qnum, "question": question, "status": "ERROR",
-                "error": str(e)
+                "error": str(outcome["error"])
             })
+            continue
+
+        status, reason, missing, forbidden_found = score_answer(tc, answer)
+        if status == "PASS":
+            passed += 1
+        elif status == "PARTIAL":
+            partial += 1
+        else:
+            failed += 1
+
+        icon = {"PASS": "✅", "PARTIAL": "⚠️", "FAIL": "❌"}[status]
+        if quiet and status != "PASS":
+            heading()
+            print(f"         expected {tc['expected_summary']}")
+        if not quiet or status != "PASS":
+            print(f"         {icon} {status} {reason}")
+
+        results.append({
+            "id": qnum,
+            "question": question,
+            "status": status,
+            "expected": tc["expected_summary"],
+            "missing_keywords": missing,
+            "forbidden_found": forbidden_found,
+            "answer_preview": answer[:200],
+            "usage": outcome["usage"],
+            "retries": outcome["retries"],
+            "latency_s": round(outcome["latency_s"], 3) if outcome["latency_s"] is not None else None,
+            **({"tier": outcome["tier"]} if outcome.get("tier") else {}),
+            **({"kind": tc["kind"], "focus": tc["focus"]} if "focus" in tc else {}),
+        })
 
     # Summary
     print(f"\n{'='*70}")
     print(f"  RESULTS SUMMARY")
     print(f"{'='*70}")
-    print(f"  ✅ PASS:    {passed:2d} / {len(TEST_CASES)}")
-    print(f"  ⚠️  PARTIAL: {partial:2d} / {len(TEST_CASES)}")
-    print(f"  ❌ FAIL:    {failed:2d} / {len(TEST_CASES)}")
-    print(f"  Score:      {passed}/{len(TEST_CASES)} ({100*passed//len(TEST_CASES)}%)")
+    print(f"  ✅ PASS:    {passed:2d} / {len(cases)}")
+    print(f"  ⚠️  PARTIAL: {partial:2d} / {len(cases)}")
+    print(f"  ❌ FAIL:    {failed:2d} / {len(cases)}")
+    if unrecorded:
+        print(f"  ⏺ NO RECORDING: {unrecorded:2d} / {len(cases)}")
+    print(f"  Score:      {passed}/{len(cases)} ({100*passed//len(cases)}%)")
+    if batch:
+        print(f"  Wall time:  {elapsed:.1f}s ({', '.join(batch['ids'])} processed in {batch['processing_s']}s)")
+    else:
+        print(f"  Wall time:  {elapsed:.1f}s ({waited_s:.1f}s waiting on rate limits, "
+              f"{sum(r.get('retries') or 0 for r in results)} retries)")
+    usage_summary = cache_stats.snapshot()
+    if usage_summary["calls"]:
+        print(f"  Prompt cache: {usage_summary['cache_read_input_tokens']:,} read / "
+              f"{usage_summary['cache_creation_input_tokens']:,} written / "
+              f"{usage_summary['input_tokens']:,} uncached input tokens "
+              f"({100*usage_summary['cache_hit_rate']:.1f}% hit rate, "
+              f"{usage_summary['calls_with_cache_read']}/{usage_summary['calls']} calls read from cache)")
+    if batch:
+        sync_cost = sum(estimate_cost(target["model"], r["usage"]) for r in results if r.get("usage"))
+        batch["cost_usd"] = round(sync_cost * BATCH_DISCOUNT, 6)
+        batch["sync_cost_usd"] = round(sync_cost, 6)
+        print(f"  Est. cost:  ${batch['cost_usd']:.4f} (${batch['sync_cost_usd']:.4f} without the batch discount)")
     print(f"{'='*70}\n")
 
+    report = {"summary": {"pass": passed, "partial": partial, "fail": failed, "unrecorded": unrecorded},
+              "usage": usage_summary, "results": results}
+    if batch:
+        report["batch"] = batch
+    if any(r.get("focus") for r in results):
+        report["foci"] = focus_report(results)
+        print_focus_report(report["foci"])
+    if any(r.get("tier") for r in results):
+        report["tiers"] = tier_report(results)
+        print_tier_report(report["tiers"])
+
     # Save results
     out_path = os.path.join(os.path.dirname(__file__), "validation_results.json")
     with open(out_path, "w") as f:
-        json.dump({"summary": {"pass": passed, "partial": partial, "fail": failed},
-                    "results": results}, f, indent=2)
+        json.dump(report, f, indent=2)
     print(f"  Results saved to: {out_path}\n")
 
     return passed, partial, failed
 
 
+def focus_report(results):
+    """Pass counts per generated-case kind and focus (see calc_cases.py)."""
+    foci = {}
+    for r in results:
+        if r.get("focus"):
+            row = foci.setdefault(f"{r['kind']}/{r['focus']}", {"runs": 0, "pass": 0})
+            row["runs"] += 1
+            row["pass"] += r["status"] == "PASS"
+    return dict(sorted(foci.items()))
+
+
+def print_focus_report(report):
+    width = max(len(name) for name in report)
+    print(f"  {'Focus':<{width}} {'n':>5} {'pass':>5} {'acc':>6}")
+    for name, row in report.items():
+        print(f"  {name:<{width}} {row['runs']:>5} {row['pass']:>5} {100 * row['pass'] / row['runs']:>5.0f}%")
+    print()
+
+
+def tier_report(results):
+    """Accuracy and latency per tier: small, large, and small answers re-asked on large."""
+    groups = {}
+    for r in results:
+        if not r.get("tier"):
+            continue
+        tier = r["tier"]
+        name = "small→large" if tier["escalated"] else tier["tier"]
+        groups.setdefault(name, []).append(r)
+    report = {}
+    for name in ("small", "large", "small→large"):
+        rows = groups.get(name, [])
+        if not rows:
+            continue
+        latencies = [r["latency_s"] for r in rows]
+        counts = {status: sum(1 for r in rows if r["status"] == status) for status in ("PASS", "PARTIAL", "FAIL")}
+        report[name] = {
+            "n": len(rows),
+            "pass": counts["PASS"],
+            "partial": counts["PARTIAL"],
+            "fail": counts["FAIL"],
+            "accuracy": round(counts["PASS"] / len(rows), 3),
+            "latency_p50": round(percentile(latencies, 50), 3),
+            "latency_p95": round(percentile(latencies, 95), 3),
+            "ids": [r["id"] for r in rows],
+            "escalations": [r["tier"]["escalated"] for r in rows if r["tier"]["escalated"]],
+        }
+    return report
+
+
+def print_tier_report(report):
+    print(f"  {'Tier':<12} {'n':>3} {'pass':>5} {'part':>5} {'fail':>5} {'acc':>6} {'p50':>7} {'p95':>7}")
+    for name, row in report.items():
+        print(f"  {name:<12} {row['n']:>3} {row['pass']:>5} {row['partial']:>5} {row['fail']:>5} "
+              f"{100 * row['accuracy']:>5.0f}% {row['latency_p50']:>6.2f}s {row['latency_p95']:>6.2f}s")
+    escalations = report.get("small→large", {}).get("escalations", [])
+    for reason in sorted(set(escalations)):
+        print(f"    escalated {escalations.count(reason)}× — {reason}")
+    print()
+
+
+# Overall metrics checked against a baseline in --bench mode (higher = worse)
+BENCH_METRICS = ("latency_p50", "latency_p95", "ttft_p50", "ttft_p95", "mean_output_tokens", "mean_cost_usd")
+
+
+def bench_stats(samples, model):
+    """Latency/TTFT percentiles, mean token usage and cost over a list of outcomes."""
+    ok = [o for o in samples if o["answer"] is not None]
+    stats = {
+        "runs": len(samples),
+        "errors": len(samples) - len(ok),
+        "passes": sum(1 for o in ok if score_answer(o["tc"], o["answer"])[0] == "PASS"),
+    }
+    timings = {
+        "latency": [o["latency_s"] for o in ok],
+        "ttft": [o["ttft_s"] for o in ok if o["ttft_s"] is not None],
+    }
+    for name, values in timings.items():
+        for pct in (50, 95, 99):
+            value = percentile(values, pct)
+            stats[f"{name}_p{pct}"] = round(value, 4) if value is not None else None
+
+    usages = [o["usage"] for o in ok if o["usage"] is not None]
+    costs = [estimate_cost(model, u) for u in usages]
+    for field in USAGE_FIELDS:
+        stats[f"mean_{field}"] = round(sum(u[field] for u in usages) / len(usages), 1) if usages else None
+    stats["mean_cost_usd"] = round(sum(costs) / len(costs), 6) if costs else None
+    stats["cost_usd"] = round(sum(costs), 6)
+    return stats
+
+
+def compare_bench(current, baseline, threshold):
+    """Overall metrics that regressed by more than threshold (a fraction) vs. baseline."""
+    regressions = []
+    for metric in BENCH_METRICS:
+        old, new = baseline["overall"].get(metric), current["overall"].get(metric)
+        if old and new is not None and new > old * (1 + threshold):
+            regressions.append((metric, old, new))
+    if current["overall"]["errors"] > baseline["overall"].get("errors", 0):
+        regressions.append(("errors", baseline["overall"].get("errors", 0), current["overall"]["errors"]))
+    return regressions
+
+
+def run_bench(target, mode, repeats, model, out_path, baseline_path=None, threshold=0.2,
+              concurrency=5, rpm=50, tpm=0, retries=5, record=None, scheduler_db=None):
+    """Run every test case `repeats` times and report latency, tokens and cost.
+
+    Returns the process exit code: 1 if a baseline was given and any
+    overall metric regressed by more than threshold, else 0.
+    """
+    cases = [tc for _ in range(repeats) for tc in TEST_CASES]
+    print(f"\n{'='*70}")
+    print(f"  EXOTEL HR CHATBOT BENCHMARK — {len(TEST_CASES)} questions × {repeats}")
+    print(f"{'='*70}\n")
+
+    started = time.perf_counter()
+    outcomes, limiter = asyncio.run(run_all(target, mode, cases, concurrency, rpm, tpm, retries, CacheTelemetry(),
+                                            record=record, scheduler_db=scheduler_db))
+    elapsed = time.perf_counter() - started
+
+    def secs(value, width=6):
+        return f"{value:{width}.2f}" if value is not None else "—".rjust(width)
+
+    print(f"  {'#':>3}  {'p50':>6} {'p95':>6} {'p99':>6}  {'ttft50':>6} {'ttft95':>6}  "
+          f"{'in':>7} {'out':>6} {'cached':>7}  {'$/call':>8}  pass")
+    per_case = {}
+    for tc in TEST_CASES:
+        stats = bench_stats([o for o in outcomes if o["tc"] is tc], model)
+        per_case[str(tc["id"])] = stats
+        in_tokens = (stats["mean_input_tokens"] or 0) + (stats["mean_cache_creation_input_tokens"] or 0)
+        print(f"  {tc['id']:>3}  {secs(stats['latency_p50'])} {secs(stats['latency_p95'])} "
+              f"{secs(stats['latency_p99'])}  {secs(stats['ttft_p50'])} {secs(stats['ttft_p95'])}  "
+              f"{in_tokens:>7.0f} {stats['mean_output_tokens'] or 0:>6.0f} "
+              f"{stats['mean_cache_read_input_tokens'] or 0:>7.0f}  "
+              f"{stats['mean_cost_usd'] or 0:>8.4f}  {stats['passes']}/{stats['runs']}")
+
+    overall = bench_stats(outcomes, model)
+    print(f"\n  Overall: latency p50/p95/p99 {secs(overall['latency_p50'], 0)}/{secs(overall['latency_p95'], 0)}/"
+          f"{secs(overall['latency_p99'], 0)}s, first token p50/p95 {secs(overall['ttft_p50'], 0)}/"
+          f"{secs(overall['ttft_p95'], 0)}s")
+    print(f"  {len(outcomes)} calls in {elapsed:.1f}s ({len(outcomes) / elapsed:.2f}/s), "
+          f"{overall['errors']} errors, {overall['passes']} passes, est. cost ${overall['cost_usd']:.4f}, "
+          f"{limiter.waited_s:.1f}s waiting on rate limits")
+
+    report = {
+        "model": model,
+        "mode": mode,
+        "repeats": repeats,
+        "concurrency": concurrency,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "wall_s": round(elapsed, 3),
+        "throughput_rps": round(len(outcomes) / elapsed, 3),
+        "overall": overall,
+        "cases": per_case,
+    }
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"  Results saved to: {out_path}")
+
+    exit_code = 0
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare_bench(report, baseline, threshold)
+        print(f"\n  Baseline {baseline_path} ({baseline.get('model')}, {baseline.get('timestamp')}):")
+        for metric, old, new in regressions:
+            print(f"    ❌ {metric}: {old} → {new} (+{100 * (new - old) / old if old else 100:.0f}%)")
+        if regressions:
+            print(f"  REGRESSION beyond {100 * threshold:.0f}% threshold")
+            exit_code = 1
+        else:
+            print(f"    ✅ within {100 * threshold:.0f}% on {', '.join(BENCH_METRICS)}")
+    print(f"{'='*70}\n")
+    return exit_code
+
+
+def variant_system(variant, kb_path=KB_PATH, top_k=8):
+    """(system blocks, question -> system blocks or None) for a --matrix prompt variant.
+
+    "full" is the compiled artifact app.py sends, "compact" the same rules
+    over compact_kb.compact() of the KB, and "retrieval" the rules plus the
+    top_k sections (and any band's table rows) for each question, as
+    KB_MODE=retrieval sends them. The retrieval blocks returned first
+    (rules only) seed the token estimate.
+    """
+    prompt = load_artifact(kb_path=kb_path)
+    if variant == "full":
+        return prompt.system_blocks(), None
+    if variant == "compact":
+        return prompts.system_blocks(compact_kb.compact(prompt.kb_text)[0]), None
+    if variant == "retrieval":
+        index = load_index(kb_path, prompt.kb_text)
+        router = load_router(kb_path, prompt.kb_text)
+        tables = load_tables(kb_path, prompt.kb_text)
+
+        def system_for(question):
+            query = router.expand(question)
+            return prompt.retrieval_blocks(with_band_rows(index.context_for(query, top_k), tables, query))
+        return prompt.retrieval_blocks(""), system_for
+    raise ValueError(f"Unknown prompt variant {variant!r} (use {', '.join(PROMPT_VARIANTS)})")
+
+
+def matrix_cell(model, variant, outcomes):
+    """Scores, latency, tokens and cost of one model × variant cell."""
+    counts = {"PASS": 0, "PARTIAL": 0, "FAIL": 0}
+    statuses = {}
+    for o in outcomes:
+        status = score_answer(o["tc"], o["answer"])[0] if o["answer"] is not None else "ERROR"
+        counts[status] = counts.get(status, 0) + 1
+        statuses[str(o["tc"]["id"])] = status
+    stats = bench_stats(outcomes, model)
+    return {
+        "model": model,
+        "variant": variant,
+        "pass": counts["PASS"],
+        "partial": counts["PARTIAL"],
+        "fail": counts["FAIL"],
+        "errors": stats["errors"],
+        "accuracy": round(counts["PASS"] / len(outcomes), 3),
+        **{key: stats[key] for key in ("latency_p50", "latency_p95", "ttft_p50", "ttft_p95",
+                                       "mean_cost_usd", "cost_usd")},
+        **{f"mean_{field}": stats[f"mean_{field}"] for field in USAGE_FIELDS},
+        "statuses": statuses,
+    }
+
+
+def run_matrix(api_key, models, variants, out_path, accuracy_bar=0.9, kb_path=KB_PATH, top_k=8,
+               concurrency=5, rpm=50, tpm=0, retries=5, scheduler_db=None, cases=TEST_CASES):
+    """Run every question for every model × prompt variant, concurrently, and compare.
+
+    All cells share one concurrency limit; each model has its own rpm/tpm
+    budget (the API limits models separately), shared by its variants, or
+    all share the host-wide one with scheduler_db. Returns the exit code:
+    1 if no cell passes at least accuracy_bar of the questions, else 0.
+    """
+    from anthropic import AsyncAnthropic
+
+    systems = {variant: variant_system(variant, kb_path, top_k) for variant in variants}
+    cells = [(model, variant) for model in models for variant in variants]
+    print(f"\n{'='*70}")
+    print(f"  EXOTEL HR CHATBOT MATRIX — {len(models)} models × {len(variants)} prompts × {len(cases)} questions")
+    print(f"  concurrency {concurrency}, {rpm or 'unlimited'} req/min, {tpm or 'unlimited'} tokens/min per model")
+    print(f"{'='*70}\n")
+
+    async def run_cells():
+        semaphore = asyncio.Semaphore(concurrency)
+        shared = make_limiter("api", rpm, tpm, scheduler_db) if scheduler_db else None
+        limiters = {model: shared or make_limiter("api", rpm, tpm) for model in models}
+
+        async def cell(model, variant):
+            system, system_for = systems[variant]
+            target = {"client": AsyncAnthropic(api_key=api_key, max_retries=0), "model": model,
+                      "system": system, "system_for": system_for, "tiers": None, "kb_figures": None}
+            outcomes, _ = await run_all(target, "api", cases, concurrency, rpm, tpm, retries, CacheTelemetry(),
+                                        limiter=limiters[model], semaphore=semaphore)
+            return outcomes
+        return await asyncio.gather(*(cell(model, variant) for model, variant in cells)), limiters
+
+    started = time.perf_counter()
+    results, limiters = asyncio.run(run_cells())
+    elapsed = time.perf_counter() - started
+    rows = [matrix_cell(model, variant, outcomes) for (model, variant), outcomes in zip(cells, results)]
+
+    def secs(value):
+        return f"{value:6.2f}" if value is not None else "—".rjust(6)
+
+    width = max(len(model) for model in models)
+    print(f"  {'model':<{width}} {'prompt':<9} {'pass':>4} {'part':>4} {'fail':>4} {'err':>3}  {'p50':>6} {'p95':>6} "
+          f"{'ttft50':>6}  {'in':>7} {'cached':>7} {'out':>5}  {'$/call':>8} {'$ total':>8}")
+    for row in rows:
+        in_tokens = (row["mean_input_tokens"] or 0) + (row["mean_cache_creation_input_tokens"] or 0)
+        print(f"  {row['model']:<{width}} {row['variant']:<9} {row['pass']:>4} {row['partial']:>4} {row['fail']:>4} "
+              f"{row['errors']:>3}  {secs(row['latency_p50'])} {secs(row['latency_p95'])} {secs(row['ttft_p50'])}  "
+              f"{in_tokens:>7.0f} {row['mean_cache_read_input_tokens'] or 0:>7.0f} "
+              f"{row['mean_output_tokens'] or 0:>5.0f}  {row['mean_cost_usd'] or 0:>8.4f} {row['cost_usd']:>8.4f}")
+
+    eligible = [row for row in rows if row["accuracy"] >= accuracy_bar]
+    best = min(eligible, key=lambda row: row["cost_usd"]) if eligible else None
+    waited = sum(limiter.waited_s for limiter in set(limiters.values()))
+    print(f"\n  {len(cells) * len(cases)} calls in {elapsed:.1f}s, {waited:.1f}s waiting on rate limits, "
+          f"est. cost ${sum(row['cost_usd'] for row in rows):.4f}")
+    if best:
+        print(f"  ✅ Cheapest at ≥{100 * accuracy_bar:.0f}% pass: {best['model']} × {best['variant']} "
+              f"({best['pass']}/{len(cases)}, ${best['mean_cost_usd'] or 0:.4f}/call)")
+    else:
+        print(f"  ❌ No configuration passes ≥{100 * accuracy_bar:.0f}% of the questions")
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "models": models,
+        "variants": variants,
+        "top_k": top_k,
+        "accuracy_bar": accuracy_bar,
+        "questions": len(cases),
+        "concurrency": concurrency,
+        "wall_s": round(elapsed, 3),
+        "best": {"model": best["model"], "variant": best["variant"]} if best else None,
+        "cells": rows,
+    }
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"  Report saved to: {out_path}")
+    print(f"{'='*70}\n")
+    return 0 if best else 1
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Validate Exotel HR Chatbot")
     parser.add_argument("--url", help="Deployed Replit service URL (tests via HTTP)")
@@ -341,20 +1036,149 @@ if __name__ == "__main__":
                         help="Test directly via Anthropic Claude API")
     parser.add_argument("--model", default="claude-sonnet-4-5-20250929",
                         help="Claude model name (default: claude-sonnet-4-5-20250929)")
+    parser.add_argument("--concurrency", type=int, default=5,
+                        help="Questions in flight at once (default: 5)")
+    parser.add_argument("--rpm", type=int, default=50,
+                        help="Requests-per-minute quota, 0 for unlimited (default: 50)")
+    parser.add_argument("--tpm", type=int, default=0,
+                        help="Input-tokens-per-minute quota for --api, 0 for unlimited (default: 0)")
+    parser.add_argument("--scheduler-db", default=os.environ.get("SCHEDULER_DB") or None,
+                        help="Share this host-wide scheduler budget with the chat workers, queued behind "
+                             "them (--api; give --tpm/--rpm their TPM_LIMIT/RPM_LIMIT; default: $SCHEDULER_DB)")
+    parser.add_argument("--retries", type=int, default=5,
+                        help="Retries per question on HTTP 429/529 (default: 5)")
+    parser.add_argument("--bench", type=int, metavar="R",
+                        help="Benchmark: run every question R times and report latency, tokens and cost")
+    parser.add_argument("--bench-out", default=os.path.join(os.path.dirname(__file__), "bench_results.json"),
+                        help="Where --bench writes its JSON report (default: bench_results.json)")
+    parser.add_argument("--baseline", help="Earlier --bench report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed regression vs. --baseline as a fraction (default: 0.2 = 20%%)")
+    parser.add_argument("--record", metavar="CASSETTE",
+                        help="Save every answer to this cassette (.json.gz) for later --replay")
+    parser.add_argument("--replay", metavar="CASSETTE",
+                        help="Rescore answers from a cassette instead of calling the model")
+    parser.add_argument("--kb", default=KB_PATH,
+                        help="Knowledge base to build the system prompt from for --api/--replay "
+                             "(default: knowledge_base.md)")
+    parser.add_argument("--tiers", action="store_true",
+                        help="Route each question to a model tier like app.py with SMALL_MODEL set (--api only)")
+    parser.add_argument("--small-model", default=os.environ.get("SMALL_MODEL", "claude-haiku-4-5-20251001"),
+                        help="Small-tier model for --tiers (default: $SMALL_MODEL or claude-haiku-4-5-20251001)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit every question as Message Batches jobs (--api; half price, "
+                             "results can take up to 24h; split to fit the per-batch limits)")
+    parser.add_argument("--batch-id", metavar="ID[,ID...]",
+                        help="Resume waiting on (and score) the batches submitted by an earlier --batch run")
+    parser.add_argument("--matrix", action="store_true",
+                        help="Compare every --models × --variants cell in one concurrent run (--api)")
+    parser.add_argument("--models",
+                        help="Comma-separated models for --matrix (default: --model)")
+    parser.add_argument("--variants", default=",".join(PROMPT_VARIANTS),
+                        help=f"Comma-separated prompt variants for --matrix (default: {','.join(PROMPT_VARIANTS)})")
+    parser.add_argument("--top-k", type=int, default=int(os.environ.get("RETRIEVAL_TOP_K", "8")),
+                        help="KB sections per question for the retrieval variant (default: $RETRIEVAL_TOP_K or 8)")
+    parser.add_argument("--accuracy-bar", type=float, default=0.9,
+                        help="Fraction of questions a --matrix cell must pass to be recommended (default: 0.9)")
+    parser.add_argument("--matrix-out", default=os.path.join(os.path.dirname(__file__), "matrix_results.json"),
+                        help="Where --matrix writes its JSON report (default: matrix_results.json)")
+    parser.add_argument("--calc", type=int, metavar="N",
+                        help="Ask N calculations generated from the policy rules (calc_cases.py) "
+                             "instead of the 25 questions")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="--calc: seed; the same seed gives the same cases (default: 0)")
+    parser.add_argument("--tier-routes", default=os.environ.get("TIER_ROUTES", tiers.DEFAULT_ROUTES),
+                        help=f"Category→tier table for --tiers (default: {tiers.DEFAULT_ROUTES})")
     args = parser.parse_args()
+    if not os.path.exists(args.kb):
+        print(f"ERROR: Knowledge base not found: {args.kb}")
+        sys.exit(1)
 
-    if args.url:
+    if args.replay:
+        if not os.path.exists(args.replay):
+            print(f"ERROR: Cassette not found: {args.replay}")
+            sys.exit(1)
+        target, mode = test_with_cassette(args.replay, args.model, args.kb)
+    elif args.url:
         target, mode = test_with_url(args.url)
     elif args.api:
         api_key = os.environ.get("ANTHROPIC_API_KEY", "")
         if not api_key:
             print("ERROR: Set ANTHROPIC_API_KEY environment variable")
             sys.exit(1)
-        target, mode = test_with_claude_api(api_key, args.model)
+        try:
+            tier_config = tiers.load_tiers(args.small_model, args.model, args.tier_routes) if args.tiers else None
+        except ValueError as e:
+            print(f"ERROR: --tier-routes: {e}")
+            sys.exit(1)
+        if args.matrix:
+            target, mode = None, "matrix"
+        elif args.batch or args.batch_id:
+            target, mode = test_with_batches(api_key, args.model, args.kb)
+        else:
+            target, mode = test_with_claude_api(api_key, args.model, args.kb, tier_config)
     else:
         print("ERROR: Provide --url (deployed service) or --api (direct Claude API)")
         print("  Example: python validate.py --api")
         print("  Example: python validate.py --url https://your-app.replit.app")
         sys.exit(1)
 
-    run_tests(target, mode)
+    if args.tiers and (mode != "api" or args.record):
+        print("ERROR: --tiers needs --api and no --record (cassettes are keyed by a single model)")
+        sys.exit(1)
+    if (args.batch or args.batch_id) and (mode != "batch" or args.bench):
+        print("ERROR: --batch/--batch-id need --api and no --tiers or --bench")
+        sys.exit(1)
+    if args.matrix:
+        variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+        models = [m.strip() for m in (args.models or args.model).split(",") if m.strip()]
+        unknown = [v for v in variants if v not in PROMPT_VARIANTS]
+        if mode != "matrix" or args.bench or args.record or args.batch or args.batch_id:
+            print("ERROR: --matrix needs --api and no --tiers, --batch, --bench or --record")
+            sys.exit(1)
+        if unknown or not variants or not models:
+            print(f"ERROR: --variants: use some of {', '.join(PROMPT_VARIANTS)}; --models: at least one")
+            sys.exit(1)
+
+    cases = TEST_CASES
+    if args.calc is not None:
+        if args.calc < 1 or args.bench:
+            print("ERROR: --calc needs at least 1 case, and no --bench")
+            sys.exit(1)
+        cases = calc_cases.generate(load_rules(args.kb), args.calc, args.seed)
+
+    limits = {"concurrency": args.concurrency, "rpm": args.rpm, "tpm": args.tpm, "retries": args.retries,
+              "scheduler_db": args.scheduler_db}
+    if mode == "replay":
+        limits.update(rpm=0, tpm=0)
+    if mode == "batch":
+        limits["batch_ids"] = [b.strip() for b in args.batch_id.split(",") if b.strip()] if args.batch_id else None
+
+    tape = None
+    if args.record:
+        # The URL service's prompt is assumed to be this checkout's
+        tape = cassette.Cassette(args.record)
+        prompt_hash = cassette.prompt_hash(target["system"] if mode in ("api", "batch")
+                                           else load_system_prompt(args.kb))
+
+        def record(question, answer, usage, latency_s, ttft_s):
+            tape.put(args.model, prompt_hash, question, answer, usage=usage,
+                     latency_s=round(latency_s, 3) if latency_s is not None else None,
+                     ttft_s=round(ttft_s, 3) if ttft_s is not None else None)
+        limits["record"] = record
+
+    if args.matrix:
+        exit_code = run_matrix(api_key, models, variants, args.matrix_out, accuracy_bar=args.accuracy_bar,
+                               kb_path=args.kb, top_k=args.top_k, concurrency=args.concurrency, rpm=args.rpm,
+                               tpm=args.tpm, retries=args.retries, scheduler_db=args.scheduler_db,
+                               cases=cases)
+    elif args.bench:
+        exit_code = run_bench(target, mode, args.bench, args.model, args.bench_out,
+                              baseline_path=args.baseline, threshold=args.threshold, **limits)
+    else:
+        run_tests(target, mode, cases=cases, **limits)
+        exit_code = 0
+    if tape:
+        tape.save()
+        print(f"  Recorded {len(tape.entries)} answers to: {args.record}\n")
+    sys.exit(exit_code)